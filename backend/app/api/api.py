@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from backend.app.api.endpoints import auth, users, ip_pools, ip_allocations, vps
+from backend.app.api.endpoints import auth, users, ip_pools, ip_allocations, vps, jobs, proxmox
 
 api_router = APIRouter()
 
@@ -17,4 +17,10 @@ api_router.include_router(ip_pools.router, prefix="/ip-pools", tags=["IP池管
 api_router.include_router(ip_allocations.router, prefix="/ip-allocations", tags=["IP分配管理"])
 
 # VPS管理路由
-api_router.include_router(vps.router, prefix="/vps", tags=["VPS管理"]) 
\ No newline at end of file
+api_router.include_router(vps.router, prefix="/vps", tags=["VPS管理"])
+
+# 后台任务路由
+api_router.include_router(jobs.router, prefix="/jobs", tags=["后台任务"])
+
+# Proxmox集成路由
+api_router.include_router(proxmox.router, prefix="/proxmox", tags=["Proxmox"])
@@ -1,13 +1,16 @@
 from typing import Any, List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, UploadFile, File
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from backend.app.core.database import get_db
 from backend.app.core.security import get_current_user, validate_admin_role, validate_operator_role
 from backend.app.services.ip_manager import IPManagerService
+from backend.app.services.ip_bulk import IPBulkService, EXPORT_FORMATS
 from backend.app.api.schemas.ip import (
     IPAllocation, IPAllocationCreate, IPAllocationUpdate,
-    IPReservationCreate
+    IPReservationCreate, IPBulkClaimRequest, IPBulkReleaseRequest, IPBulkResult,
+    IPImportResult
 )
 from backend.app.models.user import User
 
@@ -16,20 +19,81 @@ router = APIRouter()
 @router.get("/", response_model=List[IPAllocation])
 def read_ip_allocations(
     db: Session = Depends(get_db),
-    status: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
     ip_pool_id: Optional[int] = None,
+    cidr: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
     current_user: User = Depends(validate_operator_role)
 ) -> Any:
     """
-    获取IP分配列表（需要操作员权限）
+    获取IP分配列表，按地址数值排序（需要操作员权限）
+    
+    cidr 参数按网段筛选，例如 ?cidr=10.0.4.0/22
     """
-    ip_allocations = IPManagerService.get_ip_allocations(
-        db, ip_pool_id=ip_pool_id, status=status, skip=skip, limit=limit
-    )
+    try:
+        ip_allocations = IPManagerService.get_ip_allocations(
+            db, ip_pool_id=ip_pool_id, status=status_filter, cidr=cidr, skip=skip, limit=limit
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
     return ip_allocations
 
+@router.get("/export")
+def export_ip_allocations(
+    db: Session = Depends(get_db),
+    fmt: str = Query("ndjson", alias="format"),
+    status_filter: Optional[str] = Query(None, alias="status"),
+    ip_pool_id: Optional[int] = None,
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    流式导出IP分配记录（需要操作员权限）
+    
+    format 可选 ndjson 或 csv，数据通过服务器端游标逐批输出
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"格式必须是以下之一: {', '.join(EXPORT_FORMATS)}"
+        )
+    
+    rows = IPBulkService.export_ip_allocations(db, ip_pool_id=ip_pool_id, status=status_filter, fmt=fmt)
+    return StreamingResponse(
+        rows,
+        media_type="text/csv" if fmt == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename=ip_allocations.{fmt}"}
+    )
+
+@router.post("/import", response_model=IPImportResult)
+def import_ip_allocations(
+    *,
+    db: Session = Depends(get_db),
+    file: UploadFile = File(...),
+    fmt: Optional[str] = Query(None, alias="format"),
+    current_user: User = Depends(validate_admin_role)
+) -> Any:
+    """
+    批量导入IP分配记录（需要管理员权限）
+    
+    接受 /ip-allocations/export 导出的 NDJSON 或 CSV 文件，按批次校验并写入，
+    已存在的地址更新状态和附加信息。未指定 format 时按文件扩展名判断。
+    """
+    if fmt is None:
+        fmt = "csv" if (file.filename or "").lower().endswith(".csv") else "ndjson"
+    
+    try:
+        records = IPBulkService.read_import_records(file.file, fmt)
+        return IPBulkService.import_ip_allocations(db, records)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @router.post("/allocate", response_model=IPAllocation)
 def allocate_ip(
     *,
@@ -97,6 +161,84 @@ def release_ip(
             detail=str(e)
         )
 
+@router.post("/bulk/allocate", response_model=IPBulkResult)
+def bulk_allocate_ips(
+    *,
+    db: Session = Depends(get_db),
+    bulk_in: IPBulkClaimRequest,
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    批量分配IP地址（需要操作员权限）
+    
+    指定 ip_addresses 或 start_ip/end_ip 时逐项返回结果；
+    指定 ip_pool_id 和 count 时从IP池中顺序取出地址，可用地址不足则整体失败
+    """
+    return _bulk_claim(db, bulk_in, "allocated")
+
+@router.post("/bulk/reserve", response_model=IPBulkResult)
+def bulk_reserve_ips(
+    *,
+    db: Session = Depends(get_db),
+    bulk_in: IPBulkClaimRequest,
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    批量保留IP地址（需要操作员权限）
+    """
+    return _bulk_claim(db, bulk_in, "reserved")
+
+@router.post("/bulk/release", response_model=IPBulkResult)
+def bulk_release_ips(
+    *,
+    db: Session = Depends(get_db),
+    bulk_in: IPBulkReleaseRequest,
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    批量释放IP地址（需要操作员权限）
+    """
+    try:
+        ip_addresses = IPBulkService.expand_targets(bulk_in.ip_addresses, bulk_in.start_ip, bulk_in.end_ip)
+        items = IPBulkService.bulk_release(db, ip_addresses)
+        return IPBulkService.summarize(items)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+def _bulk_claim(db: Session, bulk_in: IPBulkClaimRequest, claim_status: str) -> dict:
+    try:
+        if bulk_in.count:
+            if not bulk_in.ip_pool_id:
+                raise Exception("按数量分配时必须指定 ip_pool_id")
+            items = IPBulkService.bulk_claim_next(
+                db,
+                ip_pool_id=bulk_in.ip_pool_id,
+                count=bulk_in.count,
+                status=claim_status,
+                user_id=bulk_in.user_id,
+                hostname=bulk_in.hostname,
+                notes=bulk_in.notes
+            )
+        else:
+            ip_addresses = IPBulkService.expand_targets(bulk_in.ip_addresses, bulk_in.start_ip, bulk_in.end_ip)
+            items = IPBulkService.bulk_claim(
+                db,
+                ip_addresses,
+                status=claim_status,
+                user_id=bulk_in.user_id,
+                hostname=bulk_in.hostname,
+                notes=bulk_in.notes
+            )
+        return IPBulkService.summarize(items)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
 @router.get("/{ip_address}", response_model=IPAllocation)
 def read_ip_allocation(
     ip_address: str,
@@ -1,15 +1,20 @@
 from typing import Any, List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
 from backend.app.core.database import get_db
 from backend.app.core.security import validate_admin_role, validate_operator_role
 from backend.app.services.ip_manager import IPManagerService
+from backend.app.services.ip_bulk import IPBulkService, EXPORT_FORMATS
+from backend.app.services.job import job_worker_pool
 from backend.app.api.schemas.ip import (
     IPPool, IPPoolCreate, IPPoolUpdate,
     IPAllocation, IPAllocationCreate, IPAllocationUpdate,
-    IPReservationCreate, IPUsageStats
+    IPReservationCreate, IPUsageStats, IPPoolUsageStats,
+    IPBlockAllocateRequest, IPPoolFragmentation
 )
+from backend.app.api.schemas.job import Job
 
 router = APIRouter()
 
@@ -44,10 +49,94 @@ def create_ip_pool(
         subnet_mask=ip_pool_in.subnet_mask,
         dns_servers=ip_pool_in.dns_servers,
         vlan_id=ip_pool_in.vlan_id,
-        notes=ip_pool_in.notes
+        notes=ip_pool_in.notes,
+        allocation_mode=ip_pool_in.allocation_mode
     )
     return ip_pool
 
+@router.get("/stats", response_model=List[IPPoolUsageStats])
+def get_all_ip_usage_stats(
+    db: Session = Depends(get_db),
+    current_user = Depends(validate_operator_role)
+) -> Any:
+    """
+    获取所有IP池的使用统计（需要操作员权限）
+    """
+    return IPManagerService.get_all_ip_usage_statistics(db)
+
+@router.post("/stats/rebuild")
+def rebuild_ip_usage_stats(
+    db: Session = Depends(get_db),
+    ip_pool_id: Optional[int] = None,
+    current_user = Depends(validate_admin_role)
+) -> Any:
+    """
+    重新计算IP池使用计数器（需要管理员权限）
+    """
+    try:
+        pool_count = IPManagerService.rebuild_ip_usage_counters(db, ip_pool_id=ip_pool_id)
+        return {"status": "success", "ip_pools": pool_count}
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.get("/fragmentation", response_model=List[IPPoolFragmentation])
+def get_fragmentation_report(
+    db: Session = Depends(get_db),
+    ip_pool_id: Optional[int] = None,
+    current_user = Depends(validate_operator_role)
+) -> Any:
+    """
+    获取IPv4池空闲地址的碎片情况（需要操作员权限）
+    """
+    return IPManagerService.get_fragmentation_report(db, ip_pool_id=ip_pool_id)
+
+@router.get("/export")
+def export_ip_pools(
+    db: Session = Depends(get_db),
+    fmt: str = Query("ndjson", alias="format"),
+    current_user = Depends(validate_operator_role)
+) -> Any:
+    """
+    流式导出IP池（需要操作员权限），format 可选 ndjson 或 csv
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"格式必须是以下之一: {', '.join(EXPORT_FORMATS)}"
+        )
+    
+    return StreamingResponse(
+        IPBulkService.export_ip_pools(db, fmt=fmt),
+        media_type="text/csv" if fmt == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename=ip_pools.{fmt}"}
+    )
+
+@router.get("/lookup", response_model=IPPool)
+def lookup_ip_pool(
+    ip_address: str,
+    db: Session = Depends(get_db),
+    current_user = Depends(validate_operator_role)
+) -> Any:
+    """
+    查找包含指定IP地址的IP池（需要操作员权限）
+    """
+    try:
+        ip_pool = IPManagerService.get_ip_pool_by_ip(db, ip_address=ip_address)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的IP地址"
+        )
+    if not ip_pool:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"没有包含 {ip_address} 的IP池"
+        )
+    return ip_pool
+
 @router.get("/{ip_pool_id}", response_model=IPPool)
 def read_ip_pool(
     ip_pool_id: int,
@@ -83,11 +172,25 @@ def update_ip_pool(
             detail="IP池不存在"
         )
     
+    # 网络范围或网关变化时在线调整空闲区间，只处理差异部分
+    if ip_pool_in.network is not None or ip_pool_in.subnet_mask is not None or ip_pool_in.gateway is not None:
+        try:
+            ip_pool = IPManagerService.resize_ip_pool(
+                db,
+                ip_pool_id=ip_pool_id,
+                network=ip_pool_in.network,
+                subnet_mask=ip_pool_in.subnet_mask,
+                gateway=ip_pool_in.gateway
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(e)
+            )
+    
     # 更新字段
     if ip_pool_in.name is not None:
         ip_pool.name = ip_pool_in.name
-    if ip_pool_in.gateway is not None:
-        ip_pool.gateway = ip_pool_in.gateway
     if ip_pool_in.dns_servers is not None:
         ip_pool.dns_servers = ip_pool_in.dns_servers
     if ip_pool_in.vlan_id is not None:
@@ -142,4 +245,80 @@ def get_ip_usage_stats(
         )
     
     stats = IPManagerService.get_ip_usage_statistics(db, ip_pool_id=ip_pool_id)
-    return stats 
\ No newline at end of file
+    return stats 
+
+@router.post("/{ip_pool_id}/blocks", response_model=List[IPAllocation])
+def allocate_ip_block(
+    *,
+    db: Session = Depends(get_db),
+    ip_pool_id: int,
+    block_in: IPBlockAllocateRequest,
+    current_user = Depends(validate_operator_role)
+) -> Any:
+    """
+    在IP池中分配一段连续地址（需要操作员权限）
+    
+    prefix_length 分配按边界对齐的子网（例如 29 表示一个 /29），size 分配任意 N 个连续地址
+    """
+    ip_pool = IPManagerService.get_ip_pool_by_id(db, ip_pool_id=ip_pool_id)
+    if not ip_pool:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="IP池不存在"
+        )
+    
+    try:
+        if block_in.prefix_length is not None:
+            host_bits = (32 if ip_pool.ip_version == 4 else 128) - block_in.prefix_length
+            if host_bits < 0:
+                raise Exception("无效的前缀长度")
+            size, aligned = 1 << host_bits, True
+        elif block_in.size:
+            size, aligned = block_in.size, False
+        else:
+            raise Exception("必须指定 size 或 prefix_length")
+        
+        ip_allocations = IPManagerService.allocate_block(
+            db,
+            ip_pool_id=ip_pool_id,
+            size=size,
+            aligned=aligned,
+            status=block_in.status,
+            user_id=block_in.user_id,
+            hostname=block_in.hostname,
+            notes=block_in.notes
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    
+    if not ip_allocations:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="IP池中没有足够的连续空闲地址"
+        )
+    return ip_allocations
+
+@router.post("/{ip_pool_id}/rebuild-ranges", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+def rebuild_free_ranges(
+    ip_pool_id: int,
+    db: Session = Depends(get_db),
+    current_user = Depends(validate_admin_role)
+) -> Any:
+    """
+    重建IP池的空闲地址区间（异步任务，需要管理员权限）
+    
+    用于将旧版逐地址存储的IP池转换为区间存储，进度可通过 /jobs/{job_id} 查询。
+    """
+    ip_pool = IPManagerService.get_ip_pool_by_id(db, ip_pool_id=ip_pool_id)
+    if not ip_pool:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="IP池不存在"
+        )
+    
+    return job_worker_pool.submit(
+        db, job_type="ip_pool_rebuild", target_id=ip_pool_id, user_id=current_user.id
+    )
@@ -0,0 +1,84 @@
+import asyncio
+from typing import Any, AsyncIterator, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+
+from backend.app.core.database import get_db, SessionLocal
+from backend.app.core.security import validate_operator_role
+from backend.app.services.job import JobService
+from backend.app.api.schemas.job import Job
+from backend.app.models.user import User
+
+router = APIRouter()
+
+@router.get("/", response_model=List[Job])
+def read_jobs(
+    db: Session = Depends(get_db),
+    job_type: Optional[str] = None,
+    job_status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    获取后台任务列表（需要操作员权限）
+    """
+    return JobService.get_jobs(db, job_type=job_type, status=job_status, skip=skip, limit=limit)
+
+@router.get("/{job_id}", response_model=Job)
+def read_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    获取后台任务进度（需要操作员权限）
+    """
+    job = JobService.get_job(db, job_id=job_id)
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return job
+
+@router.get("/{job_id}/events")
+async def stream_job_events(
+    job_id: int,
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    订阅后台任务进度（Server-Sent Events，需要操作员权限）
+    
+    任务状态或进度变化时推送一条 data 为任务JSON的事件，任务结束后关闭连接。
+    """
+    first = await run_in_threadpool(_load_job, job_id)
+    if first is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    
+    async def events() -> AsyncIterator[str]:
+        job, last = first, None
+        while job is not None:
+            data = job.model_dump_json()
+            if data != last:
+                yield f"data: {data}\n\n"
+                last = data
+            if job.status in ("success", "failed"):
+                return
+            await asyncio.sleep(1)
+            job = await run_in_threadpool(_load_job, job_id)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+def _load_job(job_id: int) -> Optional[Job]:
+    db = SessionLocal()
+    try:
+        job = JobService.get_job(db, job_id=job_id)
+        return Job.model_validate(job, from_attributes=True) if job else None
+    finally:
+        db.close()
@@ -0,0 +1,88 @@
+from typing import Any, Dict, List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+
+from backend.app.core.database import get_db
+from backend.app.core.security import validate_admin_role, validate_operator_role
+from backend.app.services.proxmox_cluster import proxmox_clusters
+from backend.app.services.proxmox_task import ProxmoxTaskService
+from backend.app.api.schemas.proxmox import ProxmoxTask
+from backend.app.models.user import User
+
+router = APIRouter()
+
+@router.get("/cache")
+def read_cache_stats(
+    cluster: Optional[str] = None,
+    current_user: User = Depends(validate_operator_role)
+) -> Dict[str, Any]:
+    """
+    获取Proxmox读请求缓存的命中统计（需要操作员权限），cluster 为空时返回默认集群
+    
+    hits 与 coalesced 之和即为缓存为集群API省下的请求数
+    """
+    try:
+        return proxmox_clusters.get(cluster).cache.stats()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+@router.delete("/cache")
+def clear_cache(
+    cluster: Optional[str] = None,
+    current_user: User = Depends(validate_admin_role)
+) -> Dict[str, Any]:
+    """
+    清空Proxmox读请求缓存（需要管理员权限），cluster 为空时清空所有集群
+    """
+    try:
+        names = [proxmox_clusters.resolve(cluster)] if cluster else proxmox_clusters.names()
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+    cleared = sum(proxmox_clusters.get(name).cache.clear() for name in names)
+    return {"status": "success", "cleared": cleared}
+
+@router.get("/connection")
+def read_connection_status(
+    current_user: User = Depends(validate_operator_role)
+) -> List[Dict[str, Any]]:
+    """
+    获取各Proxmox集群的连接状态（需要操作员权限）
+    """
+    return proxmox_clusters.connection_status()
+
+@router.get("/tasks", response_model=List[ProxmoxTask])
+def read_tasks(
+    db: Session = Depends(get_db),
+    vps_id: Optional[int] = None,
+    task_status: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    获取Proxmox任务（UPID）列表（需要操作员权限）
+    """
+    return ProxmoxTaskService.get_tasks(db, vps_id=vps_id, status=task_status, skip=skip, limit=limit)
+
+@router.get("/tasks/{task_id}", response_model=ProxmoxTask)
+def read_task(
+    task_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    获取Proxmox任务的执行结果（需要操作员权限）
+    """
+    task = ProxmoxTaskService.get_task(db, task_id=task_id)
+    if not task:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="任务不存在"
+        )
+    return task
@@ -1,18 +1,38 @@
 from typing import Any, List, Optional, Dict
 from fastapi import APIRouter, Depends, HTTPException, status, Query, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 
 from backend.app.core.database import get_db
 from backend.app.core.security import get_current_user, validate_admin_role, validate_operator_role
 from backend.app.services.vps_manager import VPSManagerService
+from backend.app.services.vps_status import vps_status_reconciler
 from backend.app.api.schemas.vps import (
-    VPSServer, VPSServerCreate, VPSServerUpdate, VPSServerBrief,
+    VPSServer, VPSServerCreate, VPSServerBatchCreate, VPSServerUpdate, VPSServerBrief,
     VPSBackup, VPSBackupCreate, VPSStatusUpdate
 )
+from backend.app.api.schemas.job import Job
 from backend.app.models.user import User
 
 router = APIRouter()
 
+def _check_vps_access(db: Session, vps_id: int, current_user: User) -> None:
+    """VPS不存在时返回404，普通用户操作他人的VPS时返回403"""
+    vps_server = VPSManagerService.get_vps_by_id(db, vps_id=vps_id)
+    if not vps_server:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="VPS服务器不存在"
+        )
+    
+    # 普通用户只能操作自己的VPS
+    if current_user.role not in ["admin", "operator"] and not current_user.is_superuser:
+        if vps_server.user_id != current_user.id:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="没有权限操作此VPS服务器"
+            )
+
 @router.get("/", response_model=List[VPSServerBrief])
 def read_vps_servers(
     db: Session = Depends(get_db),
@@ -32,7 +52,7 @@ def read_vps_servers(
     
     return vps_servers
 
-@router.post("/", response_model=VPSServer)
+@router.post("/", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
 def create_vps(
     *,
     db: Session = Depends(get_db),
@@ -40,27 +60,35 @@ def create_vps(
     current_user: User = Depends(validate_operator_role)
 ) -> Any:
     """
-    创建新VPS服务器（需要操作员权限）
+    提交创建VPS的后台任务（需要操作员权限）
+    
+    立即返回任务记录，进度通过 /jobs/{job_id} 查询或 /jobs/{job_id}/events 订阅，
+    任务结果中的 vps_id 为新VPS的ID。
     """
     try:
-        # 创建VPS，使用当前操作员作为用户
-        vps_server = VPSManagerService.create_vps(
-            db,
-            user_id=current_user.id,
-            name=vps_in.name,
-            node_name=vps_in.node_name,
-            cpu_cores=vps_in.cpu_cores,
-            memory=vps_in.memory,
-            disk_size=vps_in.disk_size,
-            os_type=vps_in.os_type,
-            os_template=vps_in.os_template,
-            ip_allocation_id=vps_in.ip_allocation_id,
-            ip_pool_id=vps_in.ip_pool_id,
-            bandwidth=vps_in.bandwidth,
-            notes=vps_in.notes,
-            config=vps_in.config
+        # 使用当前操作员作为用户
+        return VPSManagerService.submit_create_job(db, user_id=current_user.id, params=vps_in.dict())
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
         )
-        return vps_server
+
+@router.post("/batch", response_model=Job, status_code=status.HTTP_202_ACCEPTED)
+def create_vps_batch(
+    *,
+    db: Session = Depends(get_db),
+    batch_in: VPSServerBatchCreate,
+    current_user: User = Depends(validate_operator_role)
+) -> Any:
+    """
+    提交批量创建VPS的后台任务（需要操作员权限）
+    
+    整批VPS的VMID和IP地址在一个事务中预留，随后按节点并行克隆。
+    任务结果 items 中逐台返回VPS ID、VMID、节点和创建状态。
+    """
+    try:
+        return VPSManagerService.submit_batch_create_job(db, user_id=current_user.id, params=batch_in.dict())
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -157,7 +185,7 @@ def delete_vps(
         )
 
 @router.post("/{vps_id}/start", response_model=VPSStatusUpdate)
-def start_vps(
+async def start_vps(
     vps_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -165,23 +193,11 @@ def start_vps(
     """
     启动VPS服务器
     """
-    vps_server = VPSManagerService.get_vps_by_id(db, vps_id=vps_id)
-    if not vps_server:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="VPS服务器不存在"
-        )
-    
-    # 普通用户只能操作自己的VPS
-    if current_user.role not in ["admin", "operator"] and not current_user.is_superuser:
-        if vps_server.user_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="没有权限操作此VPS服务器"
-            )
+    # 数据库查询在线程池中执行，不阻塞事件循环
+    await run_in_threadpool(_check_vps_access, db, vps_id, current_user)
     
     try:
-        vps_server = VPSManagerService.start_vps(db, vps_id=vps_id)
+        vps_server = await VPSManagerService.change_power_state(db, vps_id=vps_id, action="start")
         return {"id": vps_server.id, "name": vps_server.name, "status": vps_server.status}
     except Exception as e:
         raise HTTPException(
@@ -190,7 +206,7 @@ def start_vps(
         )
 
 @router.post("/{vps_id}/stop", response_model=VPSStatusUpdate)
-def stop_vps(
+async def stop_vps(
     vps_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -198,23 +214,11 @@ def stop_vps(
     """
     关闭VPS服务器
     """
-    vps_server = VPSManagerService.get_vps_by_id(db, vps_id=vps_id)
-    if not vps_server:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="VPS服务器不存在"
-        )
-    
-    # 普通用户只能操作自己的VPS
-    if current_user.role not in ["admin", "operator"] and not current_user.is_superuser:
-        if vps_server.user_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="没有权限操作此VPS服务器"
-            )
+    # 数据库查询在线程池中执行，不阻塞事件循环
+    await run_in_threadpool(_check_vps_access, db, vps_id, current_user)
     
     try:
-        vps_server = VPSManagerService.stop_vps(db, vps_id=vps_id)
+        vps_server = await VPSManagerService.change_power_state(db, vps_id=vps_id, action="stop")
         return {"id": vps_server.id, "name": vps_server.name, "status": vps_server.status}
     except Exception as e:
         raise HTTPException(
@@ -223,7 +227,7 @@ def stop_vps(
         )
 
 @router.post("/{vps_id}/restart", response_model=VPSStatusUpdate)
-def restart_vps(
+async def restart_vps(
     vps_id: int,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -231,23 +235,11 @@ def restart_vps(
     """
     重启VPS服务器
     """
-    vps_server = VPSManagerService.get_vps_by_id(db, vps_id=vps_id)
-    if not vps_server:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="VPS服务器不存在"
-        )
-    
-    # 普通用户只能操作自己的VPS
-    if current_user.role not in ["admin", "operator"] and not current_user.is_superuser:
-        if vps_server.user_id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="没有权限操作此VPS服务器"
-            )
+    # 数据库查询在线程池中执行，不阻塞事件循环
+    await run_in_threadpool(_check_vps_access, db, vps_id, current_user)
     
     try:
-        vps_server = VPSManagerService.restart_vps(db, vps_id=vps_id)
+        vps_server = await VPSManagerService.change_power_state(db, vps_id=vps_id, action="restart")
         return {"id": vps_server.id, "name": vps_server.name, "status": vps_server.status}
     except Exception as e:
         raise HTTPException(
@@ -320,11 +312,11 @@ def read_vps_backups(
 @router.post("/update-status")
 def update_vps_status(
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
     current_user: User = Depends(validate_operator_role)
 ) -> Dict[str, str]:
     """
     更新所有VPS状态（异步任务，需要操作员权限）
     """
-    background_tasks.add_task(VPSManagerService.update_vps_status, db)
+    # 同步在请求结束后执行，使用自己的数据库会话
+    background_tasks.add_task(vps_status_reconciler.run_once)
     return {"status": "success", "message": "VPS状态更新任务已启动"} 
\ No newline at end of file
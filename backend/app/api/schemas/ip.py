@@ -12,11 +12,12 @@ class IPPoolBase(BaseModel):
     dns_servers: str
     vlan_id: Optional[int] = None
     notes: Optional[str] = None
+    allocation_mode: str = "sequential"  # IPv6池的分配方式: sequential, random
     
     @validator('network')
     def validate_network(cls, v):
         try:
-            ipaddress.IPv4Network(v, strict=False)
+            ipaddress.ip_network(v, strict=False)
             return v
         except:
             raise ValueError("无效的网络地址")
@@ -24,7 +25,7 @@ class IPPoolBase(BaseModel):
     @validator('gateway')
     def validate_gateway(cls, v):
         try:
-            ipaddress.IPv4Address(v)
+            ipaddress.ip_address(v)
             return v
         except:
             raise ValueError("无效的网关地址")
@@ -32,6 +33,12 @@ class IPPoolBase(BaseModel):
     @validator('subnet_mask')
     def validate_subnet_mask(cls, v):
         try:
+            # IPv6池使用前缀长度，例如 "64"
+            if v.isdigit():
+                if not 0 <= int(v) <= 128:
+                    raise ValueError()
+                return v
+            
             # 验证是否为有效的子网掩码
             octets = v.split('.')
             if len(octets) != 4:
@@ -50,10 +57,17 @@ class IPPoolBase(BaseModel):
         dns_list = v.split(',')
         for dns in dns_list:
             try:
-                ipaddress.IPv4Address(dns.strip())
+                ipaddress.ip_address(dns.strip())
             except:
                 raise ValueError(f"无效的DNS服务器地址: {dns}")
         return v
+    
+    @validator('allocation_mode')
+    def validate_allocation_mode(cls, v):
+        allowed_modes = ["sequential", "random"]
+        if v not in allowed_modes:
+            raise ValueError(f"分配方式必须是以下之一: {', '.join(allowed_modes)}")
+        return v
 
 # 创建IP池请求
 class IPPoolCreate(IPPoolBase):
@@ -62,17 +76,34 @@ class IPPoolCreate(IPPoolBase):
 # 更新IP池请求
 class IPPoolUpdate(BaseModel):
     name: Optional[str] = None
+    network: Optional[str] = None
+    subnet_mask: Optional[str] = None
     gateway: Optional[str] = None
     dns_servers: Optional[str] = None
     vlan_id: Optional[int] = None
     notes: Optional[str] = None
     is_active: Optional[bool] = None
     
+    @validator('network')
+    def validate_network(cls, v):
+        if v is not None:
+            try:
+                ipaddress.ip_network(v, strict=False)
+            except:
+                raise ValueError("无效的网络地址")
+        return v
+    
+    @validator('subnet_mask')
+    def validate_subnet_mask(cls, v):
+        if v is not None:
+            return IPPoolBase.validate_subnet_mask(v)
+        return v
+    
     @validator('gateway')
     def validate_gateway(cls, v):
         if v is not None:
             try:
-                ipaddress.IPv4Address(v)
+                ipaddress.ip_address(v)
                 return v
             except:
                 raise ValueError("无效的网关地址")
@@ -84,7 +115,7 @@ class IPPoolUpdate(BaseModel):
             dns_list = v.split(',')
             for dns in dns_list:
                 try:
-                    ipaddress.IPv4Address(dns.strip())
+                    ipaddress.ip_address(dns.strip())
                 except:
                     raise ValueError(f"无效的DNS服务器地址: {dns}")
         return v
@@ -92,6 +123,7 @@ class IPPoolUpdate(BaseModel):
 # IP池响应
 class IPPool(IPPoolBase):
     id: int
+    ip_version: int = 4
     is_active: bool
     created_at: datetime
     updated_at: datetime
@@ -111,7 +143,7 @@ class IPAllocationBase(BaseModel):
     @validator('ip_address')
     def validate_ip_address(cls, v):
         try:
-            ipaddress.IPv4Address(v)
+            ipaddress.ip_address(v)
             return v
         except:
             raise ValueError("无效的IP地址")
@@ -143,7 +175,7 @@ class IPAllocationCreate(BaseModel):
     @validator('ip_address')
     def validate_ip_address(cls, v):
         try:
-            ipaddress.IPv4Address(v)
+            ipaddress.ip_address(v)
             return v
         except:
             raise ValueError("无效的IP地址")
@@ -156,11 +188,90 @@ class IPReservationCreate(BaseModel):
     @validator('ip_address')
     def validate_ip_address(cls, v):
         try:
-            ipaddress.IPv4Address(v)
+            ipaddress.ip_address(v)
             return v
         except:
             raise ValueError("无效的IP地址")
 
+# 批量分配/保留IP请求：指定地址列表、起止范围，或从IP池中取 count 个
+class IPBulkClaimRequest(BaseModel):
+    ip_addresses: Optional[List[str]] = None
+    start_ip: Optional[str] = None
+    end_ip: Optional[str] = None
+    ip_pool_id: Optional[int] = None
+    count: Optional[int] = None
+    user_id: Optional[int] = None
+    hostname: Optional[str] = None
+    notes: Optional[str] = None
+
+    @validator('count')
+    def validate_count(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("数量必须大于0")
+        return v
+
+# 连续地址块分配请求：指定 prefix_length（按对齐的子网分配）或 size（任意连续地址）
+class IPBlockAllocateRequest(BaseModel):
+    size: Optional[int] = None
+    prefix_length: Optional[int] = None
+    status: str = "allocated"
+    user_id: Optional[int] = None
+    hostname: Optional[str] = None
+    notes: Optional[str] = None
+    
+    @validator('size')
+    def validate_size(cls, v):
+        if v is not None and v <= 0:
+            raise ValueError("地址块大小必须大于0")
+        return v
+    
+    @validator('prefix_length')
+    def validate_prefix_length(cls, v):
+        if v is not None and not 0 <= v <= 128:
+            raise ValueError("无效的前缀长度")
+        return v
+    
+    @validator('status')
+    def validate_status(cls, v):
+        allowed_status = ["allocated", "reserved"]
+        if v not in allowed_status:
+            raise ValueError(f"状态必须是以下之一: {', '.join(allowed_status)}")
+        return v
+
+# 批量释放IP请求
+class IPBulkReleaseRequest(BaseModel):
+    ip_addresses: Optional[List[str]] = None
+    start_ip: Optional[str] = None
+    end_ip: Optional[str] = None
+
+# 批量操作的单项结果
+class IPBulkItemResult(BaseModel):
+    ip_address: str
+    success: bool
+    message: Optional[str] = None
+    allocation_id: Optional[int] = None
+
+# 批量操作结果
+class IPBulkResult(BaseModel):
+    requested: int
+    succeeded: int
+    failed: int
+    items: List[IPBulkItemResult]
+
+# 导入失败的记录
+class IPImportError(BaseModel):
+    line: int
+    message: str
+
+# 批量导入结果
+class IPImportResult(BaseModel):
+    processed: int
+    created: int
+    updated: int
+    skipped: int
+    failed: int
+    errors: List[IPImportError]
+
 # 更新IP分配请求
 class IPAllocationUpdate(BaseModel):
     hostname: Optional[str] = None
@@ -193,4 +304,20 @@ class IPUsageStats(BaseModel):
     reserved: int
     available_percentage: float
     allocated_percentage: float
-    reserved_percentage: float 
\ No newline at end of file
+    reserved_percentage: float
+
+# 单个IP池的使用统计
+class IPPoolUsageStats(IPUsageStats):
+    ip_pool_id: int
+    name: str
+    network: str
+
+# IP池碎片情况
+class IPPoolFragmentation(BaseModel):
+    ip_pool_id: int
+    name: str
+    network: str
+    free_ranges: int
+    available: int
+    largest_free_block: int
+    fragmentation: float
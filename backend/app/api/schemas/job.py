@@ -0,0 +1,22 @@
+from typing import Optional, Dict, Any
+from datetime import datetime
+from pydantic import BaseModel
+
+# 后台任务响应
+class Job(BaseModel):
+    id: int
+    job_type: str
+    status: str
+    target_id: Optional[int] = None
+    total: int = 0
+    processed: int = 0
+    progress: float = 0
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        orm_mode = True
@@ -0,0 +1,22 @@
+from typing import Optional, Dict, Any
+from datetime import datetime
+from pydantic import BaseModel
+
+# Proxmox任务响应
+class ProxmoxTask(BaseModel):
+    id: int
+    upid: str
+    cluster_name: Optional[str] = None
+    node_name: str
+    task_type: str
+    status: str
+    exitstatus: Optional[str] = None
+    vps_id: Optional[int] = None
+    backup_id: Optional[int] = None
+    poll_count: int = 0
+    created_at: datetime
+    updated_at: datetime
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        orm_mode = True
@@ -1,12 +1,15 @@
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 from pydantic import BaseModel, validator, Field
+
+from backend.app.core.config import settings
 from .ip import IPAllocation
 
 # VPS服务器共享属性
 class VPSServerBase(BaseModel):
     name: str
-    node_name: str
+    cluster_name: Optional[str] = None  # 为空时使用默认集群
+    node_name: Optional[str] = None  # 创建时为空则由调度策略选择节点
     cpu_cores: int = Field(..., gt=0)
     memory: int = Field(..., gt=0)  # MB
     disk_size: int = Field(..., gt=0)  # GB
@@ -26,7 +29,36 @@ class VPSServerBase(BaseModel):
 class VPSServerCreate(VPSServerBase):
     ip_allocation_id: Optional[int] = None
     ip_pool_id: Optional[int] = None
+    ip6_pool_id: Optional[int] = None  # 指定时额外分配IPv6地址（双栈）
     config: Optional[Dict[str, Any]] = None
+    placement_policy: Optional[str] = None  # 未指定节点时的调度策略：spread、binpack、anti_affinity
+
+# 批量创建VPS请求
+class VPSServerBatchCreate(BaseModel):
+    name_prefix: str  # VPS名称为 {name_prefix}-{序号}
+    count: int = Field(..., gt=0, le=1000)
+    cluster_name: Optional[str] = None  # 为空时使用默认集群
+    node_names: Optional[List[str]] = None  # 按顺序轮流分配，为空时由调度策略逐台选择
+    cpu_cores: int = Field(..., gt=0)
+    memory: int = Field(..., gt=0)  # MB
+    disk_size: int = Field(..., gt=0)  # GB
+    os_type: str
+    os_template: str
+    bandwidth: int = 1000  # Mbps
+    notes: Optional[str] = None
+    ip_pool_id: int
+    ip6_pool_id: Optional[int] = None  # 指定时额外分配IPv6地址（双栈）
+    config: Optional[Dict[str, Any]] = None
+    # 每个节点同时克隆的数量，默认且最多为 PVE_NODE_HEAVY_CONCURRENCY
+    concurrency: Optional[int] = Field(None, gt=0, le=settings.PVE_NODE_HEAVY_CONCURRENCY)
+    placement_policy: Optional[str] = None  # 未指定 node_names 时的调度策略
+    
+    @validator('os_type')
+    def validate_os_type(cls, v):
+        allowed_types = ["linux", "windows"]
+        if v not in allowed_types:
+            raise ValueError(f"操作系统类型必须是以下之一: {', '.join(allowed_types)}")
+        return v
 
 # 更新VPS请求
 class VPSServerUpdate(BaseModel):
@@ -44,8 +76,10 @@ class VPSServer(VPSServerBase):
     vmid: int
     user_id: int
     status: str
-    ip_allocation_id: int
+    ip_allocation_id: Optional[int] = None
     ip_allocation: Optional[IPAllocation] = None
+    ip6_allocation_id: Optional[int] = None
+    ip6_allocation: Optional[IPAllocation] = None
     config: Optional[Dict[str, Any]] = None
     created_at: datetime
     updated_at: datetime
@@ -59,6 +93,7 @@ class VPSServerBrief(BaseModel):
     id: int
     name: str
     vmid: int
+    cluster_name: str
     node_name: str
     status: str
     os_type: str
@@ -72,8 +107,9 @@ class VPSServerBrief(BaseModel):
 class VPSBackupBase(BaseModel):
     vps_id: int
     backup_id: str
-    file_name: str
-    file_size: float  # MB
+    file_name: Optional[str] = None  # 备份完成后填写
+    file_size: Optional[float] = None  # MB
+    status: Optional[str] = None  # running, success, failed
     notes: Optional[str] = None
     is_auto: bool = True
 
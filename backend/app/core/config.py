@@ -1,5 +1,5 @@
 import os
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, ClassVar
 from pydantic import Field
 from pydantic_settings import BaseSettings
 
@@ -21,6 +21,66 @@ class Settings(BaseSettings):
     PVE_PASSWORD: str = os.getenv("PVE_PASSWORD", "")
     PVE_TOKEN_NAME: Optional[str] = os.getenv("PVE_TOKEN_NAME")
     PVE_TOKEN_VALUE: Optional[str] = os.getenv("PVE_TOKEN_VALUE")
+    PVE_PORT: int = int(os.getenv("PVE_PORT", "8006"))
+    PVE_VERIFY_SSL: bool = os.getenv("PVE_VERIFY_SSL", "false").lower() == "true"
+    PVE_TIMEOUT: float = float(os.getenv("PVE_TIMEOUT", "30"))
+    # 按调用类型设置超时（秒）：建立连接、读请求、写请求；读请求遇到暂时性故障时按抖动退避重试
+    PVE_CONNECT_TIMEOUT: float = float(os.getenv("PVE_CONNECT_TIMEOUT", "3"))
+    PVE_READ_TIMEOUT: float = float(os.getenv("PVE_READ_TIMEOUT", "10"))
+    PVE_WRITE_TIMEOUT: float = float(os.getenv("PVE_WRITE_TIMEOUT", "30"))
+    PVE_READ_RETRIES: int = int(os.getenv("PVE_READ_RETRIES", "2"))
+    PVE_RETRY_BACKOFF: float = float(os.getenv("PVE_RETRY_BACKOFF", "0.2"))
+    PVE_RETRY_BACKOFF_MAX: float = float(os.getenv("PVE_RETRY_BACKOFF_MAX", "2"))
+    # 熔断：集群或节点连续失败该次数后打开，打开期间直接失败，指定秒数后放行探测请求
+    PVE_BREAKER_FAILURES: int = int(os.getenv("PVE_BREAKER_FAILURES", "5"))
+    PVE_BREAKER_RESET_TIMEOUT: float = float(os.getenv("PVE_BREAKER_RESET_TIMEOUT", "30"))
+    # 操作调度：重操作（克隆、备份、删除）每个节点、每个存储同时执行的任务数，轻操作每个节点同时在途的请求数
+    PVE_NODE_HEAVY_CONCURRENCY: int = int(os.getenv("PVE_NODE_HEAVY_CONCURRENCY", "2"))
+    PVE_STORAGE_HEAVY_CONCURRENCY: int = int(os.getenv("PVE_STORAGE_HEAVY_CONCURRENCY", "3"))
+    PVE_NODE_LIGHT_CONCURRENCY: int = int(os.getenv("PVE_NODE_LIGHT_CONCURRENCY", "16"))
+    PVE_SCHEDULER_WAIT_TIMEOUT: float = float(os.getenv("PVE_SCHEDULER_WAIT_TIMEOUT", "300"))
+    PVE_HEAVY_LEASE_TIMEOUT: float = float(os.getenv("PVE_HEAVY_LEASE_TIMEOUT", "7200"))
+    # 本系统分配VMID的范围（含两端），其他工具或手动创建的VM可以使用范围以外的VMID
+    PVE_VMID_MIN: int = int(os.getenv("PVE_VMID_MIN", "100"))
+    PVE_VMID_MAX: int = int(os.getenv("PVE_VMID_MAX", "999999999"))
+    # 新VPS未指定节点时的调度策略（spread 分散、binpack 装箱、anti_affinity 同一用户分散），
+    # 以及放置后节点至少保留的空闲内存比例
+    PVE_PLACEMENT_POLICY: str = os.getenv("PVE_PLACEMENT_POLICY", "spread")
+    PVE_PLACEMENT_MEMORY_HEADROOM: float = float(os.getenv("PVE_PLACEMENT_MEMORY_HEADROOM", "0.1"))
+    # 多集群配置（JSON），键为集群名称，例如
+    # {"bj": {"hosts": ["10.0.0.1", "10.0.0.2"], "user": "root@pam", "token_name": "api", "token_value": "..."}}
+    # hosts 为集群各节点的API地址，按顺序故障切换；未填写的认证信息取上面的默认值。
+    # 为空时只有一个名为 default 的集群，使用 PVE_HOST
+    PVE_CLUSTERS: str = os.getenv("PVE_CLUSTERS", "")
+    PVE_DEFAULT_CLUSTER: Optional[str] = os.getenv("PVE_DEFAULT_CLUSTER")
+    PVE_FANOUT_WORKERS: int = int(os.getenv("PVE_FANOUT_WORKERS", "8"))
+    # 本地开发和基准测试：设置为 PVESimulator 的参数（JSON，例如 {"nodes": 4, "vms": 10000, "latency": 0.02}）时，
+    # 所有集群改为访问进程内的模拟器，不连接真实的Proxmox
+    PVE_SIMULATOR: str = os.getenv("PVE_SIMULATOR", "")
+    # 异步客户端连接池：每个Proxmox主机的最大连接数、保持的空闲长连接数和同时在途的请求数
+    PVE_MAX_CONNECTIONS: int = int(os.getenv("PVE_MAX_CONNECTIONS", "100"))
+    PVE_MAX_KEEPALIVE_CONNECTIONS: int = int(os.getenv("PVE_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    PVE_MAX_CONCURRENCY_PER_HOST: int = int(os.getenv("PVE_MAX_CONCURRENCY_PER_HOST", "50"))
+    # Proxmox连接失败后的重连退避（秒），按失败次数指数增长
+    PVE_RECONNECT_BACKOFF: float = float(os.getenv("PVE_RECONNECT_BACKOFF", "1"))
+    PVE_RECONNECT_BACKOFF_MAX: float = float(os.getenv("PVE_RECONNECT_BACKOFF_MAX", "60"))
+    # Proxmox任务（UPID）轮询：间隔从最小值开始逐次增长到最大值，超过超时时间的任务标记为失败
+    PVE_TASK_POLL_MIN_INTERVAL: float = float(os.getenv("PVE_TASK_POLL_MIN_INTERVAL", "1"))
+    PVE_TASK_POLL_MAX_INTERVAL: float = float(os.getenv("PVE_TASK_POLL_MAX_INTERVAL", "30"))
+    PVE_TASK_POLL_BATCH: int = int(os.getenv("PVE_TASK_POLL_BATCH", "200"))
+    PVE_TASK_TIMEOUT: int = int(os.getenv("PVE_TASK_TIMEOUT", "86400"))
+    # Proxmox读请求缓存的最大条目数，0 表示关闭缓存
+    PVE_CACHE_MAX_ENTRIES: int = int(os.getenv("PVE_CACHE_MAX_ENTRIES", "1024"))
+    
+    # 后台任务（Job）：工作线程数、空闲时检查新任务的间隔（秒），运行中任务超过租约时间未续期视为执行进程已退出
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "4"))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+    JOB_LEASE_TIMEOUT: float = float(os.getenv("JOB_LEASE_TIMEOUT", "120"))
+    # 一个批量创建任务最多同时使用的克隆线程数（所有节点合计）
+    JOB_BATCH_MAX_THREADS: int = int(os.getenv("JOB_BATCH_MAX_THREADS", "32"))
+    
+    # VPS状态同步：每隔多少秒用集群虚拟机快照核对一次所有VPS的状态和所在节点，0 表示只在手动触发时同步
+    VPS_STATUS_SYNC_INTERVAL: float = float(os.getenv("VPS_STATUS_SYNC_INTERVAL", "60"))
     
     # 安全配置
     SECRET_KEY: str = os.getenv("SECRET_KEY", "your_secret_key_here")
@@ -44,7 +104,7 @@ class Settings(BaseSettings):
     LOG_DIR: str = os.getenv("LOG_DIR", "./logs")
     
     # 系统用户角色
-    ROLES = {
+    ROLES: ClassVar[Dict[str, str]] = {
         "admin": "管理员",
         "operator": "操作员",
         "user": "普通用户",
@@ -52,7 +112,7 @@ class Settings(BaseSettings):
     }
     
     # 操作系统模板配置
-    OS_TEMPLATES = {
+    OS_TEMPLATES: ClassVar[Dict[str, Dict[str, List[str]]]] = {
         "linux": {
             "ubuntu": ["20.04", "22.04"], 
             "debian": ["10", "11"],
@@ -66,7 +126,7 @@ class Settings(BaseSettings):
     }
     
     # VPS默认配置
-    DEFAULT_VPS_CONFIG = {
+    DEFAULT_VPS_CONFIG: ClassVar[Dict[str, int]] = {
         "cpu": 1,
         "memory": 1024,
         "disk": 10,
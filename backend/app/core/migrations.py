@@ -0,0 +1,124 @@
+import logging
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import Column, Index, inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from backend.app.models.ip import IPPool, IPAllocation
+from backend.app.models.vps import VPSServer, VPSBackup
+
+logger = logging.getLogger(__name__)
+
+def _columns(conn: Connection, table_name: str) -> set:
+    return {column["name"] for column in inspect(conn).get_columns(table_name)}
+
+def _add_column(conn: Connection, column: Column, default: Optional[str] = None) -> bool:
+    """给已有表增加模型中定义的列，列已存在时返回 False
+
+    NOT NULL 列必须提供 default，已有行取该默认值。
+    """
+    table_name = column.table.name
+    if column.name in _columns(conn, table_name):
+        return False
+    ddl = f"ALTER TABLE {table_name} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+    if default is not None:
+        ddl += f" DEFAULT {default}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    for foreign_key in column.foreign_keys:
+        ddl += f" REFERENCES {foreign_key.column.table.name} ({foreign_key.column.name})"
+    conn.execute(text(ddl))
+    logger.info(f"已添加列 {table_name}.{column.name}")
+    return True
+
+def _create_index(conn: Connection, index: Index) -> None:
+    """在已有表上创建模型中定义的索引，同名的索引或唯一约束已存在时跳过"""
+    inspector = inspect(conn)
+    existing = {item["name"] for item in inspector.get_indexes(index.table.name)}
+    existing.update(item["name"] for item in inspector.get_unique_constraints(index.table.name))
+    if index.name not in existing:
+        index.create(conn)
+        logger.info(f"已创建索引 {index.name}")
+
+def _index(table, name: str) -> Index:
+    return next(index for index in table.indexes if index.name == name)
+
+def _ip_pool_free_version(conn: Connection) -> None:
+    """ip_pools.free_version：进程内IP分配缓存的版本号"""
+    _add_column(conn, IPPool.__table__.c.free_version, default="0")
+
+def _allocation_status_index(conn: Connection) -> None:
+    """按 (IP池, 状态) 统计和查找分配记录的索引"""
+    _create_index(conn, _index(IPAllocation.__table__, "ix_ip_allocations_pool_status"))
+
+def _ipv6_pools(conn: Connection) -> None:
+    """IPv6池与双栈VPS：ip_pools 的地址族、分配方式和游标，vps_servers.ip6_allocation_id"""
+    columns = IPPool.__table__.c
+    _add_column(conn, columns.ip_version, default="4")
+    _add_column(conn, columns.allocation_mode, default="'sequential'")
+    _add_column(conn, columns.next_cursor)
+    _add_column(conn, VPSServer.__table__.c.ip6_allocation_id)
+
+def _integer_ip_columns(conn: Connection) -> None:
+    """整数形式的地址列及其范围索引，已有行的值由 IPManagerService.backfill_ip_values 补齐"""
+    pools = IPPool.__table__
+    allocations = IPAllocation.__table__
+    _add_column(conn, pools.c.network_start)
+    _add_column(conn, pools.c.network_end)
+    _add_column(conn, allocations.c.ip_version)
+    _add_column(conn, allocations.c.ip_value)
+    _create_index(conn, _index(pools, "ix_ip_pools_version_range"))
+    _create_index(conn, _index(allocations, "ix_ip_allocations_version_value"))
+
+def _backup_status(conn: Connection) -> None:
+    """vps_backups.status：备份任务的状态，已有的备份都已完成"""
+    _add_column(conn, VPSBackup.__table__.c.status, default="'success'")
+
+def _vps_cluster_name(conn: Connection) -> None:
+    """vps_servers.cluster_name：旧记录归入默认集群；VMID 改为只在同一集群内唯一"""
+    # 延迟导入：集群配置在 services 中加载
+    from backend.app.services.proxmox_cluster import proxmox_clusters
+
+    table = VPSServer.__table__
+    default_name = proxmox_clusters.default_name
+    if not _add_column(conn, table.c.cluster_name, default="'" + default_name.replace("'", "''") + "'"):
+        # 早先以可空列加入的 cluster_name，空值表示默认集群
+        conn.execute(
+            text("UPDATE vps_servers SET cluster_name = :name WHERE cluster_name IS NULL"), {"name": default_name}
+        )
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("ALTER TABLE vps_servers ALTER COLUMN cluster_name SET NOT NULL"))
+
+    # 旧版的 VMID 索引是全局唯一的，会阻止不同集群使用相同的VMID
+    vmid_index = _index(table, "ix_vps_servers_vmid")
+    if any(item["name"] == vmid_index.name and item["unique"] for item in inspect(conn).get_indexes(table.name)):
+        vmid_index.drop(conn)
+        logger.info(f"已删除唯一索引 {vmid_index.name}")
+    _create_index(conn, vmid_index)
+    _create_index(conn, _index(table, "ix_vps_servers_cluster_name"))
+    _create_index(conn, _index(table, "uq_vps_servers_cluster_vmid"))
+
+# 对已有表的结构修改，按顺序执行。Base.metadata.create_all 只创建缺少的表，
+# 不会给已有的表增加列、索引或约束，每次修改已有表的结构都要在这里登记一个步骤
+MIGRATIONS: List[Tuple[str, Callable[[Connection], None]]] = [
+    ("ip_pools.free_version", _ip_pool_free_version),
+    ("ip_allocations.pool_status_index", _allocation_status_index),
+    ("ipv6_pools", _ipv6_pools),
+    ("integer_ip_columns", _integer_ip_columns),
+    ("vps_backups.status", _backup_status),
+    ("vps_servers.cluster_name", _vps_cluster_name),
+]
+
+def upgrade_schema(engine: Engine) -> None:
+    """升级已有数据库的表结构
+
+    应用启动和 scripts/init_db.py 在 create_all 之后调用。每个步骤在单独的事务中执行，
+    先检查当前结构，已经完成的步骤直接跳过，因此可以重复执行。
+    """
+    for name, step in MIGRATIONS:
+        try:
+            with engine.begin() as conn:
+                step(conn)
+        except Exception as e:
+            logger.error(f"数据库结构升级 {name} 失败: {str(e)}")
+            raise Exception(f"数据库结构升级 {name} 失败: {str(e)}")
@@ -6,8 +6,16 @@ from sqlalchemy.orm import Session
 from backend.app.api.api import api_router
 from backend.app.core.config import settings
 from backend.app.core.database import engine, get_db
+from backend.app.core.migrations import upgrade_schema
 from backend.app.models.base import Base
 from backend.app.services.user import UserService
+from backend.app.services.ip_manager import IPManagerService
+from backend.app.services.ip_allocator import ip_allocator
+from backend.app.services.proxmox_cluster import proxmox_clusters
+from backend.app.services.proxmox_task import proxmox_task_tracker
+from backend.app.services.job import job_worker_pool
+from backend.app.services.vps_manager import VPSManagerService
+from backend.app.services.vps_status import vps_status_reconciler
 
 # 配置日志
 logging.basicConfig(
@@ -20,8 +28,9 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# 创建数据库表
+# 创建数据库表，并升级已有表的结构
 Base.metadata.create_all(bind=engine)
+upgrade_schema(engine)
 
 # 创建应用
 app = FastAPI(
@@ -69,6 +78,49 @@ async def create_superuser():
     except Exception as e:
         logger.error(f"创建超级管理员账户失败: {str(e)}")
 
+# 预热IP分配缓存
+@app.on_event("startup")
+async def warm_up_ip_allocator():
+    """启动时补齐旧数据的整数地址列，并从数据库加载各IP池的空闲地址区间"""
+    db = next(get_db())
+    try:
+        IPManagerService.backfill_ip_values(db)
+        ip_allocator.warm_up(db)
+    except Exception as e:
+        logger.error(f"加载IP分配缓存失败: {str(e)}")
+    finally:
+        db.close()
+
+# 启动Proxmox任务跟踪
+@app.on_event("startup")
+async def start_task_tracker():
+    """启动后台轮询Proxmox任务（UPID）的线程，继续跟踪重启前未结束的任务"""
+    proxmox_task_tracker.start()
+
+# 启动VPS状态定时同步
+@app.on_event("startup")
+async def start_status_reconciler():
+    """启动定时用集群快照同步VPS状态的线程"""
+    vps_status_reconciler.start()
+
+# 启动后台任务线程池
+@app.on_event("startup")
+async def start_job_workers():
+    """注册各类后台任务的执行函数并启动工作线程，继续执行重启前排队的任务"""
+    job_worker_pool.register("ip_pool_rebuild", IPManagerService.run_rebuild_free_ranges_job)
+    job_worker_pool.register("vps_create", VPSManagerService.run_create_job)
+    job_worker_pool.register("vps_batch_create", VPSManagerService.run_batch_create_job)
+    job_worker_pool.start()
+
+# 关闭Proxmox连接池
+@app.on_event("shutdown")
+async def close_proxmox_client():
+    """停止后台任务线程池、状态同步线程和任务跟踪线程，关闭各集群异步Proxmox客户端的长连接"""
+    job_worker_pool.stop()
+    vps_status_reconciler.stop()
+    proxmox_task_tracker.stop()
+    await proxmox_clusters.aclose()
+
 # 健康检查路由
 @app.get("/health")
 def health_check():
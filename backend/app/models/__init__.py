@@ -1,4 +1,7 @@
 from backend.app.models.base import Base
 from backend.app.models.user import User
 from backend.app.models.vps import VPSServer, VPSBackup
-from backend.app.models.ip import IPPool, IPAllocation 
\ No newline at end of file
+from backend.app.models.ip import IPPool, IPAllocation, IPFreeRange, IPPoolCounter
+from backend.app.models.job import Job
+from backend.app.models.proxmox_task import ProxmoxTask
+from backend.app.models.vmid import VMIDCluster, VMIDFreeRange
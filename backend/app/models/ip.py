@@ -1,35 +1,137 @@
+import ipaddress
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, Numeric, String, Boolean, DateTime, ForeignKey, Text, Index
+from sqlalchemy.orm import relationship, validates
+from sqlalchemy.types import TypeDecorator
 
 from backend.app.models.base import Base
 
+class IPInteger(TypeDecorator):
+    """整数形式的IP地址（最大128位）
+
+    PostgreSQL 上使用 NUMERIC(39, 0)；SQLite 的整数只有64位，
+    改用定长补零的十进制字符串，字典序与数值序一致，索引范围查询同样有效。
+    """
+    impl = Numeric(39, 0)
+    cache_ok = True
+    
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "sqlite":
+            return dialect.type_descriptor(String(39))
+        return dialect.type_descriptor(Numeric(39, 0))
+    
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if dialect.name == "sqlite":
+            return f"{int(value):039d}"
+        return int(value)
+    
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return int(value)
+
 class IPPool(Base):
     __tablename__ = "ip_pools"
+    __table_args__ = (
+        Index("ix_ip_pools_version_range", "ip_version", "network_start", "network_end"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, unique=True, index=True)
     network = Column(String)  # 例如 "192.168.1.0/24"
+    network_start = Column(IPInteger, nullable=True)  # 整数形式的网络起始地址
+    network_end = Column(IPInteger, nullable=True)  # 整数形式的网络结束地址
     gateway = Column(String)
     subnet_mask = Column(String)
     dns_servers = Column(String)  # 逗号分隔的DNS服务器列表
     vlan_id = Column(Integer, nullable=True)
     notes = Column(Text, nullable=True)
     is_active = Column(Boolean, default=True)
+    ip_version = Column(Integer, default=4, nullable=False)  # 4 或 6
+    allocation_mode = Column(String, default="sequential")  # IPv6池的分配方式: sequential, random
+    next_cursor = Column(String, nullable=True)  # IPv6池顺序分配的下一个偏移量（十进制字符串）
+    free_version = Column(Integer, default=0, nullable=False)  # 空闲地址增加（释放/重建/调整范围）时递增，用于使进程内缓存失效
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 关系
     ip_allocations = relationship("IPAllocation", back_populates="ip_pool")
+    free_ranges = relationship("IPFreeRange", back_populates="ip_pool", cascade="all, delete-orphan")
+    counters = relationship("IPPoolCounter", back_populates="ip_pool", cascade="all, delete-orphan")
+    
+    @validates("network")
+    def _sync_network_range(self, key, value):
+        """network 变化时同步整数形式的地址范围"""
+        if value:
+            net = ipaddress.ip_network(value, strict=False)
+            self.network_start = int(net.network_address)
+            self.network_end = int(net.broadcast_address)
+        return value
     
     def __repr__(self):
         return f"<IPPool {self.name} ({self.network})>"
 
+class IPFreeRange(Base):
+    """IP池中的空闲地址段
+
+    空闲地址以整数闭区间 [range_start, range_end] 的形式保存，
+    只有已分配或已保留的地址才会在 ip_allocations 中产生记录。
+    """
+    __tablename__ = "ip_free_ranges"
+    __table_args__ = (
+        Index("ix_ip_free_ranges_pool_start", "ip_pool_id", "range_start"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    ip_pool_id = Column(Integer, ForeignKey("ip_pools.id"), nullable=False)
+    range_start = Column(BigInteger, nullable=False)  # 整数形式的起始地址（含）
+    range_end = Column(BigInteger, nullable=False)  # 整数形式的结束地址（含）
+    
+    # 关系
+    ip_pool = relationship("IPPool", back_populates="free_ranges")
+    
+    @property
+    def size(self) -> int:
+        return self.range_end - self.range_start + 1
+    
+    def __repr__(self):
+        return f"<IPFreeRange {self.range_start}-{self.range_end}>"
+
+class IPPoolCounter(Base):
+    """IP池使用量计数器
+
+    每个IP池有多行（分片），与分配、保留、释放操作在同一事务中增量维护：每次随机更新其中一个分片，
+    同一IP池的并发分配不会都等待同一行的锁。统计接口按IP池对各分片求和。
+    """
+    __tablename__ = "ip_pool_counters"
+    
+    ip_pool_id = Column(Integer, ForeignKey("ip_pools.id"), primary_key=True)
+    shard = Column(Integer, primary_key=True, default=0)
+    total = Column(BigInteger, default=0, nullable=False)
+    available = Column(BigInteger, default=0, nullable=False)
+    allocated = Column(BigInteger, default=0, nullable=False)
+    reserved = Column(BigInteger, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # 关系
+    ip_pool = relationship("IPPool", back_populates="counters")
+    
+    def __repr__(self):
+        return f"<IPPoolCounter {self.ip_pool_id}#{self.shard} ({self.available}/{self.total})>"
+
 class IPAllocation(Base):
     __tablename__ = "ip_allocations"
+    __table_args__ = (
+        Index("ix_ip_allocations_pool_status", "ip_pool_id", "status"),
+        Index("ix_ip_allocations_version_value", "ip_version", "ip_value"),
+    )
     
     id = Column(Integer, primary_key=True, index=True)
     ip_address = Column(String, unique=True, index=True)
+    ip_version = Column(Integer, nullable=True)  # 4 或 6
+    ip_value = Column(IPInteger, nullable=True)  # 整数形式的地址，用于数值排序和网段范围查询
     ip_pool_id = Column(Integer, ForeignKey("ip_pools.id"))
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     status = Column(String)  # available, allocated, reserved
@@ -42,7 +144,19 @@ class IPAllocation(Base):
     # 关系
     ip_pool = relationship("IPPool", back_populates="ip_allocations")
     user = relationship("User", back_populates="ip_allocations")
-    vps_server = relationship("VPSServer", back_populates="ip_allocation", uselist=False)
+    vps_server = relationship(
+        "VPSServer", back_populates="ip_allocation", uselist=False,
+        foreign_keys="VPSServer.ip_allocation_id"
+    )
+    
+    @validates("ip_address")
+    def _sync_ip_value(self, key, value):
+        """ip_address 变化时同步整数形式的地址"""
+        if value:
+            ip = ipaddress.ip_address(value)
+            self.ip_version = ip.version
+            self.ip_value = int(ip)
+        return value
     
     def __repr__(self):
         return f"<IPAllocation {self.ip_address} ({self.status})>" 
\ No newline at end of file
@@ -0,0 +1,32 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Text, JSON
+
+from backend.app.models.base import Base
+
+class Job(Base):
+    """后台任务记录，用于跟踪耗时操作的进度"""
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    job_type = Column(String, index=True)  # ip_pool_rebuild 等
+    status = Column(String, index=True, default="pending")  # pending, running, success, failed
+    target_id = Column(Integer, nullable=True)  # 任务作用对象的ID
+    user_id = Column(Integer, nullable=True)
+    total = Column(Integer, default=0)
+    processed = Column(Integer, default=0)
+    payload = Column(JSON, nullable=True)  # 任务参数
+    result = Column(JSON, nullable=True)  # 任务结果
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    
+    @property
+    def progress(self) -> float:
+        if not self.total:
+            return 100.0 if self.status == "success" else 0.0
+        return round(min(self.processed or 0, self.total) / self.total * 100, 2)
+    
+    def __repr__(self):
+        return f"<Job {self.id} {self.job_type} ({self.status})>"
@@ -0,0 +1,30 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, JSON, Index
+
+from backend.app.models.base import Base
+
+class ProxmoxTask(Base):
+    """Proxmox 异步任务（UPID）记录，由任务跟踪线程轮询直到结束"""
+    __tablename__ = "proxmox_tasks"
+    __table_args__ = (
+        Index("ix_proxmox_tasks_status_poll", "status", "next_poll_at"),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    upid = Column(String, unique=True, index=True)
+    cluster_name = Column(String, nullable=True)  # 为空表示默认集群
+    node_name = Column(String)
+    task_type = Column(String, index=True)  # qmcreate, qmstart, qmstop, qmreset, vzdump 等
+    status = Column(String, default="running")  # running, success, failed
+    exitstatus = Column(String, nullable=True)  # Proxmox 返回的退出状态，例如 OK 或错误信息
+    vps_id = Column(Integer, ForeignKey("vps_servers.id", ondelete="SET NULL"), nullable=True, index=True)
+    backup_id = Column(Integer, ForeignKey("vps_backups.id", ondelete="SET NULL"), nullable=True)
+    payload = Column(JSON, nullable=True)  # 任务结束后需要执行的数据库更新
+    poll_count = Column(Integer, default=0)
+    next_poll_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<ProxmoxTask {self.upid} ({self.status})>"
@@ -0,0 +1,41 @@
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, DateTime, Index
+
+from backend.app.models.base import Base
+
+class VMIDCluster(Base):
+    """已初始化VMID空闲区间的集群
+
+    初始化时先插入该行再写入区间，并在同一事务中提交；并发初始化的其他进程插入同一主键时
+    会等待前者提交，随后因主键冲突放弃，因此每个集群只会初始化一次。
+    """
+    __tablename__ = "vmid_clusters"
+    
+    cluster_name = Column(String, primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<VMIDCluster {self.cluster_name}>"
+
+class VMIDFreeRange(Base):
+    """集群中可分配的空闲VMID段
+
+    空闲VMID以闭区间 [range_start, range_end] 的形式保存，分配时从最小区间的头部切出，
+    释放时并回相邻区间。集群的区间是否已初始化记录在 vmid_clusters 中。
+    """
+    __tablename__ = "vmid_free_ranges"
+    __table_args__ = (
+        Index("ix_vmid_free_ranges_cluster_start", "cluster_name", "range_start", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, index=True)
+    cluster_name = Column(String, nullable=False)
+    range_start = Column(Integer, nullable=False)  # 起始VMID（含）
+    range_end = Column(Integer, nullable=False)  # 结束VMID（含）
+    
+    @property
+    def size(self) -> int:
+        return self.range_end - self.range_start + 1
+    
+    def __repr__(self):
+        return f"<VMIDFreeRange {self.cluster_name} {self.range_start}-{self.range_end}>"
@@ -1,15 +1,20 @@
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, JSON
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Text, JSON, Index
 from sqlalchemy.orm import relationship
 
 from backend.app.models.base import Base
 
 class VPSServer(Base):
     __tablename__ = "vps_servers"
+    __table_args__ = (
+        # VMID 只在同一集群内唯一
+        Index("uq_vps_servers_cluster_vmid", "cluster_name", "vmid", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    vmid = Column(Integer, unique=True, index=True)  # Proxmox VM ID
+    vmid = Column(Integer, index=True)  # Proxmox VM ID
+    cluster_name = Column(String, index=True, nullable=False)  # Proxmox 集群名称
     node_name = Column(String)  # Proxmox 节点名称
     user_id = Column(Integer, ForeignKey("users.id"))
     status = Column(String)  # running, stopped, suspended
@@ -26,6 +31,7 @@ class VPSServer(Base):
     
     # IP信息
     ip_allocation_id = Column(Integer, ForeignKey("ip_allocations.id"))
+    ip6_allocation_id = Column(Integer, ForeignKey("ip_allocations.id"), nullable=True)  # 双栈VPS的IPv6地址
     
     # 其他信息
     notes = Column(Text, nullable=True)
@@ -38,7 +44,8 @@ class VPSServer(Base):
     
     # 关系
     owner = relationship("User", back_populates="vps_servers")
-    ip_allocation = relationship("IPAllocation", back_populates="vps_server")
+    ip_allocation = relationship("IPAllocation", back_populates="vps_server", foreign_keys=[ip_allocation_id])
+    ip6_allocation = relationship("IPAllocation", foreign_keys=[ip6_allocation_id])
     backups = relationship("VPSBackup", back_populates="vps_server")
     
     def __repr__(self):
@@ -52,6 +59,7 @@ class VPSBackup(Base):
     backup_id = Column(String, unique=True)  # Proxmox 备份ID
     file_name = Column(String)
     file_size = Column(Float)  # MB
+    status = Column(String, default="success")  # running, success, failed
     notes = Column(Text, nullable=True)
     is_auto = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
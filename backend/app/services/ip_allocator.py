@@ -0,0 +1,150 @@
+import heapq
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy.orm import Session
+
+from backend.app.models.ip import IPPool, IPAllocation, IPFreeRange
+from backend.app.services.ip_manager import IPManagerService
+
+logger = logging.getLogger(__name__)
+
+class _PoolFreeSet:
+    """单个IP池的空闲地址集合，以区间起点为键的最小堆"""
+
+    def __init__(self, version: int, ranges: List[Tuple[int, int]]):
+        self.version = version
+        self.heap = list(ranges)
+        heapq.heapify(self.heap)
+
+    def pop(self) -> Optional[int]:
+        """取出最小的空闲地址，O(log n)"""
+        if not self.heap:
+            return None
+        range_start, range_end = self.heap[0]
+        if range_start == range_end:
+            heapq.heappop(self.heap)
+        else:
+            heapq.heapreplace(self.heap, (range_start + 1, range_end))
+        return range_start
+
+    @property
+    def available(self) -> int:
+        return sum(range_end - range_start + 1 for range_start, range_end in self.heap)
+
+class IPAllocator:
+    """进程内的IP池空闲地址缓存
+
+    每个IP池的空闲区间保存在内存堆中，分配时直接给出候选地址，
+    再由数据库通过 allocate_ip 做权威占用。IP池的 free_version 在释放、重建、
+    调整范围时递增，各进程分配前比对版本号，发现变化即重新加载该池；
+    候选地址已被其他进程占用时也会重新加载。
+    """
+
+    def __init__(self):
+        self._pools: Dict[int, _PoolFreeSet] = {}
+        self._lock = threading.Lock()
+
+    def warm_up(self, db: Session) -> int:
+        """从数据库加载所有IP池的空闲区间，返回加载的IP池数量"""
+        versions = dict(db.query(IPPool.id, IPPool.free_version).all())
+        ranges: Dict[int, List[Tuple[int, int]]] = {pool_id: [] for pool_id in versions}
+        for pool_id, range_start, range_end in db.query(
+            IPFreeRange.ip_pool_id, IPFreeRange.range_start, IPFreeRange.range_end
+        ):
+            ranges.setdefault(pool_id, []).append((range_start, range_end))
+
+        with self._lock:
+            self._pools = {
+                pool_id: _PoolFreeSet(versions.get(pool_id, 0), pool_ranges)
+                for pool_id, pool_ranges in ranges.items()
+            }
+        logger.info(f"IP分配缓存已加载 {len(self._pools)} 个IP池")
+        return len(self._pools)
+
+    def invalidate(self, ip_pool_id: Optional[int] = None) -> None:
+        """丢弃指定IP池（或全部IP池）的缓存"""
+        with self._lock:
+            if ip_pool_id is None:
+                self._pools.clear()
+            else:
+                self._pools.pop(ip_pool_id, None)
+
+    def allocate(
+        self,
+        db: Session,
+        ip_pool_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        hostname: Optional[str] = None,
+        mac_address: Optional[str] = None,
+        notes: Optional[str] = None
+    ) -> Optional[IPAllocation]:
+        """从IP池中分配一个地址
+
+        优先使用缓存给出的候选地址；候选已被其他进程占用或未指定IP池时，
+        回退到数据库的 claim_next_ip。
+        """
+        if ip_pool_id:
+            candidate = self._next_candidate(db, ip_pool_id)
+            if candidate is not None:
+                ip_address = IPManagerService._int_to_ip(candidate)
+                try:
+                    return IPManagerService.allocate_ip(
+                        db,
+                        ip_address,
+                        user_id=user_id,
+                        hostname=hostname,
+                        mac_address=mac_address,
+                        notes=notes
+                    )
+                except Exception as e:
+                    db.rollback()
+                    logger.debug(f"候选地址 {ip_address} 已被占用，重新加载IP池 {ip_pool_id}: {str(e)}")
+                    self.invalidate(ip_pool_id)
+
+        return IPManagerService.claim_next_ip(
+            db,
+            ip_pool_id=ip_pool_id,
+            user_id=user_id,
+            hostname=hostname,
+            mac_address=mac_address,
+            notes=notes
+        )
+
+    def stats(self) -> Dict[int, Dict[str, int]]:
+        """返回各IP池缓存的版本号与空闲地址数量"""
+        with self._lock:
+            return {
+                pool_id: {"version": free_set.version, "available": free_set.available}
+                for pool_id, free_set in self._pools.items()
+            }
+
+    def _next_candidate(self, db: Session, ip_pool_id: int) -> Optional[int]:
+        """取出候选地址，缓存缺失或版本落后时先重新加载"""
+        version = db.query(IPPool.free_version).filter(IPPool.id == ip_pool_id).scalar()
+        if version is None:
+            self.invalidate(ip_pool_id)
+            return None
+
+        with self._lock:
+            free_set = self._pools.get(ip_pool_id)
+            if free_set is not None and free_set.version == version:
+                return free_set.pop()
+
+        # 在锁外读取区间，加载期间其他IP池的分配不必等待
+        loaded = self._load_pool(db, ip_pool_id, version)
+        with self._lock:
+            free_set = self._pools.get(ip_pool_id)
+            # 其他线程可能已加载了同一版本或更新的版本，此时沿用它，避免同一候选地址被给出两次
+            if free_set is None or free_set.version < version:
+                free_set = self._pools[ip_pool_id] = loaded
+            return free_set.pop()
+
+    @staticmethod
+    def _load_pool(db: Session, ip_pool_id: int, version: int) -> _PoolFreeSet:
+        ranges = db.query(IPFreeRange.range_start, IPFreeRange.range_end).filter(
+            IPFreeRange.ip_pool_id == ip_pool_id
+        ).all()
+        return _PoolFreeSet(version, [tuple(r) for r in ranges])
+
+ip_allocator = IPAllocator()
@@ -0,0 +1,735 @@
+import csv
+import io
+import ipaddress
+import json
+import logging
+import re
+from collections import defaultdict
+from typing import List, Optional, Dict, Any, Tuple, Iterable, Iterator, BinaryIO
+from sqlalchemy import and_, insert, or_, select, update, delete
+from sqlalchemy.orm import Session
+
+from backend.app.models.ip import IPPool, IPAllocation, IPFreeRange
+from backend.app.models.vps import VPSServer
+from backend.app.services.ip_manager import IPManagerService
+
+logger = logging.getLogger(__name__)
+
+# 单次批量操作允许的最大地址数
+BULK_MAX_ITEMS = 4096
+
+# IN 子句每批的参数数量
+IN_CLAUSE_CHUNK = 1000
+
+# 导出时服务器端游标每次取回的行数
+EXPORT_BATCH_SIZE = 1000
+
+# 导入时每个事务处理的记录数
+IMPORT_BATCH_SIZE = 1000
+
+# 导入结果中最多返回的错误条数
+IMPORT_MAX_ERRORS = 100
+
+EXPORT_FORMATS = ["ndjson", "csv"]
+
+IP_POOL_EXPORT_COLUMNS = [
+    "id", "name", "network", "gateway", "subnet_mask", "dns_servers", "vlan_id",
+    "ip_version", "allocation_mode", "is_active", "notes"
+]
+
+IP_ALLOCATION_EXPORT_COLUMNS = [
+    "id", "ip_address", "ip_pool_id", "status", "user_id", "hostname", "mac_address",
+    "notes", "created_at", "updated_at"
+]
+
+IMPORT_FIELDS = ["user_id", "hostname", "mac_address", "notes"]
+
+class IPBulkService:
+    """IP地址批量分配、保留、释放与导入导出服务
+
+    每个批量请求在一个事务内完成：已有记录用一条集合式 UPDATE/DELETE 处理，
+    新占用的地址从空闲区间中一次性切出并用一次 executemany 写入。
+    导出通过服务器端游标逐批输出，导入按固定批次提交，内存占用与数据量无关。
+    """
+
+    @staticmethod
+    def expand_targets(
+        ip_addresses: Optional[List[str]] = None,
+        start_ip: Optional[str] = None,
+        end_ip: Optional[str] = None
+    ) -> List[str]:
+        """将地址列表与起止地址范围展开为去重后的地址列表"""
+        targets = list(ip_addresses or [])
+
+        if start_ip or end_ip:
+            if not (start_ip and end_ip):
+                raise Exception("地址范围必须同时提供 start_ip 和 end_ip")
+            try:
+                start = ipaddress.ip_address(start_ip)
+                end = ipaddress.ip_address(end_ip)
+            except ValueError as e:
+                raise Exception(f"无效的地址范围: {str(e)}")
+            if start.version != end.version or int(end) < int(start):
+                raise Exception("无效的地址范围")
+            if int(end) - int(start) + 1 > BULK_MAX_ITEMS:
+                raise Exception(f"单次最多处理 {BULK_MAX_ITEMS} 个地址")
+            targets.extend(str(ipaddress.ip_address(value)) for value in range(int(start), int(end) + 1))
+
+        if len(targets) > BULK_MAX_ITEMS:
+            raise Exception(f"单次最多处理 {BULK_MAX_ITEMS} 个地址")
+
+        return list(dict.fromkeys(targets))
+
+    @staticmethod
+    def bulk_claim(
+        db: Session,
+        ip_addresses: List[str],
+        status: str = "allocated",
+        user_id: Optional[int] = None,
+        hostname: Optional[str] = None,
+        notes: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """批量分配或保留指定地址，返回逐项结果"""
+        results: Dict[str, Dict[str, Any]] = {}
+        parsed: Dict[str, ipaddress._BaseAddress] = {}
+        keys: Dict[str, str] = {}
+        for ip_address in ip_addresses:
+            try:
+                ip = ipaddress.ip_address(ip_address)
+                parsed[str(ip)] = ip
+                keys[ip_address] = str(ip)
+            except ValueError:
+                results[ip_address] = IPBulkService._result(ip_address, False, "无效的IP地址")
+
+        try:
+            existing = IPBulkService._load_existing(db, list(parsed))
+            pool_deltas: Dict[int, int] = defaultdict(int)
+            new_rows: List[Dict[str, Any]] = []
+
+            # 旧版逐地址存储的空闲记录：一条集合式 UPDATE
+            legacy_ids = []
+            for ip_address, ip_allocation in existing.items():
+                if ip_allocation.status == "available":
+                    legacy_ids.append(ip_allocation.id)
+                    pool_deltas[ip_allocation.ip_pool_id] += 1
+                    results[ip_address] = IPBulkService._result(ip_address, True, allocation_id=ip_allocation.id)
+                else:
+                    results[ip_address] = IPBulkService._result(
+                        ip_address, False, f"已被占用，当前状态: {ip_allocation.status}"
+                    )
+            for chunk in IPBulkService._chunks(legacy_ids):
+                db.execute(
+                    update(IPAllocation)
+                    .where(IPAllocation.id.in_(chunk), IPAllocation.status == "available")
+                    .values(status=status, user_id=user_id, hostname=hostname, notes=notes)
+                    .execution_options(synchronize_session=False)
+                )
+
+            pending = {ip_address: ip for ip_address, ip in parsed.items() if ip_address not in existing}
+
+            # IPv4：从空闲区间中一次性切出
+            ipv4_ints = [int(ip) for ip in pending.values() if ip.version == 4]
+            claimed = IPBulkService._carve_many(db, ipv4_ints)
+            for ip_address, ip in pending.items():
+                if ip.version == 4:
+                    pool_id = claimed.get(int(ip))
+                else:
+                    ip_pool = IPManagerService._find_ipv6_pool(db, ip)
+                    pool_id = ip_pool.id if ip_pool else None
+
+                if pool_id is None:
+                    results[ip_address] = IPBulkService._result(ip_address, False, "地址不存在或已被占用")
+                    continue
+
+                pool_deltas[pool_id] += 1
+                new_rows.append({
+                    "ip_address": ip_address,
+                    "ip_version": ip.version,
+                    "ip_value": int(ip),
+                    "ip_pool_id": pool_id,
+                    "status": status,
+                    "user_id": user_id,
+                    "hostname": hostname,
+                    "notes": notes
+                })
+
+            for ip_address, allocation_id in IPBulkService._insert_rows(db, new_rows):
+                results[ip_address] = IPBulkService._result(ip_address, True, allocation_id=allocation_id)
+
+            for pool_id, count in pool_deltas.items():
+                IPManagerService._adjust_counters(db, pool_id, **{"available": -count, status: count})
+
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"批量{'保留' if status == 'reserved' else '分配'}IP失败: {str(e)}")
+            raise Exception(f"批量操作失败: {str(e)}")
+
+        return [
+            dict(results[keys.get(ip_address, ip_address)], ip_address=ip_address)
+            for ip_address in ip_addresses if keys.get(ip_address, ip_address) in results
+        ]
+
+    @staticmethod
+    def bulk_claim_next(
+        db: Session,
+        ip_pool_id: int,
+        count: int,
+        status: str = "allocated",
+        user_id: Optional[int] = None,
+        hostname: Optional[str] = None,
+        notes: Optional[str] = None,
+        commit: bool = True
+    ) -> List[Dict[str, Any]]:
+        """从IP池中一次占用 count 个空闲地址；可用地址不足时整体失败
+
+        commit 为 False 时只写入不提交，由调用方与其他记录放在同一个事务中提交。
+        """
+        if count > BULK_MAX_ITEMS:
+            raise Exception(f"单次最多处理 {BULK_MAX_ITEMS} 个地址")
+
+        ip_pool = IPManagerService.get_ip_pool_by_id(db, ip_pool_id)
+        if not ip_pool:
+            raise Exception(f"找不到ID为 {ip_pool_id} 的IP池")
+
+        try:
+            if ip_pool.ip_version == 6:
+                addresses = []
+                for _ in range(count):
+                    ip_allocation = IPManagerService._claim_ipv6(db, ip_pool, status)
+                    if not ip_allocation:
+                        break
+                    ip_allocation.user_id = user_id
+                    ip_allocation.hostname = hostname
+                    ip_allocation.notes = notes
+                    db.flush()
+                    addresses.append(ip_allocation)
+                if len(addresses) < count:
+                    raise Exception(f"IP池中只有 {len(addresses)} 个可用地址")
+                results = [
+                    IPBulkService._result(ip_allocation.ip_address, True, allocation_id=ip_allocation.id)
+                    for ip_allocation in addresses
+                ]
+            else:
+                ip_ints = IPBulkService._take_from_head(db, ip_pool_id, count)
+                if len(ip_ints) < count:
+                    raise Exception(f"IP池中只有 {len(ip_ints)} 个可用地址")
+                new_rows = [
+                    {
+                        "ip_address": IPManagerService._int_to_ip(ip_int),
+                        "ip_version": 4,
+                        "ip_value": ip_int,
+                        "ip_pool_id": ip_pool_id,
+                        "status": status,
+                        "user_id": user_id,
+                        "hostname": hostname,
+                        "notes": notes
+                    }
+                    for ip_int in ip_ints
+                ]
+                results = [
+                    IPBulkService._result(ip_address, True, allocation_id=allocation_id)
+                    for ip_address, allocation_id in IPBulkService._insert_rows(db, new_rows)
+                ]
+
+            IPManagerService._adjust_counters(db, ip_pool_id, **{"available": -count, status: count})
+            if commit:
+                db.commit()
+            else:
+                db.flush()
+            return results
+        except Exception as e:
+            db.rollback()
+            logger.error(f"从IP池 {ip_pool_id} 批量占用地址失败: {str(e)}")
+            raise Exception(f"批量操作失败: {str(e)}")
+
+    @staticmethod
+    def bulk_release(db: Session, ip_addresses: List[str]) -> List[Dict[str, Any]]:
+        """批量释放地址，返回逐项结果"""
+        results: Dict[str, Dict[str, Any]] = {}
+        normalized: Dict[str, str] = {}
+        for ip_address in ip_addresses:
+            try:
+                normalized[ip_address] = str(ipaddress.ip_address(ip_address))
+            except ValueError:
+                results[ip_address] = IPBulkService._result(ip_address, False, "无效的IP地址")
+
+        try:
+            existing = IPBulkService._load_existing(db, list(normalized.values()))
+            # 先取出快照：后续的集合式删除会使会话中的对象失效
+            released: List[Tuple[int, int, str, str]] = []
+            for ip_address, key in normalized.items():
+                ip_allocation = existing.get(key)
+                if not ip_allocation:
+                    results[ip_address] = IPBulkService._result(ip_address, False, "地址不存在")
+                elif ip_allocation.status == "available":
+                    results[ip_address] = IPBulkService._result(ip_address, False, "已经是可用状态")
+                else:
+                    released.append((
+                        ip_allocation.id, ip_allocation.ip_pool_id, ip_allocation.status, ip_allocation.ip_address
+                    ))
+                    results[ip_address] = IPBulkService._result(ip_address, True, allocation_id=ip_allocation.id)
+
+            ids = [allocation_id for allocation_id, _, _, _ in released]
+            for chunk in IPBulkService._chunks(ids):
+                db.execute(
+                    update(VPSServer).where(VPSServer.ip_allocation_id.in_(chunk))
+                    .values(ip_allocation_id=None).execution_options(synchronize_session=False)
+                )
+                db.execute(
+                    update(VPSServer).where(VPSServer.ip6_allocation_id.in_(chunk))
+                    .values(ip6_allocation_id=None).execution_options(synchronize_session=False)
+                )
+                db.execute(
+                    delete(IPAllocation).where(IPAllocation.id.in_(chunk))
+                    .execution_options(synchronize_session=False)
+                )
+
+            by_pool: Dict[int, List[Tuple[str, str]]] = defaultdict(list)
+            for _, pool_id, previous_status, ip_address in released:
+                by_pool[pool_id].append((previous_status, ip_address))
+            for pool_id, entries in by_pool.items():
+                addresses = [ipaddress.ip_address(ip_address) for _, ip_address in entries]
+                IPBulkService._merge_many(db, pool_id, [int(ip) for ip in addresses if ip.version == 4])
+                deltas: Dict[str, int] = defaultdict(int)
+                for previous_status, _ in entries:
+                    deltas[previous_status] -= 1
+                    deltas["available"] += 1
+                IPManagerService._adjust_counters(db, pool_id, **deltas)
+                IPManagerService._bump_free_version(db, pool_id)
+
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"批量释放IP失败: {str(e)}")
+            raise Exception(f"批量操作失败: {str(e)}")
+
+        return [results[ip_address] for ip_address in ip_addresses if ip_address in results]
+
+    @staticmethod
+    def export_ip_pools(db: Session, fmt: str = "ndjson") -> Iterator[str]:
+        """以 NDJSON 或 CSV 流式导出IP池"""
+        columns = [getattr(IPPool, column) for column in IP_POOL_EXPORT_COLUMNS]
+        statement = select(*columns).order_by(IPPool.id)
+        return IPBulkService._stream_rows(db, statement, IP_POOL_EXPORT_COLUMNS, fmt)
+
+    @staticmethod
+    def export_ip_allocations(
+        db: Session,
+        ip_pool_id: Optional[int] = None,
+        status: Optional[str] = None,
+        fmt: str = "ndjson"
+    ) -> Iterator[str]:
+        """以 NDJSON 或 CSV 流式导出IP分配记录，按地址数值排序"""
+        columns = [getattr(IPAllocation, column) for column in IP_ALLOCATION_EXPORT_COLUMNS]
+        statement = select(*columns).order_by(IPAllocation.ip_version, IPAllocation.ip_value)
+        if ip_pool_id:
+            statement = statement.where(IPAllocation.ip_pool_id == ip_pool_id)
+        if status:
+            statement = statement.where(IPAllocation.status == status)
+        return IPBulkService._stream_rows(db, statement, IP_ALLOCATION_EXPORT_COLUMNS, fmt)
+
+    @staticmethod
+    def read_import_records(stream: BinaryIO, fmt: str = "ndjson") -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+        """逐行解析上传的 NDJSON 或 CSV 文件，返回 (行号, 记录)，无法解析的行记录为 None"""
+        if fmt not in EXPORT_FORMATS:
+            raise Exception(f"格式必须是以下之一: {', '.join(EXPORT_FORMATS)}")
+
+        text = io.TextIOWrapper(stream, encoding="utf-8-sig", newline="")
+        if fmt == "csv":
+            reader = csv.DictReader(text)
+            for record in reader:
+                yield reader.line_num, record
+            return
+
+        for line_no, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield line_no, record if isinstance(record, dict) else None
+
+    @staticmethod
+    def import_ip_allocations(
+        db: Session,
+        records: Iterable[Tuple[int, Optional[Dict[str, Any]]]],
+        batch_size: int = IMPORT_BATCH_SIZE
+    ) -> Dict[str, Any]:
+        """按批次校验并写入（upsert）IP分配记录
+
+        已存在的已分配/保留记录更新状态与附加字段；新地址从所属IP池的空闲区间中切出。
+        每个批次单独提交，某个批次失败时回滚该批次并继续处理后续批次。
+        状态为 available 的记录表示空闲地址，直接跳过。
+        """
+        summary = {"processed": 0, "created": 0, "updated": 0, "skipped": 0, "failed": 0, "errors": []}
+
+        def add_error(line_no: int, message: str) -> None:
+            summary["failed"] += 1
+            if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+                summary["errors"].append({"line": line_no, "message": message})
+
+        batch: Dict[str, Tuple[int, Dict[str, Any]]] = {}
+        iterator = iter(records)
+        while True:
+            batch.clear()
+            for line_no, record in iterator:
+                summary["processed"] += 1
+                try:
+                    parsed = IPBulkService._parse_import_record(record)
+                except Exception as e:
+                    add_error(line_no, str(e))
+                    continue
+                if parsed is None:
+                    summary["skipped"] += 1
+                    continue
+                # 同一批次中重复的地址以最后一条为准
+                if parsed["ip_address"] in batch:
+                    summary["skipped"] += 1
+                batch[parsed["ip_address"]] = (line_no, parsed)
+                if len(batch) >= batch_size:
+                    break
+
+            if not batch:
+                return summary
+
+            try:
+                created, updated, errors = IPBulkService._import_batch(db, batch)
+                db.commit()
+                summary["created"] += created
+                summary["updated"] += updated
+                for line_no, message in errors:
+                    add_error(line_no, message)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"导入IP分配记录失败: {str(e)}")
+                for line_no, _ in batch.values():
+                    add_error(line_no, f"批次写入失败: {str(e)}")
+
+    @staticmethod
+    def summarize(items: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """汇总逐项结果"""
+        succeeded = sum(1 for item in items if item["success"])
+        return {
+            "requested": len(items),
+            "succeeded": succeeded,
+            "failed": len(items) - succeeded,
+            "items": items
+        }
+
+    @staticmethod
+    def _stream_rows(db: Session, statement, columns: List[str], fmt: str) -> Iterator[str]:
+        if fmt not in EXPORT_FORMATS:
+            raise Exception(f"格式必须是以下之一: {', '.join(EXPORT_FORMATS)}")
+
+        def generate() -> Iterator[str]:
+            # yield_per 使用服务器端游标，每次只在内存中保留一个批次
+            result = db.execute(statement.execution_options(yield_per=EXPORT_BATCH_SIZE))
+            if fmt == "csv":
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
+                writer.writerow(columns)
+                for partition in result.partitions():
+                    writer.writerows(partition)
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate(0)
+                if buffer.tell():
+                    yield buffer.getvalue()
+                return
+
+            for partition in result.partitions():
+                yield "".join(
+                    json.dumps(dict(zip(columns, row)), default=str, ensure_ascii=False) + "\n"
+                    for row in partition
+                )
+
+        return generate()
+
+    @staticmethod
+    def _parse_import_record(record: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """校验并规范化一条导入记录；空闲地址返回 None"""
+        if record is None:
+            raise Exception("无法解析的记录")
+
+        try:
+            ip_address = str(ipaddress.ip_address(str(record.get("ip_address") or "").strip()))
+        except ValueError:
+            raise Exception(f"无效的IP地址: {record.get('ip_address')}")
+
+        status = (record.get("status") or "allocated").strip()
+        if status == "available":
+            return None
+        if status not in ["allocated", "reserved"]:
+            raise Exception(f"无效的状态: {status}")
+
+        parsed = {"ip_address": ip_address, "status": status}
+        for field in IMPORT_FIELDS:
+            value = record.get(field)
+            # CSV 中的空字段视为未设置
+            parsed[field] = value if value not in ("", None) else None
+        if parsed["mac_address"] is not None and not re.match(
+            r'^([0-9A-Fa-f]{2}[:-]){5}([0-9A-Fa-f]{2})$', parsed["mac_address"]
+        ):
+            raise Exception(f"无效的MAC地址: {parsed['mac_address']}")
+        if parsed["user_id"] is not None:
+            try:
+                parsed["user_id"] = int(parsed["user_id"])
+            except (TypeError, ValueError):
+                raise Exception(f"无效的用户ID: {parsed['user_id']}")
+        return parsed
+
+    @staticmethod
+    def _import_batch(
+        db: Session,
+        batch: Dict[str, Tuple[int, Dict[str, Any]]]
+    ) -> Tuple[int, int, List[Tuple[int, str]]]:
+        """写入一个批次（不提交事务），返回 (新建数, 更新数, 错误列表)"""
+        existing = IPBulkService._load_existing(db, list(batch))
+        pool_deltas: Dict[int, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        updates = []
+        for ip_address, ip_allocation in existing.items():
+            _, parsed = batch[ip_address]
+            updates.append(dict({field: parsed[field] for field in IMPORT_FIELDS}, id=ip_allocation.id, status=parsed["status"]))
+            if ip_allocation.status != parsed["status"]:
+                pool_deltas[ip_allocation.ip_pool_id][ip_allocation.status] -= 1
+                pool_deltas[ip_allocation.ip_pool_id][parsed["status"]] += 1
+        if updates:
+            # 按主键批量更新
+            db.execute(update(IPAllocation), updates)
+
+        pending = {
+            ip_address: ipaddress.ip_address(ip_address)
+            for ip_address in batch if ip_address not in existing
+        }
+        claimed = IPBulkService._carve_many(db, [int(ip) for ip in pending.values() if ip.version == 4])
+
+        errors = []
+        new_rows = []
+        for ip_address, ip in pending.items():
+            line_no, parsed = batch[ip_address]
+            if ip.version == 4:
+                pool_id = claimed.get(int(ip))
+            else:
+                ip_pool = IPManagerService._find_ipv6_pool(db, ip)
+                pool_id = ip_pool.id if ip_pool else None
+            if pool_id is None:
+                errors.append((line_no, f"地址 {ip_address} 不属于任何IP池或不可分配"))
+                continue
+
+            pool_deltas[pool_id]["available"] -= 1
+            pool_deltas[pool_id][parsed["status"]] += 1
+            new_rows.append(dict(parsed, ip_version=ip.version, ip_value=int(ip), ip_pool_id=pool_id))
+
+        IPBulkService._insert_rows(db, new_rows)
+
+        for pool_id, deltas in pool_deltas.items():
+            IPManagerService._adjust_counters(db, pool_id, **deltas)
+            IPManagerService._bump_free_version(db, pool_id)
+
+        return len(new_rows), len(updates), errors
+
+    @staticmethod
+    def _load_existing(db: Session, ip_addresses: List[str]) -> Dict[str, IPAllocation]:
+        """按地址批量读取已有记录并加锁"""
+        existing = {}
+        for chunk in IPBulkService._chunks(ip_addresses):
+            for ip_allocation in db.query(IPAllocation).filter(
+                IPAllocation.ip_address.in_(chunk)
+            ).with_for_update():
+                existing[ip_allocation.ip_address] = ip_allocation
+        return existing
+
+    @staticmethod
+    def _carve_many(db: Session, ip_ints: List[int]) -> Dict[int, int]:
+        """从空闲区间中切出一组IPv4地址，返回 {地址整数: IP池ID}
+
+        地址先按所属IP池分组，每个IP池只锁定包含请求地址的区间，
+        删除受影响的区间后整体写回剩余部分，不会阻塞其他IP池或同一池中无关区间上的操作。
+        """
+        if not ip_ints:
+            return {}
+
+        claimed: Dict[int, int] = {}
+        replacements = []
+        affected_ids = []
+        for ip_pool_id, pool_ints in IPBulkService._group_by_pool(db, sorted(set(ip_ints))).items():
+            ranges = IPBulkService._lock_ranges(db, ip_pool_id, [(ip_int, ip_int) for ip_int in pool_ints])
+            IPBulkService._carve_pool(ranges, pool_ints, claimed, affected_ids, replacements)
+
+        IPBulkService._replace_ranges(db, affected_ids, replacements)
+        return claimed
+
+    @staticmethod
+    def _carve_pool(
+        ranges: List[IPFreeRange],
+        ip_ints: List[int],
+        claimed: Dict[int, int],
+        affected_ids: List[int],
+        replacements: List[Dict[str, Any]]
+    ) -> None:
+        """在一个IP池的升序区间中找出请求的地址，记录被占用的地址、受影响的区间和剩余部分"""
+        index = 0
+        for free_range in ranges:
+            while index < len(ip_ints) and ip_ints[index] < free_range.range_start:
+                index += 1
+            hits = []
+            while index < len(ip_ints) and ip_ints[index] <= free_range.range_end:
+                hits.append(ip_ints[index])
+                index += 1
+            if not hits:
+                continue
+
+            affected_ids.append(free_range.id)
+            for ip_int in hits:
+                claimed[ip_int] = free_range.ip_pool_id
+            for range_start, range_end in IPManagerService._subtract_addresses(
+                [(free_range.range_start, free_range.range_end)], hits
+            ):
+                replacements.append({
+                    "ip_pool_id": free_range.ip_pool_id,
+                    "range_start": range_start,
+                    "range_end": range_end
+                })
+
+    @staticmethod
+    def _group_by_pool(db: Session, ip_ints: List[int]) -> Dict[int, List[int]]:
+        """按所属的IPv4池对升序地址分组，不属于任何IP池的地址被忽略"""
+        pools = db.query(IPPool.id, IPPool.network_start, IPPool.network_end).filter(
+            IPPool.ip_version == 4,
+            IPPool.network_start <= ip_ints[-1],
+            IPPool.network_end >= ip_ints[0]
+        ).order_by(IPPool.network_start).all()
+
+        groups: Dict[int, List[int]] = {}
+        index = 0
+        for ip_pool_id, network_start, network_end in pools:
+            while index < len(ip_ints) and ip_ints[index] < network_start:
+                index += 1
+            while index < len(ip_ints) and ip_ints[index] <= network_end:
+                groups.setdefault(ip_pool_id, []).append(ip_ints[index])
+                index += 1
+        return groups
+
+    @staticmethod
+    def _lock_ranges(db: Session, ip_pool_id: int, spans: List[Tuple[int, int]], margin: int = 0) -> List[IPFreeRange]:
+        """锁定并按起点升序返回IP池中与 spans 重叠的空闲区间；margin 为 1 时也包括紧邻的区间"""
+        found: Dict[int, IPFreeRange] = {}
+        for chunk in IPBulkService._chunks(IPBulkService._coalesce(spans)):
+            for free_range in db.query(IPFreeRange).filter(
+                IPFreeRange.ip_pool_id == ip_pool_id,
+                or_(*(
+                    and_(IPFreeRange.range_start <= span_end + margin, IPFreeRange.range_end >= span_start - margin)
+                    for span_start, span_end in chunk
+                ))
+            ).order_by(IPFreeRange.range_start).with_for_update():
+                found[free_range.id] = free_range
+        return sorted(found.values(), key=lambda free_range: free_range.range_start)
+
+    @staticmethod
+    def _take_from_head(db: Session, ip_pool_id: int, count: int) -> List[int]:
+        """按地址顺序从IP池头部取出最多 count 个空闲地址"""
+        taken: List[int] = []
+        affected_ids = []
+        replacements = []
+        last_start = -1
+
+        while len(taken) < count:
+            page = db.query(IPFreeRange).filter(
+                IPFreeRange.ip_pool_id == ip_pool_id,
+                IPFreeRange.range_start > last_start
+            ).order_by(IPFreeRange.range_start).limit(100).with_for_update().all()
+            if not page:
+                break
+
+            for free_range in page:
+                need = count - len(taken)
+                if need <= 0:
+                    break
+                affected_ids.append(free_range.id)
+                take_end = min(free_range.range_end, free_range.range_start + need - 1)
+                taken.extend(range(free_range.range_start, take_end + 1))
+                if take_end < free_range.range_end:
+                    replacements.append({
+                        "ip_pool_id": ip_pool_id,
+                        "range_start": take_end + 1,
+                        "range_end": free_range.range_end
+                    })
+            last_start = page[-1].range_start
+
+        IPBulkService._replace_ranges(db, affected_ids, replacements)
+        return taken
+
+    @staticmethod
+    def _merge_many(db: Session, ip_pool_id: int, ip_ints: List[int]) -> None:
+        """将一组IPv4地址归还到IP池的空闲区间，并与相邻区间合并"""
+        if not ip_ints:
+            return
+
+        spans = [(ip_int, ip_int) for ip_int in sorted(set(ip_ints))]
+        # 只锁定与归还地址重叠或紧邻的区间
+        neighbours = IPBulkService._lock_ranges(db, ip_pool_id, spans, margin=1)
+
+        spans.extend((free_range.range_start, free_range.range_end) for free_range in neighbours)
+        merged = IPBulkService._coalesce(spans)
+
+        IPBulkService._replace_ranges(db, [free_range.id for free_range in neighbours], [
+            {"ip_pool_id": ip_pool_id, "range_start": range_start, "range_end": range_end}
+            for range_start, range_end in merged
+        ])
+
+    @staticmethod
+    def _replace_ranges(db: Session, range_ids: List[int], replacements: List[Dict[str, Any]]) -> None:
+        """删除一组空闲区间并写入替换后的区间"""
+        for chunk in IPBulkService._chunks(range_ids):
+            db.execute(
+                delete(IPFreeRange).where(IPFreeRange.id.in_(chunk))
+                .execution_options(synchronize_session=False)
+            )
+        if replacements:
+            db.execute(insert(IPFreeRange.__table__), replacements)
+        db.expire_all()
+
+    @staticmethod
+    def _insert_rows(db: Session, rows: List[Dict[str, Any]]) -> List[Tuple[str, int]]:
+        """用一次 executemany 写入分配记录，返回 (地址, 记录ID) 列表"""
+        if not rows:
+            return []
+        result = db.execute(
+            insert(IPAllocation.__table__).returning(
+                IPAllocation.__table__.c.ip_address, IPAllocation.__table__.c.id
+            ),
+            rows
+        )
+        return [(row.ip_address, row.id) for row in result]
+
+    @staticmethod
+    def _coalesce(spans: Iterable[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """合并重叠或相邻的区间"""
+        merged: List[List[int]] = []
+        for range_start, range_end in sorted(spans):
+            if merged and range_start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], range_end)
+            else:
+                merged.append([range_start, range_end])
+        return [(range_start, range_end) for range_start, range_end in merged]
+
+    @staticmethod
+    def _chunks(values: List[Any]) -> Iterable[List[Any]]:
+        for index in range(0, len(values), IN_CLAUSE_CHUNK):
+            yield values[index:index + IN_CLAUSE_CHUNK]
+
+    @staticmethod
+    def _result(
+        ip_address: str,
+        success: bool,
+        message: Optional[str] = None,
+        allocation_id: Optional[int] = None
+    ) -> Dict[str, Any]:
+        return {
+            "ip_address": ip_address,
+            "success": success,
+            "message": message,
+            "allocation_id": allocation_id
+        }
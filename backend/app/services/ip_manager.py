@@ -1,13 +1,39 @@
 import ipaddress
 import logging
-from typing import List, Optional, Dict, Any, Tuple
+import random
+from itertools import islice
+from typing import List, Optional, Dict, Any, Tuple, Iterable, Callable, Union
+from sqlalchemy import Table, func, insert, select, update, delete
 from sqlalchemy.orm import Session
 
-from backend.app.models.ip import IPPool, IPAllocation
+from backend.app.models.ip import IPPool, IPAllocation, IPFreeRange, IPPoolCounter
+from backend.app.models.vps import VPSServer
 from backend.app.core.config import settings
+from backend.app.core.database import SessionLocal
+from backend.app.services.job import JobService
 
 logger = logging.getLogger(__name__)
 
+# 批量写入时每个批次的行数
+BULK_CHUNK_SIZE = 5000
+
+# 不支持 UPDATE ... RETURNING 的数据库上，乐观抢占的最大重试次数
+CLAIM_MAX_RETRIES = 20
+
+# IPv6池随机分配时的最大尝试次数，超过后退回顺序分配
+IPV6_RANDOM_ATTEMPTS = 16
+
+# IPv6池顺序分配时单次最多跳过的已占用地址数
+IPV6_SCAN_LIMIT = 4096
+
+ALLOCATION_MODES = ["sequential", "random"]
+
+# 单次连续地址块分配的最大地址数
+BLOCK_MAX_SIZE = 4096
+
+# 每个IP池的计数器分片数，并发分配随机更新其中一个分片
+COUNTER_SHARDS = 8
+
 class IPManagerService:
     """IP地址管理服务"""
     
@@ -20,12 +46,29 @@ class IPManagerService:
         subnet_mask: str,
         dns_servers: str,
         vlan_id: Optional[int] = None,
-        notes: Optional[str] = None
+        notes: Optional[str] = None,
+        allocation_mode: str = "sequential"
     ) -> IPPool:
-        """创建IP地址池"""
+        """创建IP地址池
+        
+        IPv4空闲地址以整数区间形式保存在 ip_free_ranges 中，
+        创建 /24 与 /12 的开销相同，不会为每个主机地址生成记录。
+        IPv6池不做任何展开，地址在分配时从游标或随机偏移按需生成。
+        """
         try:
             # 验证网络参数
-            net = ipaddress.IPv4Network(f"{network}/{subnet_mask}", strict=False)
+            net = IPManagerService._parse_network(network, subnet_mask)
+            if allocation_mode not in ALLOCATION_MODES:
+                raise Exception(f"分配方式必须是以下之一: {', '.join(ALLOCATION_MODES)}")
+            
+            # 检查是否与已有IP池重叠（按整数地址范围做索引查询）
+            existing_pool = db.query(IPPool).filter(
+                IPPool.ip_version == net.version,
+                IPPool.network_start <= int(net.broadcast_address),
+                IPPool.network_end >= int(net.network_address)
+            ).first()
+            if existing_pool:
+                raise Exception(f"网络 {net} 与IP池 {existing_pool.name} ({existing_pool.network}) 重叠")
             
             # 创建IP池
             ip_pool = IPPool(
@@ -35,43 +78,263 @@ class IPManagerService:
                 subnet_mask=subnet_mask,
                 dns_servers=dns_servers,
                 vlan_id=vlan_id,
-                notes=notes
+                notes=notes,
+                ip_version=net.version,
+                allocation_mode=allocation_mode
             )
             db.add(ip_pool)
+            db.flush()
+            
+            if net.version == 6:
+                # IPv6池的总量与可用量按前缀长度计算，计数器只记录已占用的地址
+                IPManagerService._add_counter_shards(db, ip_pool.id)
+                db.commit()
+                db.refresh(ip_pool)
+                return ip_pool
+            
+            # 以区间形式记录空闲地址（排除网关）
+            host_ranges = IPManagerService._get_host_ranges(net, gateway)
+            for range_start, range_end in host_ranges:
+                db.add(IPFreeRange(
+                    ip_pool_id=ip_pool.id,
+                    range_start=range_start,
+                    range_end=range_end
+                ))
+            
+            size = sum(range_end - range_start + 1 for range_start, range_end in host_ranges)
+            IPManagerService._add_counter_shards(db, ip_pool.id, total=size, available=size)
+            
             db.commit()
             db.refresh(ip_pool)
+            return ip_pool
             
-            # 创建该网络内的所有IP记录
-            ip_list = list(net.hosts())
+        except Exception as e:
+            db.rollback()
+            logger.error(f"创建IP池失败: {str(e)}")
+            raise Exception(f"创建IP池失败: {str(e)}")
+    
+    @staticmethod
+    def resize_ip_pool(
+        db: Session,
+        ip_pool_id: int,
+        network: Optional[str] = None,
+        subnet_mask: Optional[str] = None,
+        gateway: Optional[str] = None
+    ) -> IPPool:
+        """在线调整IP池的网络范围或网关
+        
+        只计算新旧主机地址集合的差异区间：扩容时插入新增的空闲区间，缩容时删除被移出的
+        空闲区间；被移出的部分中有已分配或保留的地址时拒绝操作。已有分配记录保持不变，
+        计数器按差异增量更新。
+        """
+        try:
+            ip_pool = db.query(IPPool).filter(IPPool.id == ip_pool_id).with_for_update().first()
+            if not ip_pool:
+                raise Exception(f"找不到ID为 {ip_pool_id} 的IP池")
             
-            # 排除网关
-            try:
-                gateway_ip = ipaddress.IPv4Address(gateway)
-                if gateway_ip in ip_list:
-                    ip_list.remove(gateway_ip)
-            except ValueError:
-                logger.warning(f"无效的网关地址: {gateway}")
+            old_net = ipaddress.ip_network(ip_pool.network, strict=False)
+            if network and "/" in network and not subnet_mask:
+                # 网络地址带前缀长度时，子网掩码按原有的表示方式换算
+                parsed = ipaddress.ip_network(network, strict=False)
+                subnet_mask = str(parsed.netmask) if parsed.version == 4 else str(parsed.prefixlen)
+            new_subnet_mask = subnet_mask or ip_pool.subnet_mask
+            new_net = IPManagerService._parse_network(
+                network.split("/")[0] if network else str(old_net.network_address), new_subnet_mask
+            )
+            new_gateway = gateway or ip_pool.gateway
+            if new_net.version != old_net.version:
+                raise Exception("不能修改IP池的地址族")
+            if ipaddress.ip_address(new_gateway) not in new_net:
+                raise Exception(f"网关 {new_gateway} 不在网络 {new_net} 内")
             
-            # 批量创建IP分配记录
-            for ip in ip_list:
-                ip_allocation = IPAllocation(
-                    ip_address=str(ip),
-                    ip_pool_id=ip_pool.id,
-                    status="available"
+            existing_pool = db.query(IPPool).filter(
+                IPPool.id != ip_pool_id,
+                IPPool.ip_version == new_net.version,
+                IPPool.network_start <= int(new_net.broadcast_address),
+                IPPool.network_end >= int(new_net.network_address)
+            ).first()
+            if existing_pool:
+                raise Exception(f"网络 {new_net} 与IP池 {existing_pool.name} ({existing_pool.network}) 重叠")
+            
+            if new_net.version == 6:
+                old_hosts = [(int(old_net.network_address), int(old_net.broadcast_address))]
+                new_hosts = [(int(new_net.network_address), int(new_net.broadcast_address))]
+            else:
+                old_hosts = IPManagerService._get_host_ranges(old_net, ip_pool.gateway)
+                new_hosts = IPManagerService._get_host_ranges(new_net, new_gateway)
+            added = IPManagerService._subtract_ranges(new_hosts, old_hosts)
+            removed = IPManagerService._subtract_ranges(old_hosts, new_hosts)
+            if new_net.version == 6 and new_gateway != ip_pool.gateway:
+                removed.append((int(ipaddress.ip_address(new_gateway)),) * 2)
+            
+            # 被移出的地址中不能有已分配或保留的记录
+            for range_start, range_end in removed:
+                in_range = (
+                    IPAllocation.ip_pool_id == ip_pool_id,
+                    IPAllocation.ip_version == new_net.version,
+                    IPAllocation.ip_value >= range_start,
+                    IPAllocation.ip_value <= range_end
                 )
-                db.add(ip_allocation)
+                occupied = db.query(IPAllocation.ip_address).filter(
+                    *in_range, IPAllocation.status != "available"
+                ).first()
+                if occupied:
+                    raise Exception(f"地址 {occupied.ip_address} 已被占用，不能从IP池中移除")
+                # 旧版逐地址存储的空闲记录
+                db.query(IPAllocation).filter(*in_range).delete(synchronize_session=False)
+            
+            if new_net.version == 4:
+                IPManagerService._remove_free_ranges(db, ip_pool_id, removed)
+                IPManagerService._add_free_ranges(db, ip_pool_id, added)
+                delta = sum(end - start + 1 for start, end in added) - sum(end - start + 1 for start, end in removed)
+                IPManagerService._adjust_counters(db, ip_pool_id, total=delta, available=delta)
+            elif new_net.network_address != old_net.network_address:
+                # IPv6游标是相对网络地址的偏移，网络地址变化后从头开始
+                ip_pool.next_cursor = None
+            
+            ip_pool.network = str(new_net)
+            ip_pool.subnet_mask = new_subnet_mask
+            ip_pool.gateway = new_gateway
+            IPManagerService._bump_free_version(db, ip_pool_id)
             
             db.commit()
+            db.refresh(ip_pool)
             return ip_pool
+        except Exception as e:
+            db.rollback()
+            logger.error(f"调整IP池 {ip_pool_id} 失败: {str(e)}")
+            raise Exception(f"调整IP池失败: {str(e)}")
+    
+    @staticmethod
+    def rebuild_free_ranges(
+        db: Session,
+        ip_pool_id: int,
+        chunk_size: int = BULK_CHUNK_SIZE,
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> int:
+        """根据已分配/保留的记录重建IP池的空闲区间
+        
+        用于将旧版逐地址存储的IP池（每个地址一条 available 记录）转换为区间存储，
+        也可用于修复不一致的空闲区间。旧记录按 chunk_size 分批转换并逐批提交：每批在同一事务中
+        删除旧记录并写入对应的空闲区间，转换过程中每个空闲地址始终可以分配。
+        progress 回调接收 (已处理数量, 总数量)。返回重建后的区间数量。
+        """
+        ip_pool = db.query(IPPool).filter(IPPool.id == ip_pool_id).first()
+        if not ip_pool:
+            raise Exception(f"找不到ID为 {ip_pool_id} 的IP池")
+        
+        if ip_pool.ip_version == 6:
+            # IPv6池没有空闲区间，只需重建计数器
+            IPManagerService.rebuild_ip_usage_counters(db, ip_pool_id)
+            if progress:
+                progress(0, 0)
+            return 0
+        
+        try:
+            net = ipaddress.IPv4Network(ip_pool.network, strict=False)
+            legacy_query = db.query(IPAllocation.id, IPAllocation.ip_address).filter(
+                IPAllocation.ip_pool_id == ip_pool_id,
+                IPAllocation.status == "available"
+            ).order_by(IPAllocation.id)
+            total = legacy_query.count()
+            
+            # 分批把旧的逐地址空闲记录换成空闲区间，避免单个超大事务
+            processed = 0
+            while True:
+                rows = legacy_query.limit(chunk_size).all()
+                if not rows:
+                    break
+                db.query(IPAllocation).filter(
+                    IPAllocation.id.in_([row_id for row_id, _ in rows])
+                ).delete(synchronize_session=False)
+                IPManagerService._add_free_ranges(db, ip_pool_id, IPManagerService._address_ranges(
+                    IPManagerService._ip_to_int(ip_address) for _, ip_address in rows
+                ))
+                db.commit()
+                processed += len(rows)
+                if progress:
+                    progress(processed, total)
             
+            # 在单个事务内用已占用地址重新计算空闲区间
+            db.query(IPFreeRange).filter(
+                IPFreeRange.ip_pool_id == ip_pool_id
+            ).delete(synchronize_session=False)
+            
+            used = (
+                IPManagerService._ip_to_int(ip_address)
+                for (ip_address,) in db.query(IPAllocation.ip_address).filter(
+                    IPAllocation.ip_pool_id == ip_pool_id
+                ).yield_per(chunk_size)
+            )
+            ranges = IPManagerService._subtract_addresses(
+                IPManagerService._get_host_ranges(net, ip_pool.gateway), used
+            )
+            IPManagerService._bulk_insert(
+                db,
+                IPFreeRange.__table__,
+                (
+                    {"ip_pool_id": ip_pool_id, "range_start": range_start, "range_end": range_end}
+                    for range_start, range_end in ranges
+                ),
+                chunk_size=chunk_size
+            )
+            IPManagerService._bump_free_version(db, ip_pool_id)
+            db.flush()
+            IPManagerService._rebuild_counters(db, ip_pool_id)
+            
+            db.commit()
+            if progress:
+                progress(total, total)
+            return len(ranges)
         except Exception as e:
             db.rollback()
-            logger.error(f"创建IP池失败: {str(e)}")
-            raise Exception(f"创建IP池失败: {str(e)}")
+            logger.error(f"重建IP池 {ip_pool_id} 空闲区间失败: {str(e)}")
+            raise Exception(f"重建IP池空闲区间失败: {str(e)}")
+    
+    @staticmethod
+    def run_rebuild_free_ranges_job(job_id: int, chunk_size: int = BULK_CHUNK_SIZE) -> None:
+        """在独立会话中执行空闲区间重建任务，并通过任务记录上报进度"""
+        db = SessionLocal()
+        try:
+            job = JobService.get_job(db, job_id)
+            if not job:
+                logger.warning(f"找不到任务 {job_id}")
+                return
+            
+            JobService.start_job(db, job)
+            try:
+                range_count = IPManagerService.rebuild_free_ranges(
+                    db,
+                    job.target_id,
+                    chunk_size=chunk_size,
+                    progress=lambda processed, total: JobService.update_progress(db, job, processed, total)
+                )
+                JobService.finish_job(db, job, {"free_ranges": range_count})
+            except Exception as e:
+                JobService.fail_job(db, job, str(e))
+        finally:
+            db.close()
     
     @staticmethod
     def get_available_ip(db: Session, ip_pool_id: Optional[int] = None) -> Optional[IPAllocation]:
-        """获取一个可用的IP地址"""
+        """获取一个可用的IP地址
+        
+        返回的记录尚未写入数据库，需要通过 allocate_ip 或 reserve_ip 正式占用。
+        """
+        query = db.query(IPFreeRange)
+        
+        if ip_pool_id:
+            query = query.filter(IPFreeRange.ip_pool_id == ip_pool_id)
+        
+        free_range = query.order_by(IPFreeRange.ip_pool_id, IPFreeRange.range_start).first()
+        if free_range:
+            return IPAllocation(
+                ip_address=IPManagerService._int_to_ip(free_range.range_start),
+                ip_pool_id=free_range.ip_pool_id,
+                status="available"
+            )
+        
+        # 兼容尚未转换为区间存储的旧IP池
         query = db.query(IPAllocation).filter(IPAllocation.status == "available")
         
         if ip_pool_id:
@@ -79,6 +342,50 @@ class IPManagerService:
         
         return query.first()
     
+    @staticmethod
+    def claim_next_ip(
+        db: Session,
+        ip_pool_id: Optional[int] = None,
+        status: str = "allocated",
+        user_id: Optional[int] = None,
+        hostname: Optional[str] = None,
+        mac_address: Optional[str] = None,
+        notes: Optional[str] = None
+    ) -> Optional[IPAllocation]:
+        """原子地占用下一个空闲IP地址
+        
+        在 PostgreSQL 上通过 UPDATE ... WHERE id = (SELECT ... FOR UPDATE SKIP LOCKED LIMIT 1)
+        RETURNING 一条语句完成选择与占用，并发请求不会选中同一地址，也不会互相等待重试。
+        没有可用地址时返回 None。
+        """
+        try:
+            ip_pool = db.query(IPPool).filter(IPPool.id == ip_pool_id).first() if ip_pool_id else None
+            if ip_pool_id and not ip_pool:
+                raise Exception(f"找不到ID为 {ip_pool_id} 的IP池")
+            
+            if ip_pool and ip_pool.ip_version == 6:
+                ip_allocation = IPManagerService._claim_ipv6(db, ip_pool, status)
+            else:
+                ip_allocation = IPManagerService._claim_ipv4(db, ip_pool_id, status)
+            
+            if not ip_allocation:
+                db.rollback()
+                return None
+            
+            IPManagerService._adjust_counters(db, ip_allocation.ip_pool_id, **{"available": -1, status: 1})
+            ip_allocation.user_id = user_id
+            ip_allocation.hostname = hostname
+            ip_allocation.mac_address = mac_address
+            ip_allocation.notes = notes
+            
+            db.commit()
+            db.refresh(ip_allocation)
+            return ip_allocation
+        except Exception as e:
+            db.rollback()
+            logger.error(f"占用空闲IP失败: {str(e)}")
+            raise Exception(f"占用空闲IP失败: {str(e)}")
+    
     @staticmethod
     def allocate_ip(
         db: Session, 
@@ -89,15 +396,11 @@ class IPManagerService:
         notes: Optional[str] = None
     ) -> IPAllocation:
         """分配指定的IP地址"""
-        ip_allocation = db.query(IPAllocation).filter(IPAllocation.ip_address == ip_address).first()
-        
-        if not ip_allocation:
-            raise Exception(f"IP地址 {ip_address} 不存在")
-        
-        if ip_allocation.status != "available":
-            raise Exception(f"IP地址 {ip_address} 已被分配，当前状态: {ip_allocation.status}")
+        ip_allocation = IPManagerService._claim_address(
+            db, ip_address, "allocated",
+            error_message=f"IP地址 {ip_address} 已被分配"
+        )
         
-        ip_allocation.status = "allocated"
         ip_allocation.user_id = user_id
         ip_allocation.hostname = hostname
         ip_allocation.mac_address = mac_address
@@ -114,15 +417,11 @@ class IPManagerService:
         notes: Optional[str] = None
     ) -> IPAllocation:
         """保留指定的IP地址"""
-        ip_allocation = db.query(IPAllocation).filter(IPAllocation.ip_address == ip_address).first()
-        
-        if not ip_allocation:
-            raise Exception(f"IP地址 {ip_address} 不存在")
+        ip_allocation = IPManagerService._claim_address(
+            db, ip_address, "reserved",
+            error_message=f"IP地址 {ip_address} 已被分配或保留"
+        )
         
-        if ip_allocation.status != "available":
-            raise Exception(f"IP地址 {ip_address} 已被分配或保留，当前状态: {ip_allocation.status}")
-        
-        ip_allocation.status = "reserved"
         ip_allocation.notes = notes
         
         db.commit()
@@ -131,7 +430,11 @@ class IPManagerService:
     
     @staticmethod
     def release_ip(db: Session, ip_address: str) -> IPAllocation:
-        """释放指定的IP地址"""
+        """释放指定的IP地址
+        
+        地址归还到所属IP池的空闲区间，对应的分配记录被删除。
+        """
+        ip_address = IPManagerService._normalize_ip(ip_address)
         ip_allocation = db.query(IPAllocation).filter(IPAllocation.ip_address == ip_address).first()
         
         if not ip_allocation:
@@ -140,38 +443,162 @@ class IPManagerService:
         if ip_allocation.status == "available":
             raise Exception(f"IP地址 {ip_address} 已经是可用状态")
         
+        # 解除VPS对该记录的引用
+        db.query(VPSServer).filter(
+            VPSServer.ip_allocation_id == ip_allocation.id
+        ).update({VPSServer.ip_allocation_id: None}, synchronize_session="evaluate")
+        db.query(VPSServer).filter(
+            VPSServer.ip6_allocation_id == ip_allocation.id
+        ).update({VPSServer.ip6_allocation_id: None}, synchronize_session="evaluate")
+        
+        if ipaddress.ip_address(ip_allocation.ip_address).version == 4:
+            IPManagerService._return_to_free_ranges(
+                db, ip_allocation.ip_pool_id, IPManagerService._ip_to_int(ip_address)
+            )
+        IPManagerService._bump_free_version(db, ip_allocation.ip_pool_id)
+        
+        previous_status = ip_allocation.status
         ip_allocation.status = "available"
         ip_allocation.user_id = None
         ip_allocation.hostname = None
         ip_allocation.mac_address = None
         ip_allocation.notes = None
+        db.delete(ip_allocation)
+        IPManagerService._adjust_counters(
+            db, ip_allocation.ip_pool_id, **{"available": 1, previous_status: -1}
+        )
         
         db.commit()
-        db.refresh(ip_allocation)
         return ip_allocation
     
+    @staticmethod
+    def allocate_block(
+        db: Session,
+        ip_pool_id: int,
+        size: int,
+        aligned: bool = False,
+        status: str = "allocated",
+        user_id: Optional[int] = None,
+        hostname: Optional[str] = None,
+        notes: Optional[str] = None
+    ) -> List[IPAllocation]:
+        """在IP池中原子地占用一段连续地址
+        
+        aligned 为 True 时 size 必须是2的幂，地址块按 size 对齐（例如一个 /29）。
+        IPv4池直接在数据库中查找第一个能容纳该地址块的空闲区间，IPv6池沿已占用地址的
+        索引跳跃查找空隙，都不需要把整个池加载到内存。没有足够的连续地址时返回空列表。
+        """
+        if size <= 0 or size > BLOCK_MAX_SIZE:
+            raise Exception(f"地址块大小必须在 1 到 {BLOCK_MAX_SIZE} 之间")
+        if aligned and size & (size - 1):
+            raise Exception("对齐的地址块大小必须是2的幂")
+        
+        ip_pool = IPManagerService.get_ip_pool_by_id(db, ip_pool_id)
+        if not ip_pool:
+            raise Exception(f"找不到ID为 {ip_pool_id} 的IP池")
+        
+        align = size if aligned else 1
+        try:
+            if ip_pool.ip_version == 6:
+                block_start = IPManagerService._find_ipv6_block(db, ip_pool, size, align)
+            else:
+                block_start = IPManagerService._claim_ipv4_block(db, ip_pool_id, size, align)
+            
+            if block_start is None:
+                db.rollback()
+                return []
+            
+            version = ip_pool.ip_version
+            IPManagerService._bulk_insert(db, IPAllocation.__table__, (
+                {
+                    "ip_address": str(ipaddress.ip_address(value)),
+                    "ip_version": version,
+                    "ip_value": value,
+                    "ip_pool_id": ip_pool_id,
+                    "status": status,
+                    "user_id": user_id,
+                    "hostname": hostname,
+                    "notes": notes
+                }
+                for value in range(block_start, block_start + size)
+            ))
+            IPManagerService._adjust_counters(db, ip_pool_id, **{"available": -size, status: size})
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"在IP池 {ip_pool_id} 中分配地址块失败: {str(e)}")
+            raise Exception(f"分配地址块失败: {str(e)}")
+        
+        return db.query(IPAllocation).filter(
+            IPAllocation.ip_version == ip_pool.ip_version,
+            IPAllocation.ip_value >= block_start,
+            IPAllocation.ip_value <= block_start + size - 1
+        ).order_by(IPAllocation.ip_value).all()
+    
     @staticmethod
     def get_ip_usage_statistics(db: Session, ip_pool_id: Optional[int] = None) -> Dict[str, Any]:
-        """获取IP使用统计信息"""
-        query = db.query(IPAllocation)
+        """获取IP使用统计信息（读取增量维护的计数器）"""
+        totals = {"total": 0, "available": 0, "allocated": 0, "reserved": 0}
+        for usage in IPManagerService._get_pool_usage(db, ip_pool_id):
+            for key in totals:
+                totals[key] += usage[key]
+        return IPManagerService._format_usage(**totals)
+    
+    @staticmethod
+    def get_all_ip_usage_statistics(db: Session) -> List[Dict[str, Any]]:
+        """一次查询获取所有IP池的使用统计"""
+        result = []
+        for usage in IPManagerService._get_pool_usage(db):
+            stats = IPManagerService._format_usage(
+                usage["total"], usage["available"], usage["allocated"], usage["reserved"]
+            )
+            stats.update({"ip_pool_id": usage["ip_pool_id"], "name": usage["name"], "network": usage["network"]})
+            result.append(stats)
+        return result
+    
+    @staticmethod
+    def get_fragmentation_report(db: Session, ip_pool_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """按IP池汇总空闲区间的碎片情况（仅IPv4池）
         
-        if ip_pool_id:
-            query = query.filter(IPAllocation.ip_pool_id == ip_pool_id)
+        fragmentation = 1 - 最大空闲区间 / 空闲地址总数，0 表示空闲地址完全连续。
+        """
+        size = IPFreeRange.range_end - IPFreeRange.range_start + 1
+        query = db.query(
+            IPPool.id, IPPool.name, IPPool.network,
+            func.count(IPFreeRange.id), func.coalesce(func.sum(size), 0), func.coalesce(func.max(size), 0)
+        ).outerjoin(IPFreeRange, IPFreeRange.ip_pool_id == IPPool.id).filter(
+            IPPool.ip_version == 4
+        ).group_by(IPPool.id, IPPool.name, IPPool.network)
         
-        total = query.count()
-        available = query.filter(IPAllocation.status == "available").count()
-        allocated = query.filter(IPAllocation.status == "allocated").count()
-        reserved = query.filter(IPAllocation.status == "reserved").count()
+        if ip_pool_id:
+            query = query.filter(IPPool.id == ip_pool_id)
         
-        return {
-            "total": total,
-            "available": available,
-            "allocated": allocated,
-            "reserved": reserved,
-            "available_percentage": round((available / total) * 100, 2) if total > 0 else 0,
-            "allocated_percentage": round((allocated / total) * 100, 2) if total > 0 else 0,
-            "reserved_percentage": round((reserved / total) * 100, 2) if total > 0 else 0
-        }
+        result = []
+        for pool_id, name, network, free_ranges, available, largest in query.order_by(IPPool.id):
+            available = int(available)
+            largest = int(largest)
+            result.append({
+                "ip_pool_id": pool_id,
+                "name": name,
+                "network": network,
+                "free_ranges": free_ranges,
+                "available": available,
+                "largest_free_block": largest,
+                "fragmentation": round(1 - largest / available, 4) if available else 0
+            })
+        return result
+    
+    @staticmethod
+    def rebuild_ip_usage_counters(db: Session, ip_pool_id: Optional[int] = None) -> int:
+        """通过 GROUP BY 重新计算IP池计数器，用于修复不一致，返回处理的IP池数量"""
+        try:
+            count = IPManagerService._rebuild_counters(db, ip_pool_id)
+            db.commit()
+            return count
+        except Exception as e:
+            db.rollback()
+            logger.error(f"重建IP池计数器失败: {str(e)}")
+            raise Exception(f"重建IP池计数器失败: {str(e)}")
     
     @staticmethod
     def get_ip_pools(db: Session, skip: int = 0, limit: int = 100) -> List[IPPool]:
@@ -185,11 +612,26 @@ class IPManagerService:
         status: Optional[str] = None,
         user_id: Optional[int] = None,
         skip: int = 0, 
-        limit: int = 100
+        limit: int = 100,
+        cidr: Optional[str] = None
     ) -> List[IPAllocation]:
-        """获取IP分配列表"""
+        """获取IP分配列表，按地址数值排序
+        
+        cidr 用于按网段筛选，例如 "10.0.4.0/22"，在整数地址索引上做范围扫描。
+        """
         query = db.query(IPAllocation)
         
+        if cidr:
+            try:
+                net = ipaddress.ip_network(cidr, strict=False)
+            except ValueError:
+                raise Exception(f"无效的网段: {cidr}")
+            query = query.filter(
+                IPAllocation.ip_version == net.version,
+                IPAllocation.ip_value >= int(net.network_address),
+                IPAllocation.ip_value <= int(net.broadcast_address)
+            )
+        
         if ip_pool_id:
             query = query.filter(IPAllocation.ip_pool_id == ip_pool_id)
         
@@ -199,7 +641,45 @@ class IPManagerService:
         if user_id:
             query = query.filter(IPAllocation.user_id == user_id)
         
-        return query.offset(skip).limit(limit).all()
+        return query.order_by(IPAllocation.ip_version, IPAllocation.ip_value).offset(skip).limit(limit).all()
+    
+    @staticmethod
+    def get_ip_pool_by_ip(db: Session, ip_address: str) -> Optional[IPPool]:
+        """查找包含指定地址的IP池"""
+        ip = ipaddress.ip_address(ip_address)
+        return db.query(IPPool).filter(
+            IPPool.ip_version == ip.version,
+            IPPool.network_start <= int(ip),
+            IPPool.network_end >= int(ip)
+        ).first()
+    
+    @staticmethod
+    def backfill_ip_values(db: Session, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+        """为旧数据补齐整数形式的地址列，按批提交，返回更新的记录数"""
+        updated = 0
+        
+        pools = db.query(IPPool).filter(IPPool.network_start.is_(None)).all()
+        for ip_pool in pools:
+            ip_pool.network = ip_pool.network
+        if pools:
+            db.commit()
+        
+        while True:
+            rows = db.query(IPAllocation.id, IPAllocation.ip_address).filter(
+                IPAllocation.ip_value.is_(None)
+            ).limit(chunk_size).all()
+            if not rows:
+                break
+            
+            values = []
+            for row_id, ip_address in rows:
+                ip = ipaddress.ip_address(ip_address)
+                values.append({"id": row_id, "ip_version": ip.version, "ip_value": int(ip)})
+            db.execute(update(IPAllocation), values)
+            db.commit()
+            updated += len(values)
+        
+        return len(pools) + updated
     
     @staticmethod
     def get_ip_pool_by_id(db: Session, ip_pool_id: int) -> Optional[IPPool]:
@@ -209,4 +689,645 @@ class IPManagerService:
     @staticmethod
     def get_ip_allocation_by_ip(db: Session, ip_address: str) -> Optional[IPAllocation]:
         """通过IP地址获取分配记录"""
-        return db.query(IPAllocation).filter(IPAllocation.ip_address == ip_address).first() 
\ No newline at end of file
+        ip_address = IPManagerService._normalize_ip(ip_address)
+        return db.query(IPAllocation).filter(IPAllocation.ip_address == ip_address).first()
+    
+    @staticmethod
+    def _bulk_insert(
+        db: Session,
+        table: Table,
+        rows: Iterable[Dict[str, Any]],
+        chunk_size: int = BULK_CHUNK_SIZE,
+        commit: bool = False
+    ) -> int:
+        """按固定大小分批执行 executemany 插入，返回插入的行数
+        
+        rows 可以是生成器，整个过程最多只在内存中保留一个批次。
+        """
+        inserted = 0
+        statement = insert(table)
+        for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+            db.execute(statement, chunk)
+            if commit:
+                db.commit()
+            inserted += len(chunk)
+        return inserted
+    
+    @staticmethod
+    def _get_pool_usage(db: Session, ip_pool_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """读取各IP池的计数器（各分片求和）；IPv6池的总量与可用量按前缀长度计算"""
+        counters = db.query(
+            IPPoolCounter.ip_pool_id,
+            func.sum(IPPoolCounter.total).label("total"),
+            func.sum(IPPoolCounter.available).label("available"),
+            func.sum(IPPoolCounter.allocated).label("allocated"),
+            func.sum(IPPoolCounter.reserved).label("reserved")
+        ).group_by(IPPoolCounter.ip_pool_id).subquery()
+        query = db.query(
+            IPPool, counters.c.total, counters.c.available, counters.c.allocated, counters.c.reserved
+        ).outerjoin(counters, counters.c.ip_pool_id == IPPool.id)
+        
+        if ip_pool_id:
+            query = query.filter(IPPool.id == ip_pool_id)
+        
+        result = []
+        for ip_pool, total, available, allocated, reserved in query.order_by(IPPool.id):
+            allocated = int(allocated or 0)
+            reserved = int(reserved or 0)
+            if ip_pool.ip_version == 6:
+                total = IPManagerService._ipv6_capacity(ip_pool)
+                available = total - allocated - reserved
+            result.append({
+                "ip_pool_id": ip_pool.id,
+                "name": ip_pool.name,
+                "network": ip_pool.network,
+                "total": int(total or 0),
+                "available": int(available or 0),
+                "allocated": allocated,
+                "reserved": reserved
+            })
+        return result
+    
+    @staticmethod
+    def _format_usage(total: int, available: int, allocated: int, reserved: int) -> Dict[str, Any]:
+        return {
+            "total": total,
+            "available": available,
+            "allocated": allocated,
+            "reserved": reserved,
+            "available_percentage": round((available / total) * 100, 2) if total > 0 else 0,
+            "allocated_percentage": round((allocated / total) * 100, 2) if total > 0 else 0,
+            "reserved_percentage": round((reserved / total) * 100, 2) if total > 0 else 0
+        }
+    
+    @staticmethod
+    def _adjust_counters(db: Session, ip_pool_id: int, **deltas: int) -> None:
+        """在当前事务中增量更新IP池计数器的一个随机分片
+        
+        旧IP池没有计数器行时，先刷新挂起的修改再按当前数据重建。
+        """
+        values = {
+            getattr(IPPoolCounter, column): getattr(IPPoolCounter, column) + delta
+            for column, delta in deltas.items() if delta
+        }
+        if not values:
+            return
+        updated = db.query(IPPoolCounter).filter(
+            IPPoolCounter.ip_pool_id == ip_pool_id,
+            IPPoolCounter.shard == random.randrange(COUNTER_SHARDS)
+        ).update(values, synchronize_session=False)
+        
+        if not updated:
+            db.flush()
+            IPManagerService._rebuild_counters(db, ip_pool_id)
+    
+    @staticmethod
+    def _rebuild_counters(db: Session, ip_pool_id: Optional[int] = None) -> int:
+        """按当前的分配记录与空闲区间重新计算计数器（不提交事务）
+        
+        结果写入分片 0，其余分片清零。
+        """
+        free_query = db.query(
+            IPFreeRange.ip_pool_id,
+            func.sum(IPFreeRange.range_end - IPFreeRange.range_start + 1)
+        ).group_by(IPFreeRange.ip_pool_id)
+        status_query = db.query(
+            IPAllocation.ip_pool_id, IPAllocation.status, func.count(IPAllocation.id)
+        ).group_by(IPAllocation.ip_pool_id, IPAllocation.status)
+        pool_query = db.query(IPPool.id)
+        
+        if ip_pool_id:
+            free_query = free_query.filter(IPFreeRange.ip_pool_id == ip_pool_id)
+            status_query = status_query.filter(IPAllocation.ip_pool_id == ip_pool_id)
+            pool_query = pool_query.filter(IPPool.id == ip_pool_id)
+        
+        counts = {pool_id: {"available": 0, "allocated": 0, "reserved": 0} for (pool_id,) in pool_query}
+        for pool_id, free in free_query:
+            if pool_id in counts:
+                counts[pool_id]["available"] += int(free)
+        for pool_id, status, count in status_query:
+            if pool_id in counts and status in counts[pool_id]:
+                counts[pool_id][status] += count
+        
+        existing = {
+            (counter.ip_pool_id, counter.shard): counter
+            for counter in db.query(IPPoolCounter).filter(IPPoolCounter.ip_pool_id.in_(list(counts)))
+        }
+        for pool_id, values in counts.items():
+            for shard in range(COUNTER_SHARDS):
+                counter = existing.get((pool_id, shard))
+                if not counter:
+                    counter = IPPoolCounter(ip_pool_id=pool_id, shard=shard)
+                    db.add(counter)
+                shard_values = values if shard == 0 else {"available": 0, "allocated": 0, "reserved": 0}
+                counter.available = shard_values["available"]
+                counter.allocated = shard_values["allocated"]
+                counter.reserved = shard_values["reserved"]
+                counter.total = sum(shard_values.values())
+        return len(counts)
+    
+    @staticmethod
+    def _add_counter_shards(db: Session, ip_pool_id: int, total: int = 0, available: int = 0) -> None:
+        """为新建的IP池写入全部计数器分片，初始值记在分片 0"""
+        for shard in range(COUNTER_SHARDS):
+            db.add(IPPoolCounter(
+                ip_pool_id=ip_pool_id,
+                shard=shard,
+                total=total if shard == 0 else 0,
+                available=available if shard == 0 else 0,
+                allocated=0,
+                reserved=0
+            ))
+    
+    @staticmethod
+    def _bump_free_version(db: Session, ip_pool_id: int) -> None:
+        """递增IP池的空闲地址版本号，通知各进程的 IPAllocator 重新加载
+        
+        只在空闲地址增加（释放、重建、调整范围）时调用。分配与保留不需要递增：
+        缓存给出的候选地址已被占用时 allocate_ip 会失败，IPAllocator 随即重新加载该池，
+        分配路径因此不需要更新IP池行。
+        """
+        db.query(IPPool).filter(IPPool.id == ip_pool_id).update(
+            {IPPool.free_version: IPPool.free_version + 1}, synchronize_session=False
+        )
+    
+    @staticmethod
+    def _claim_ipv4(db: Session, ip_pool_id: Optional[int], status: str) -> Optional[IPAllocation]:
+        """从IPv4空闲区间（或旧版逐地址记录）中占用下一个地址（不提交事务）"""
+        claimed = IPManagerService._claim_from_free_ranges(db, ip_pool_id)
+        if claimed:
+            ip_int, pool_id = claimed
+            ip_allocation = IPAllocation(
+                ip_address=IPManagerService._int_to_ip(ip_int),
+                ip_pool_id=pool_id,
+                status=status
+            )
+            db.add(ip_allocation)
+            return ip_allocation
+        
+        # 兼容尚未转换为区间存储的旧IP池
+        return IPManagerService._claim_legacy_row(db, ip_pool_id, status)
+    
+    @staticmethod
+    def _claim_ipv6(db: Session, ip_pool: IPPool, status: str) -> Optional[IPAllocation]:
+        """在IPv6池中按需生成并占用一个地址（不提交事务）
+        
+        顺序模式从池的游标处向后查找第一个未占用的偏移，随机模式在前缀内随机取偏移，
+        两者都只为真正占用的地址写入记录。
+        """
+        # 锁定IP池行，串行化同一池内游标的推进
+        ip_pool = db.query(IPPool).filter(IPPool.id == ip_pool.id).with_for_update().one()
+        net = ipaddress.ip_network(ip_pool.network, strict=False)
+        excluded = IPManagerService._ipv6_excluded_offsets(net, ip_pool.gateway)
+        size = net.num_addresses
+        
+        def is_free(offset: int) -> bool:
+            if offset in excluded:
+                return False
+            ip_address = str(net.network_address + offset)
+            return not db.query(IPAllocation.id).filter(IPAllocation.ip_address == ip_address).first()
+        
+        offset = None
+        if ip_pool.allocation_mode == "random" and size > 1:
+            for _ in range(IPV6_RANDOM_ATTEMPTS):
+                candidate = random.randrange(1, size)
+                if is_free(candidate):
+                    offset = candidate
+                    break
+        
+        if offset is None:
+            cursor = int(ip_pool.next_cursor or 1)
+            for step in range(min(size, IPV6_SCAN_LIMIT)):
+                candidate = (cursor + step - 1) % (size - 1) + 1 if size > 1 else 0
+                if is_free(candidate):
+                    offset = candidate
+                    ip_pool.next_cursor = str(candidate + 1)
+                    break
+        
+        if offset is None:
+            return None
+        
+        ip_allocation = IPAllocation(
+            ip_address=str(net.network_address + offset),
+            ip_pool_id=ip_pool.id,
+            status=status
+        )
+        db.add(ip_allocation)
+        return ip_allocation
+    
+    @staticmethod
+    def _claim_ipv4_block(db: Session, ip_pool_id: int, size: int, align: int) -> Optional[int]:
+        """从IPv4池的空闲区间中切出第一段满足对齐要求的连续地址，返回起始地址整数（不提交事务）"""
+        aligned_start = (IPFreeRange.range_start + (align - 1)) // align * align
+        candidate = db.query(
+            IPFreeRange.id, IPFreeRange.range_start, IPFreeRange.range_end, aligned_start
+        ).filter(
+            IPFreeRange.ip_pool_id == ip_pool_id,
+            IPFreeRange.range_end - IPFreeRange.range_start + 1 >= size,
+            aligned_start + (size - 1) <= IPFreeRange.range_end
+        ).order_by(IPFreeRange.range_start).limit(1)
+        
+        for attempt in range(CLAIM_MAX_RETRIES):
+            # 先跳过被其他事务锁定的区间，找不到时再等待锁
+            row = candidate.with_for_update(skip_locked=attempt == 0).first()
+            if not row:
+                if attempt == 0:
+                    continue
+                return None
+            
+            range_id, range_start, range_end, block_start = row
+            block_end = block_start + size - 1
+            unchanged = (
+                IPFreeRange.id == range_id,
+                IPFreeRange.range_start == range_start,
+                IPFreeRange.range_end == range_end
+            )
+            # 按原值做条件更新，区间已被其他请求修改时重新查找
+            if block_start > range_start:
+                statement = update(IPFreeRange).where(*unchanged).values(range_end=block_start - 1)
+            elif block_end < range_end:
+                statement = update(IPFreeRange).where(*unchanged).values(range_start=block_end + 1)
+            else:
+                statement = delete(IPFreeRange).where(*unchanged)
+            if db.execute(statement.execution_options(synchronize_session=False)).rowcount != 1:
+                continue
+            
+            if block_start > range_start and block_end < range_end:
+                db.execute(insert(IPFreeRange), [
+                    {"ip_pool_id": ip_pool_id, "range_start": block_end + 1, "range_end": range_end}
+                ])
+            return block_start
+        
+        raise Exception("空闲IP竞争激烈，请稍后重试")
+    
+    @staticmethod
+    def _find_ipv6_block(db: Session, ip_pool: IPPool, size: int, align: int) -> Optional[int]:
+        """在IPv6池中查找一段未占用的连续地址，返回起始地址整数
+        
+        每次检查候选地址块内是否已有分配记录，命中时直接跳到该记录之后的下一个对齐位置。
+        调用方需在同一事务中写入分配记录，IP池行在此期间保持锁定。
+        """
+        ip_pool = db.query(IPPool).filter(IPPool.id == ip_pool.id).with_for_update().one()
+        net = ipaddress.ip_network(ip_pool.network, strict=False)
+        excluded = IPManagerService._ipv6_excluded_offsets(net, ip_pool.gateway)
+        base = int(net.network_address)
+        
+        def align_up(offset: int) -> int:
+            return (offset + align - 1) // align * align
+        
+        offset = align_up(1)
+        for _ in range(IPV6_SCAN_LIMIT):
+            if offset + size > net.num_addresses:
+                return None
+            
+            blocked = [value for value in excluded if offset <= value < offset + size]
+            if blocked:
+                offset = align_up(max(blocked) + 1)
+                continue
+            
+            occupied = db.query(IPAllocation.ip_value).filter(
+                IPAllocation.ip_version == 6,
+                IPAllocation.ip_value >= base + offset,
+                IPAllocation.ip_value <= base + offset + size - 1
+            ).order_by(IPAllocation.ip_value.desc()).first()
+            if occupied:
+                offset = align_up(int(occupied[0]) - base + 1)
+                continue
+            
+            return base + offset
+        
+        return None
+    
+    @staticmethod
+    def _claim_from_free_ranges(db: Session, ip_pool_id: Optional[int] = None) -> Optional[Tuple[int, int]]:
+        """从空闲区间头部取出一个地址，返回 (地址整数, IP池ID)（不提交事务）"""
+        candidate = select(IPFreeRange.id).order_by(IPFreeRange.ip_pool_id, IPFreeRange.range_start).limit(1)
+        if ip_pool_id:
+            candidate = candidate.where(IPFreeRange.ip_pool_id == ip_pool_id)
+        
+        if db.get_bind().dialect.update_returning:
+            # 先跳过被其他事务锁定的区间；若全部被锁（例如池中只剩一个区间），
+            # 再等待锁释放，锁只在对方提交前的极短时间内持有
+            for skip_locked in (True, False):
+                row = db.execute(
+                    update(IPFreeRange)
+                    .where(IPFreeRange.id == candidate.with_for_update(skip_locked=skip_locked).scalar_subquery())
+                    .values(range_start=IPFreeRange.range_start + 1)
+                    .returning(IPFreeRange.id, IPFreeRange.ip_pool_id, IPFreeRange.range_start, IPFreeRange.range_end)
+                    .execution_options(synchronize_session=False)
+                ).first()
+                if row:
+                    if row.range_start > row.range_end:
+                        db.execute(
+                            delete(IPFreeRange)
+                            .where(IPFreeRange.id == row.id)
+                            .execution_options(synchronize_session=False)
+                        )
+                    return row.range_start - 1, row.ip_pool_id
+            return None
+        
+        # 不支持 RETURNING 的数据库：读取候选区间后按原值做条件更新，失败则重试
+        for _ in range(CLAIM_MAX_RETRIES):
+            row = db.execute(
+                select(IPFreeRange.id, IPFreeRange.ip_pool_id, IPFreeRange.range_start, IPFreeRange.range_end)
+                .where(IPFreeRange.id == candidate.scalar_subquery())
+            ).first()
+            if not row:
+                return None
+            
+            if row.range_start == row.range_end:
+                statement = delete(IPFreeRange)
+            else:
+                statement = update(IPFreeRange).values(range_start=row.range_start + 1)
+            result = db.execute(
+                statement
+                .where(IPFreeRange.id == row.id, IPFreeRange.range_start == row.range_start)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 1:
+                return row.range_start, row.ip_pool_id
+        
+        raise Exception("空闲IP竞争激烈，请稍后重试")
+    
+    @staticmethod
+    def _claim_legacy_row(db: Session, ip_pool_id: Optional[int], status: str) -> Optional[IPAllocation]:
+        """从旧版逐地址存储的空闲记录中占用一条（不提交事务）"""
+        candidate = select(IPAllocation.id).where(IPAllocation.status == "available").limit(1)
+        if ip_pool_id:
+            candidate = candidate.where(IPAllocation.ip_pool_id == ip_pool_id)
+        
+        if db.get_bind().dialect.update_returning:
+            row_id = db.execute(
+                update(IPAllocation)
+                .where(IPAllocation.id == candidate.with_for_update(skip_locked=True).scalar_subquery())
+                .values(status=status)
+                .returning(IPAllocation.id)
+                .execution_options(synchronize_session=False)
+            ).scalar()
+        else:
+            row_id = None
+            for _ in range(CLAIM_MAX_RETRIES):
+                candidate_id = db.execute(candidate).scalar()
+                if candidate_id is None:
+                    break
+                result = db.execute(
+                    update(IPAllocation)
+                    .where(IPAllocation.id == candidate_id, IPAllocation.status == "available")
+                    .values(status=status)
+                    .execution_options(synchronize_session=False)
+                )
+                if result.rowcount == 1:
+                    row_id = candidate_id
+                    break
+        
+        if row_id is None:
+            return None
+        return db.query(IPAllocation).populate_existing().filter(IPAllocation.id == row_id).one()
+    
+    @staticmethod
+    def _claim_address(db: Session, ip_address: str, status: str, error_message: str) -> IPAllocation:
+        """将指定地址从空闲区间中取出并生成状态为 status 的分配记录（不提交事务）"""
+        ip_address = IPManagerService._normalize_ip(ip_address)
+        ip_allocation = db.query(IPAllocation).filter(IPAllocation.ip_address == ip_address).first()
+        
+        if ip_allocation:
+            if ip_allocation.status != "available":
+                raise Exception(f"{error_message}，当前状态: {ip_allocation.status}")
+            # 旧版逐地址存储的空闲记录
+            ip_allocation.status = status
+            IPManagerService._adjust_counters(db, ip_allocation.ip_pool_id, **{"available": -1, status: 1})
+            return ip_allocation
+        
+        try:
+            ip = ipaddress.ip_address(ip_address)
+        except ValueError:
+            raise Exception(f"IP地址 {ip_address} 不存在")
+        
+        if ip.version == 6:
+            ip_pool = IPManagerService._find_ipv6_pool(db, ip)
+            if not ip_pool:
+                raise Exception(f"IP地址 {ip_address} 不存在")
+            ip_allocation = IPAllocation(
+                ip_address=str(ip),
+                ip_pool_id=ip_pool.id,
+                status=status
+            )
+            db.add(ip_allocation)
+            IPManagerService._adjust_counters(db, ip_pool.id, **{"available": -1, status: 1})
+            return ip_allocation
+        
+        ip_int = int(ip)
+        free_range = db.query(IPFreeRange).filter(
+            IPFreeRange.range_start <= ip_int,
+            IPFreeRange.range_end >= ip_int
+        ).with_for_update().first()
+        
+        if not free_range:
+            raise Exception(f"IP地址 {ip_address} 不存在")
+        
+        IPManagerService._carve_from_range(db, free_range, ip_int)
+        
+        ip_allocation = IPAllocation(
+            ip_address=ip_address,
+            ip_pool_id=free_range.ip_pool_id,
+            status=status
+        )
+        db.add(ip_allocation)
+        IPManagerService._adjust_counters(db, free_range.ip_pool_id, **{"available": -1, status: 1})
+        return ip_allocation
+    
+    @staticmethod
+    def _carve_from_range(db: Session, free_range: IPFreeRange, ip_int: int) -> None:
+        """从空闲区间中移除单个地址，必要时拆分区间"""
+        if free_range.range_start == free_range.range_end:
+            db.delete(free_range)
+        elif ip_int == free_range.range_start:
+            free_range.range_start = ip_int + 1
+        elif ip_int == free_range.range_end:
+            free_range.range_end = ip_int - 1
+        else:
+            db.add(IPFreeRange(
+                ip_pool_id=free_range.ip_pool_id,
+                range_start=ip_int + 1,
+                range_end=free_range.range_end
+            ))
+            free_range.range_end = ip_int - 1
+    
+    @staticmethod
+    def _return_to_free_ranges(db: Session, ip_pool_id: int, ip_int: int) -> None:
+        """将单个地址归还到空闲区间，并与相邻区间合并"""
+        left = db.query(IPFreeRange).filter(
+            IPFreeRange.ip_pool_id == ip_pool_id,
+            IPFreeRange.range_end == ip_int - 1
+        ).with_for_update().first()
+        right = db.query(IPFreeRange).filter(
+            IPFreeRange.ip_pool_id == ip_pool_id,
+            IPFreeRange.range_start == ip_int + 1
+        ).with_for_update().first()
+        
+        if left and right:
+            left.range_end = right.range_end
+            db.delete(right)
+        elif left:
+            left.range_end = ip_int
+        elif right:
+            right.range_start = ip_int
+        else:
+            db.add(IPFreeRange(ip_pool_id=ip_pool_id, range_start=ip_int, range_end=ip_int))
+    
+    @staticmethod
+    def _remove_free_ranges(db: Session, ip_pool_id: int, removed: List[Tuple[int, int]]) -> None:
+        """从IP池的空闲区间中剔除一组区间，只改写与之重叠的区间"""
+        for range_start, range_end in removed:
+            overlapping = db.query(IPFreeRange).filter(
+                IPFreeRange.ip_pool_id == ip_pool_id,
+                IPFreeRange.range_start <= range_end,
+                IPFreeRange.range_end >= range_start
+            ).with_for_update().all()
+            for free_range in overlapping:
+                remaining = IPManagerService._subtract_ranges(
+                    [(free_range.range_start, free_range.range_end)], [(range_start, range_end)]
+                )
+                db.delete(free_range)
+                for start, end in remaining:
+                    db.add(IPFreeRange(ip_pool_id=ip_pool_id, range_start=start, range_end=end))
+            db.flush()
+    
+    @staticmethod
+    def _add_free_ranges(db: Session, ip_pool_id: int, added: List[Tuple[int, int]]) -> None:
+        """向IP池加入一组新的空闲区间，并与相邻区间合并"""
+        for range_start, range_end in added:
+            neighbours = db.query(IPFreeRange).filter(
+                IPFreeRange.ip_pool_id == ip_pool_id,
+                IPFreeRange.range_start <= range_end + 1,
+                IPFreeRange.range_end >= range_start - 1
+            ).with_for_update().all()
+            for free_range in neighbours:
+                range_start = min(range_start, free_range.range_start)
+                range_end = max(range_end, free_range.range_end)
+                db.delete(free_range)
+            db.add(IPFreeRange(ip_pool_id=ip_pool_id, range_start=range_start, range_end=range_end))
+            db.flush()
+    
+    @staticmethod
+    def _find_ipv6_pool(db: Session, ip: ipaddress.IPv6Address) -> Optional[IPPool]:
+        """查找包含指定IPv6地址且该地址可分配的IP池"""
+        ip_pool = IPManagerService.get_ip_pool_by_ip(db, str(ip))
+        if not ip_pool:
+            return None
+        net = ipaddress.ip_network(ip_pool.network, strict=False)
+        offset = int(ip) - int(net.network_address)
+        if offset in IPManagerService._ipv6_excluded_offsets(net, ip_pool.gateway):
+            return None
+        return ip_pool
+    
+    @staticmethod
+    def _ipv6_excluded_offsets(net: ipaddress.IPv6Network, gateway: Optional[str] = None) -> set:
+        """IPv6池中不可分配的偏移量：子网路由器任播地址（偏移0）和网关"""
+        excluded = {0}
+        if gateway:
+            try:
+                gateway_ip = ipaddress.ip_address(gateway)
+                if gateway_ip in net:
+                    excluded.add(int(gateway_ip) - int(net.network_address))
+            except ValueError:
+                logger.warning(f"无效的网关地址: {gateway}")
+        return excluded
+    
+    @staticmethod
+    def _ipv6_capacity(ip_pool: IPPool) -> int:
+        """按前缀长度计算IPv6池可分配地址的总数"""
+        net = ipaddress.ip_network(ip_pool.network, strict=False)
+        return net.num_addresses - len(IPManagerService._ipv6_excluded_offsets(net, ip_pool.gateway))
+    
+    @staticmethod
+    def _parse_network(network: str, subnet_mask: str) -> Union[ipaddress.IPv4Network, ipaddress.IPv6Network]:
+        """解析网络地址与子网掩码（IPv4点分掩码或前缀长度）"""
+        if subnet_mask.isdigit():
+            return ipaddress.ip_network(f"{network}/{subnet_mask}", strict=False)
+        return ipaddress.IPv4Network(f"{network}/{subnet_mask}", strict=False)
+    
+    @staticmethod
+    def _get_host_ranges(net: ipaddress.IPv4Network, gateway: Optional[str] = None) -> List[Tuple[int, int]]:
+        """计算网络中可分配主机地址的整数区间（排除网关）"""
+        first = int(net.network_address)
+        last = int(net.broadcast_address)
+        # /31 和 /32 没有网络地址和广播地址
+        if net.num_addresses > 2:
+            first += 1
+            last -= 1
+        
+        excluded = []
+        if gateway:
+            try:
+                excluded.append(int(ipaddress.IPv4Address(gateway)))
+            except ValueError:
+                logger.warning(f"无效的网关地址: {gateway}")
+        
+        return IPManagerService._subtract_addresses([(first, last)], excluded)
+    
+    @staticmethod
+    def _subtract_addresses(ranges: List[Tuple[int, int]], addresses: Iterable[int]) -> List[Tuple[int, int]]:
+        """从升序区间列表中剔除一组地址，返回剩余的区间"""
+        result = []
+        addresses = sorted(addresses)
+        index = 0
+        for range_start, range_end in ranges:
+            while index < len(addresses) and addresses[index] < range_start:
+                index += 1
+            while index < len(addresses) and addresses[index] <= range_end:
+                if addresses[index] > range_start:
+                    result.append((range_start, addresses[index] - 1))
+                range_start = addresses[index] + 1
+                index += 1
+            if range_start <= range_end:
+                result.append((range_start, range_end))
+        return result
+    
+    @staticmethod
+    def _address_ranges(addresses: Iterable[int]) -> List[Tuple[int, int]]:
+        """将一组地址合并为升序的连续区间"""
+        result = []
+        for address in sorted(set(addresses)):
+            if result and address == result[-1][1] + 1:
+                result[-1] = (result[-1][0], address)
+            else:
+                result.append((address, address))
+        return result
+    
+    @staticmethod
+    def _subtract_ranges(ranges: List[Tuple[int, int]], removed: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """计算区间集合的差：ranges 中不被 removed 覆盖的部分（均为闭区间）"""
+        result = []
+        removed = sorted(removed)
+        for range_start, range_end in sorted(ranges):
+            current = range_start
+            for removed_start, removed_end in removed:
+                if removed_end < current or removed_start > range_end:
+                    continue
+                if removed_start > current:
+                    result.append((current, removed_start - 1))
+                current = max(current, removed_end + 1)
+                if current > range_end:
+                    break
+            if current <= range_end:
+                result.append((current, range_end))
+        return result
+    
+    @staticmethod
+    def _normalize_ip(ip_address: str) -> str:
+        """返回地址的规范写法（IPv6小写并压缩），同一地址的不同写法对应同一条记录；无效地址原样返回"""
+        try:
+            return str(ipaddress.ip_address(ip_address.strip()))
+        except ValueError:
+            return ip_address
+    
+    @staticmethod
+    def _ip_to_int(ip_address: str) -> int:
+        """将IP地址转换为整数"""
+        return int(ipaddress.ip_address(ip_address))
+    
+    @staticmethod
+    def _int_to_ip(ip_int: int) -> str:
+        """将整数转换为IPv4地址"""
+        return str(ipaddress.IPv4Address(ip_int))
@@ -0,0 +1,275 @@
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Set
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+
+from backend.app.core.config import settings
+from backend.app.core.database import SessionLocal
+from backend.app.models.job import Job
+
+logger = logging.getLogger(__name__)
+
+class JobService:
+    """后台任务记录服务"""
+    
+    @staticmethod
+    def create_job(
+        db: Session,
+        job_type: str,
+        target_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        payload: Optional[Dict[str, Any]] = None,
+        total: int = 0
+    ) -> Job:
+        """创建待执行的任务记录"""
+        job = Job(
+            job_type=job_type,
+            status="pending",
+            target_id=target_id,
+            user_id=user_id,
+            payload=payload or {},
+            total=total,
+            processed=0
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        return job
+    
+    @staticmethod
+    def get_job(db: Session, job_id: int) -> Optional[Job]:
+        """通过ID获取任务"""
+        return db.query(Job).filter(Job.id == job_id).first()
+    
+    @staticmethod
+    def get_jobs(
+        db: Session,
+        job_type: Optional[str] = None,
+        status: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[Job]:
+        """获取任务列表"""
+        query = db.query(Job)
+        
+        if job_type:
+            query = query.filter(Job.job_type == job_type)
+        
+        if status:
+            query = query.filter(Job.status == status)
+        
+        return query.order_by(Job.id.desc()).offset(skip).limit(limit).all()
+    
+    @staticmethod
+    def start_job(db: Session, job: Job, total: Optional[int] = None) -> Job:
+        """标记任务开始执行"""
+        job.status = "running"
+        job.started_at = datetime.utcnow()
+        if total is not None:
+            job.total = total
+        db.commit()
+        return job
+    
+    @staticmethod
+    def update_progress(db: Session, job: Job, processed: int, total: Optional[int] = None) -> Job:
+        """更新任务进度"""
+        job.processed = processed
+        if total is not None:
+            job.total = total
+        db.commit()
+        return job
+    
+    @staticmethod
+    def finish_job(db: Session, job: Job, result: Optional[Dict[str, Any]] = None) -> Job:
+        """标记任务成功完成"""
+        job.status = "success"
+        job.result = result
+        job.processed = max(job.processed or 0, job.total or 0)
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        return job
+    
+    @staticmethod
+    def fail_job(db: Session, job: Job, error: str) -> Job:
+        """标记任务失败"""
+        db.rollback()
+        job.status = "failed"
+        job.error = error
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        logger.error(f"任务 {job.id} ({job.job_type}) 失败: {error}")
+        return job
+
+class JobWorkerPool:
+    """后台任务执行线程池
+    
+    接口只写入 pending 状态的任务记录并立即返回，由工作线程从数据库领取执行，
+    同时执行的任务数受 JOB_WORKERS 限制，与Web线程数无关。任务记录持久化在数据库中，
+    多个进程可以同时运行线程池，以条件更新领取任务，同一任务只会被一个进程执行。
+    
+    执行中的任务由监督线程定期续期（更新 updated_at）；超过 JOB_LEASE_TIMEOUT 未续期的
+    运行中任务说明执行进程已退出，标记为失败。
+    """
+    
+    def __init__(self):
+        self._handlers: Dict[str, Callable[[int], None]] = {}
+        self._running: Set[int] = set()
+        self._lock = threading.Lock()
+        self._condition = threading.Condition()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+    
+    def register(self, job_type: str, handler: Callable[[int], None]) -> None:
+        """注册任务类型的执行函数，函数接收任务ID，在自己的数据库会话中执行并更新任务状态"""
+        self._handlers[job_type] = handler
+    
+    def submit(
+        self,
+        db: Session,
+        job_type: str,
+        target_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        payload: Optional[Dict[str, Any]] = None,
+        total: int = 0
+    ) -> Job:
+        """创建任务记录并唤醒工作线程"""
+        job = JobService.create_job(db, job_type, target_id=target_id, user_id=user_id, payload=payload, total=total)
+        self.wake()
+        return job
+    
+    def wake(self) -> None:
+        with self._condition:
+            self._condition.notify()
+    
+    def start(self, workers: Optional[int] = None) -> None:
+        """启动工作线程和监督线程"""
+        if self._threads:
+            return
+        self._stopping.clear()
+        for index in range(workers or settings.JOB_WORKERS):
+            self._threads.append(threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True))
+        self._threads.append(threading.Thread(target=self._supervise, name="job-supervisor", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        logger.info(f"后台任务线程池已启动，工作线程数: {len(self._threads) - 1}")
+    
+    def stop(self) -> None:
+        """停止领取新任务；执行中的任务在进程退出时中断，由其他进程的监督线程按租约超时处理"""
+        self._stopping.set()
+        with self._condition:
+            self._condition.notify_all()
+        self._threads = []
+    
+    def running(self) -> List[int]:
+        """本进程正在执行的任务ID"""
+        with self._lock:
+            return sorted(self._running)
+    
+    def claim(self, db: Session) -> Optional[int]:
+        """领取一个已注册类型的待执行任务，返回任务ID"""
+        if not self._handlers:
+            return None
+        candidates = (
+            db.query(Job.id)
+            .filter(Job.status == "pending", Job.job_type.in_(list(self._handlers)))
+            .order_by(Job.id)
+            .limit(10)
+            .all()
+        )
+        for (job_id,) in candidates:
+            now = datetime.utcnow()
+            # 条件更新：多个线程或进程同时领取同一任务时只有一个成功
+            claimed = (
+                db.query(Job)
+                .filter(Job.id == job_id, Job.status == "pending")
+                .update({Job.status: "running", Job.started_at: now, Job.updated_at: now}, synchronize_session=False)
+            )
+            db.commit()
+            if claimed:
+                return job_id
+        return None
+    
+    def execute(self, job_id: int) -> None:
+        """执行已领取的任务，执行函数抛出的异常记录为任务失败"""
+        db = SessionLocal()
+        try:
+            job = JobService.get_job(db, job_id)
+            handler = self._handlers.get(job.job_type) if job else None
+        finally:
+            db.close()
+        if handler is None:
+            return
+        
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            handler(job_id)
+        except Exception as e:
+            db = SessionLocal()
+            try:
+                job = JobService.get_job(db, job_id)
+                if job and job.status in ("pending", "running"):
+                    JobService.fail_job(db, job, str(e))
+            finally:
+                db.close()
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+    
+    def heartbeat(self, db: Session) -> None:
+        """续期本进程执行中的任务，并把租约超时的任务标记为失败"""
+        now = datetime.utcnow()
+        running = self.running()
+        if running:
+            db.query(Job).filter(Job.id.in_(running), Job.status == "running").update(
+                {Job.updated_at: now}, synchronize_session=False
+            )
+        stale = (
+            db.query(Job)
+            .filter(
+                Job.status == "running",
+                Job.updated_at < now - timedelta(seconds=settings.JOB_LEASE_TIMEOUT),
+                Job.id.notin_(running or [0])
+            )
+            .all()
+        )
+        for job in stale:
+            job.status = "failed"
+            job.error = "执行任务的进程已退出，任务中断"
+            job.finished_at = now
+            logger.warning(f"任务 {job.id} ({job.job_type}) 租约超时，标记为失败")
+        db.commit()
+    
+    def _work(self) -> None:
+        while not self._stopping.is_set():
+            db = SessionLocal()
+            try:
+                job_id = self.claim(db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"领取后台任务失败: {str(e)}")
+                job_id = None
+            finally:
+                db.close()
+            
+            if job_id is None:
+                with self._condition:
+                    self._condition.wait(settings.JOB_POLL_INTERVAL)
+                continue
+            self.execute(job_id)
+    
+    def _supervise(self) -> None:
+        # 续期间隔取租约时间的三分之一
+        interval = max(1.0, settings.JOB_LEASE_TIMEOUT / 3)
+        while not self._stopping.wait(interval):
+            db = SessionLocal()
+            try:
+                self.heartbeat(db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"续期后台任务失败: {str(e)}")
+            finally:
+                db.close()
+
+job_worker_pool = JobWorkerPool()
@@ -1,55 +1,280 @@
 import logging
-from typing import Dict, List, Optional, Any, Union
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Any, TypeVar, Union
 from proxmoxer import ProxmoxAPI
-from proxmoxer.core import ResourceException
+from requests.adapters import BaseAdapter
+from proxmoxer.core import ProxmoxResource
 
 from backend.app.core.config import settings
+from backend.app.services.proxmox_cache import ProxmoxCache
+from backend.app.services.proxmox_breaker import ProxmoxBreakers, retry_delay
+from backend.app.services.proxmox_scheduler import ProxmoxScheduler
+from backend.app.services.proxmox_errors import (
+    ProxmoxError, ProxmoxAuthError, ProxmoxUnavailableError, ProxmoxCircuitOpenError,
+    classify_error, wrap_error
+)
 
 logger = logging.getLogger(__name__)
 
+# 各读方法的缓存时间（秒）
+CACHE_TTLS = {
+    "get_nodes": 30,
+    "get_node_status": 5,
+    "get_storage_list": 60,
+    "get_templates": 300,
+    "get_vm_config": 30,
+    "get_vm_backups": 60
+}
+
+T = TypeVar("T")
+
+# 密码认证时空闲超过该时间（秒）就重新登录；票据有效期为2小时，proxmoxer 只在调用时续期
+PVE_TICKET_IDLE_SECONDS = 3600
+
 class ProxmoxService:
-    """Proxmox VE API集成服务"""
-    
-    def __init__(self):
-        """初始化Proxmox连接"""
-        try:
-            # 尝试使用API令牌连接
-            if settings.PVE_TOKEN_NAME and settings.PVE_TOKEN_VALUE:
-                self.proxmox = ProxmoxAPI(
-                    host=settings.PVE_HOST,
-                    user=settings.PVE_USER,
-                    token_name=settings.PVE_TOKEN_NAME,
-                    token_value=settings.PVE_TOKEN_VALUE,
-                    verify_ssl=False
-                )
+    """Proxmox VE API集成服务
+    
+    连接在第一次调用时建立，导入模块不会访问Proxmox服务器。使用密码认证时，
+    空闲超过票据续期时间后重新登录；连接失败或认证失效时丢弃连接，
+    下次调用按指数退避重新连接。
+    
+    所有请求经过 _call：按读/写分别设置超时，读请求遇到暂时性故障时抖动退避重试，
+    集群和节点的熔断器打开时直接失败。各方法抛出 ProxmoxError 的子类。
+    
+    请求前经过 ProxmoxScheduler 限流：克隆/创建、备份、删除是重操作，按节点和存储限制
+    同时执行的任务数并占用名额到任务结束；其余请求按节点限制同时在途数，开关机走 interactive 通道。
+    """
+    
+    def __init__(
+        self,
+        name: str = "default",
+        hosts: Optional[List[str]] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        token_name: Optional[str] = None,
+        token_value: Optional[str] = None,
+        transport: Optional[BaseAdapter] = None
+    ):
+        """初始化服务（不连接Proxmox）
+        
+        Args:
+            name: 集群名称
+            hosts: 集群各节点的API地址，连接失败时依次切换，默认为 settings.PVE_HOST
+            user/password/token_name/token_value: 认证信息，默认取自配置
+            transport: 挂载到会话上的 requests 传输适配器，用于接入 PVESimulator；只支持令牌认证
+        """
+        self.name = name
+        self.hosts = list(hosts) if hosts else [settings.PVE_HOST]
+        self.user = user or settings.PVE_USER
+        self.password = password if password is not None else settings.PVE_PASSWORD
+        self.token_name = token_name or settings.PVE_TOKEN_NAME
+        self.token_value = token_value or settings.PVE_TOKEN_VALUE
+        self.transport = transport
+        self.cache = ProxmoxCache(max_entries=settings.PVE_CACHE_MAX_ENTRIES)
+        self.breakers = ProxmoxBreakers(name)
+        self.scheduler = ProxmoxScheduler(name)
+        self._api: Optional[ProxmoxAPI] = None
+        self._host_index = 0
+        self._lock = threading.Lock()
+        self._last_used = 0.0
+        self._failures = 0
+        self._retry_at = 0.0
+        self._last_error: Optional[str] = None
+    
+    @property
+    def host(self) -> str:
+        """当前使用的API地址"""
+        return self.hosts[self._host_index]
+    
+    @property
+    def proxmox(self) -> ProxmoxAPI:
+        """返回可用的连接，必要时建立或重建"""
+        with self._lock:
+            now = time.monotonic()
+            # proxmoxer 只在调用时续期票据，空闲太久票据会过期，直接重新登录
+            if self._api is not None and not self._uses_token() and now - self._last_used > PVE_TICKET_IDLE_SECONDS:
+                logger.info("Proxmox登录票据可能已过期，重新登录")
+                self._api = None
+            
+            if self._api is None:
+                if now < self._retry_at:
+                    raise ProxmoxCircuitOpenError(
+                        f"Proxmox服务器暂不可用，{self._retry_at - now:.0f}秒后重试（上次错误: {self._last_error}）"
+                    )
+                self._api = self._connect()
+            
+            self._last_used = now
+            return self._api
+    
+    def reset(self, failover: bool = False) -> None:
+        """丢弃当前连接，下次调用时重新连接；failover 为真时改用下一个节点的API地址"""
+        with self._lock:
+            self._api = None
+            if failover and len(self.hosts) > 1:
+                self._host_index = (self._host_index + 1) % len(self.hosts)
+                logger.warning(f"Proxmox集群 {self.name} 切换到节点 {self.host}")
+    
+    def connection_status(self) -> Dict[str, Any]:
+        """返回连接状态，用于健康检查"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "cluster": self.name,
+                "host": self.host,
+                "hosts": list(self.hosts),
+                "connected": self._api is not None,
+                "auth": "token" if self._uses_token() else "ticket",
+                "failures": self._failures,
+                "retry_in": round(max(0.0, self._retry_at - now), 1),
+                "last_error": self._last_error,
+                "breakers": self.breakers.status(),
+                "scheduler": self.scheduler.stats()
+            }
+    
+    def _connect(self) -> ProxmoxAPI:
+        """依次尝试集群各节点的API地址建立连接，全部失败时记录退避时间（调用方持有锁）"""
+        started = time.monotonic()
+        errors = []
+        for offset in range(len(self.hosts)):
+            index = (self._host_index + offset) % len(self.hosts)
+            host = self.hosts[index]
+            try:
+                api = self._create_api(host)
+            except Exception as e:
+                if not isinstance(classify_error(e), ProxmoxAuthError):
+                    errors.append(f"{host}: {str(e)}")
+                    continue
+                # 认证失败换节点也不会成功
+                self._last_error = str(e)
+                logger.error(f"Proxmox集群 {self.name} 认证失败: {str(e)}")
+                raise ProxmoxAuthError(f"Proxmox认证失败: {str(e)}")
+            
+            self._host_index = index
+            self._failures = 0
+            self._retry_at = 0.0
+            self._last_error = None
+            logger.info(f"成功连接到Proxmox服务器: {host}（集群 {self.name}，耗时 {time.monotonic() - started:.2f}秒）")
+            return api
+        
+        self._failures += 1
+        backoff = min(settings.PVE_RECONNECT_BACKOFF_MAX, settings.PVE_RECONNECT_BACKOFF * 2 ** (self._failures - 1))
+        self._retry_at = time.monotonic() + backoff
+        self._last_error = "; ".join(errors)
+        logger.error(f"连接Proxmox集群 {self.name} 失败（第 {self._failures} 次，{backoff:.0f}秒后重试）: {self._last_error}")
+        raise ProxmoxUnavailableError(f"无法连接到Proxmox服务器: {self._last_error}")
+    
+    def _create_api(self, host: str) -> ProxmoxAPI:
+        # 尝试使用API令牌连接
+        if self._uses_token():
+            api = ProxmoxAPI(
+                host=host,
+                user=self.user,
+                token_name=self.token_name,
+                token_value=self.token_value,
+                verify_ssl=settings.PVE_VERIFY_SSL,
+                timeout=(settings.PVE_CONNECT_TIMEOUT, settings.PVE_TIMEOUT)
+            )
+        else:
             # 使用密码连接
-            else:
-                self.proxmox = ProxmoxAPI(
-                    host=settings.PVE_HOST,
-                    user=settings.PVE_USER,
-                    password=settings.PVE_PASSWORD,
-                    verify_ssl=False
-                )
-            logger.info(f"成功连接到Proxmox服务器: {settings.PVE_HOST}")
-        except Exception as e:
-            logger.error(f"连接Proxmox服务器失败: {str(e)}")
-            raise Exception(f"无法连接到Proxmox服务器: {str(e)}")
+            api = ProxmoxAPI(
+                host=host,
+                user=self.user,
+                password=self.password,
+                verify_ssl=settings.PVE_VERIFY_SSL,
+                timeout=(settings.PVE_CONNECT_TIMEOUT, settings.PVE_TIMEOUT)
+            )
+        if self.transport is not None:
+            api._store["session"].mount("https://", self.transport)
+        return api
+    
+    def _on_error(self, error: ProxmoxError) -> None:
+        """认证失效时丢弃连接；连接失败时丢弃连接并切换到下一个节点"""
+        if isinstance(error, ProxmoxCircuitOpenError):
+            return
+        if isinstance(error, ProxmoxAuthError) and error.status_code != 403:
+            self.reset()
+        elif isinstance(error, ProxmoxUnavailableError) and error.status_code is None:
+            self.reset(failover=True)
+    
+    def _call(
+        self,
+        call_class: str,
+        node: Optional[str],
+        request: Callable[[ProxmoxResource], T],
+        priority: str = "normal"
+    ) -> T:
+        """执行一次API请求
+        
+        Args:
+            call_class: read 或 write，决定超时时间；只有 read 会重试
+            node: 请求作用的节点，用于节点熔断器和限流，集群级请求为 None
+            request: 接收API根资源并发出请求的函数
+            priority: 等待节点名额时的优先级通道
+        """
+        attempts = 1 + (settings.PVE_READ_RETRIES if call_class == "read" else 0)
+        for attempt in range(attempts):
+            try:
+                self.breakers.acquire(node)
+                with self.scheduler.slot(node, "light", priority):
+                    result = request(self._resource(call_class))
+            except Exception as e:
+                error = classify_error(e)
+                self._on_error(error)
+                self.breakers.record(node, error)
+                if not error.retryable or attempt + 1 >= attempts:
+                    raise error
+                delay = retry_delay(attempt)
+                logger.info(f"Proxmox读请求失败，{delay:.2f}秒后重试（第 {attempt + 1} 次）: {str(error)}")
+                time.sleep(delay)
+                continue
+            
+            self.breakers.record(node)
+            return result
+    
+    def _submit_heavy(self, node: str, storage: Optional[str], request: Callable[[ProxmoxResource], T]) -> T:
+        """提交重操作，节点和存储的名额占用到返回的任务结束"""
+        lease = self.scheduler.acquire(node, "heavy", storage=storage)
+        try:
+            upid = self._call("write", node, request)
+        except Exception:
+            lease.release()
+            raise
+        self.scheduler.hold(lease, upid)
+        return upid
+    
+    def _resource(self, call_class: str) -> ProxmoxResource:
+        """返回使用该调用类型超时时间的API根资源
+        
+        proxmoxer 的超时保存在共享的认证对象上，这里给请求套一层会话，逐次传入超时，
+        并发请求之间互不影响。
+        """
+        api = self.proxmox
+        read_timeout = settings.PVE_WRITE_TIMEOUT if call_class == "write" else settings.PVE_READ_TIMEOUT
+        session = _TimeoutSession(api._store["session"], (settings.PVE_CONNECT_TIMEOUT, read_timeout))
+        return ProxmoxResource(**dict(api._store, session=session))
+    
+    def _uses_token(self) -> bool:
+        return bool(self.token_name and self.token_value)
     
     def get_nodes(self) -> List[Dict[str, Any]]:
         """获取所有Proxmox节点"""
         try:
-            return self.proxmox.nodes.get()
+            return self._cached(("get_nodes",), lambda: self._call("read", None, lambda api: api.nodes.get()))
         except Exception as e:
             logger.error(f"获取节点列表失败: {str(e)}")
-            raise Exception(f"获取节点列表失败: {str(e)}")
+            raise wrap_error(e, "获取节点列表失败")
     
     def get_node_status(self, node: str) -> Dict[str, Any]:
         """获取指定节点的状态"""
         try:
-            return self.proxmox.nodes(node).status.get()
+            return self._cached(
+                ("get_node_status", node),
+                lambda: self._call("read", node, lambda api: api.nodes(node).status.get())
+            )
         except Exception as e:
             logger.error(f"获取节点 {node} 状态失败: {str(e)}")
-            raise Exception(f"获取节点状态失败: {str(e)}")
+            raise wrap_error(e, "获取节点状态失败")
     
     def get_vms(self, node: Optional[str] = None) -> List[Dict[str, Any]]:
         """获取所有虚拟机
@@ -59,62 +284,81 @@ class ProxmoxService:
         """
         try:
             if node:
-                return self.proxmox.nodes(node).qemu.get()
-            
-            # 如果没有指定节点，获取所有节点上的VM
-            vms = []
-            for node_info in self.get_nodes():
-                node_name = node_info["node"]
-                try:
-                    node_vms = self.proxmox.nodes(node_name).qemu.get()
-                    vms.extend(node_vms)
-                except Exception as e:
-                    logger.warning(f"获取节点 {node_name} 的VM列表失败: {str(e)}")
+                return self._call("read", node, lambda api: api.nodes(node).qemu.get())
             
-            return vms
+            # 如果没有指定节点，一次集群级查询获取所有节点上的VM
+            return [vm for vm in self.get_vm_inventory().values() if vm.get("type") == "qemu"]
         except Exception as e:
             logger.error(f"获取VM列表失败: {str(e)}")
-            raise Exception(f"获取VM列表失败: {str(e)}")
+            raise wrap_error(e, "获取VM列表失败")
+    
+    def get_vm_inventory(self) -> Dict[int, Dict[str, Any]]:
+        """通过一次 /cluster/resources?type=vm 调用获取整个集群的虚拟机快照
+        
+        返回以 vmid 为键的字典，包含 QEMU 虚拟机和 LXC 容器（两者共用 VMID 空间），
+        每项含 node、status、name、type 等字段。
+        """
+        try:
+            resources = self._call("read", None, lambda api: api.cluster.resources.get(type="vm"))
+            return {int(resource["vmid"]): resource for resource in resources}
+        except Exception as e:
+            logger.error(f"获取集群虚拟机清单失败: {str(e)}")
+            raise wrap_error(e, "获取集群虚拟机清单失败")
     
     def get_vm_status(self, node: str, vmid: int) -> Dict[str, Any]:
         """获取虚拟机状态"""
         try:
-            return self.proxmox.nodes(node).qemu(vmid).status.current.get()
+            return self._call("read", node, lambda api: api.nodes(node).qemu(vmid).status.current.get())
         except Exception as e:
             logger.error(f"获取VM {vmid} 状态失败: {str(e)}")
-            raise Exception(f"获取VM状态失败: {str(e)}")
+            raise wrap_error(e, "获取VM状态失败")
     
     def get_vm_config(self, node: str, vmid: int) -> Dict[str, Any]:
         """获取虚拟机配置"""
         try:
-            return self.proxmox.nodes(node).qemu(vmid).config.get()
+            return self._cached(
+                ("get_vm_config", node, vmid),
+                lambda: self._call("read", node, lambda api: api.nodes(node).qemu(vmid).config.get())
+            )
         except Exception as e:
             logger.error(f"获取VM {vmid} 配置失败: {str(e)}")
-            raise Exception(f"获取VM配置失败: {str(e)}")
+            raise wrap_error(e, "获取VM配置失败")
     
     def start_vm(self, node: str, vmid: int) -> Dict[str, Any]:
         """启动虚拟机"""
         try:
-            return self.proxmox.nodes(node).qemu(vmid).status.start.post()
+            result = self._call(
+                "write", node, lambda api: api.nodes(node).qemu(vmid).status.start.post(), priority="interactive"
+            )
+            self.invalidate_vm(node, vmid)
+            return result
         except Exception as e:
             logger.error(f"启动VM {vmid} 失败: {str(e)}")
-            raise Exception(f"启动VM失败: {str(e)}")
+            raise wrap_error(e, "启动VM失败")
     
     def stop_vm(self, node: str, vmid: int) -> Dict[str, Any]:
         """关闭虚拟机"""
         try:
-            return self.proxmox.nodes(node).qemu(vmid).status.stop.post()
+            result = self._call(
+                "write", node, lambda api: api.nodes(node).qemu(vmid).status.stop.post(), priority="interactive"
+            )
+            self.invalidate_vm(node, vmid)
+            return result
         except Exception as e:
             logger.error(f"关闭VM {vmid} 失败: {str(e)}")
-            raise Exception(f"关闭VM失败: {str(e)}")
+            raise wrap_error(e, "关闭VM失败")
     
     def restart_vm(self, node: str, vmid: int) -> Dict[str, Any]:
         """重启虚拟机"""
         try:
-            return self.proxmox.nodes(node).qemu(vmid).status.reset.post()
+            result = self._call(
+                "write", node, lambda api: api.nodes(node).qemu(vmid).status.reset.post(), priority="interactive"
+            )
+            self.invalidate_vm(node, vmid)
+            return result
         except Exception as e:
             logger.error(f"重启VM {vmid} 失败: {str(e)}")
-            raise Exception(f"重启VM失败: {str(e)}")
+            raise wrap_error(e, "重启VM失败")
     
     def create_vm(self, node: str, vm_params: Dict[str, Any]) -> Dict[str, Any]:
         """创建新虚拟机
@@ -124,18 +368,24 @@ class ProxmoxService:
             vm_params: 虚拟机参数字典
         """
         try:
-            return self.proxmox.nodes(node).qemu.post(**vm_params)
+            result = self._submit_heavy(node, vm_params.get("storage"), lambda api: api.nodes(node).qemu.post(**vm_params))
+            self.invalidate_vm(node, vm_params.get("vmid"))
+            self.cache.invalidate("get_storage_list", node)
+            return result
         except Exception as e:
             logger.error(f"创建VM失败: {str(e)}")
-            raise Exception(f"创建VM失败: {str(e)}")
+            raise wrap_error(e, "创建VM失败")
     
     def delete_vm(self, node: str, vmid: int) -> Dict[str, Any]:
         """删除虚拟机"""
         try:
-            return self.proxmox.nodes(node).qemu(vmid).delete()
+            result = self._submit_heavy(node, None, lambda api: api.nodes(node).qemu(vmid).delete())
+            self.invalidate_vm(node, vmid)
+            self.cache.invalidate("get_storage_list", node)
+            return result
         except Exception as e:
             logger.error(f"删除VM {vmid} 失败: {str(e)}")
-            raise Exception(f"删除VM失败: {str(e)}")
+            raise wrap_error(e, "删除VM失败")
     
     def backup_vm(self, node: str, vmid: int, storage: str, compress: str = "zstd") -> Dict[str, Any]:
         """备份虚拟机
@@ -153,26 +403,32 @@ class ProxmoxService:
                 "compress": compress,
                 "mode": "snapshot"
             }
-            return self.proxmox.nodes(node).vzdump.post(**backup_params)
+            result = self._submit_heavy(node, storage, lambda api: api.nodes(node).vzdump.post(**backup_params))
+            self.cache.invalidate("get_vm_backups", node, storage)
+            self.cache.invalidate("get_storage_list", node)
+            return result
         except Exception as e:
             logger.error(f"备份VM {vmid} 失败: {str(e)}")
-            raise Exception(f"备份VM失败: {str(e)}")
+            raise wrap_error(e, "备份VM失败")
     
     def get_storage_list(self, node: str) -> List[Dict[str, Any]]:
         """获取存储列表"""
         try:
-            return self.proxmox.nodes(node).storage.get()
+            return self._cached(("get_storage_list", node), lambda: self._call("read", node, lambda api: api.nodes(node).storage.get()))
         except Exception as e:
             logger.error(f"获取存储列表失败: {str(e)}")
-            raise Exception(f"获取存储列表失败: {str(e)}")
+            raise wrap_error(e, "获取存储列表失败")
     
     def get_templates(self, node: str, storage: str) -> List[Dict[str, Any]]:
         """获取可用模板列表"""
         try:
-            return self.proxmox.nodes(node).storage(storage).content.get(content="vztmpl")
+            return self._cached(
+                ("get_templates", node, storage),
+                lambda: self._call("read", node, lambda api: api.nodes(node).storage(storage).content.get(content="vztmpl"))
+            )
         except Exception as e:
             logger.error(f"获取模板列表失败: {str(e)}")
-            raise Exception(f"获取模板列表失败: {str(e)}")
+            raise wrap_error(e, "获取模板列表失败")
     
     def get_vm_backups(self, node: str, storage: str, vmid: Optional[int] = None) -> List[Dict[str, Any]]:
         """获取备份列表
@@ -183,12 +439,53 @@ class ProxmoxService:
             vmid: 可选的虚拟机ID，用于筛选特定VM的备份
         """
         try:
-            backups = self.proxmox.nodes(node).storage(storage).content.get(content="backup")
+            backups = self._cached(
+                ("get_vm_backups", node, storage),
+                lambda: self._call("read", node, lambda api: api.nodes(node).storage(storage).content.get(content="backup"))
+            )
             if vmid:
                 return [b for b in backups if f"vzdump-qemu-{vmid}-" in b["volid"]]
             return backups
         except Exception as e:
             logger.error(f"获取备份列表失败: {str(e)}")
-            raise Exception(f"获取备份列表失败: {str(e)}")
+            raise wrap_error(e, "获取备份列表失败")
+    
+    def get_task_status(self, node: str, upid: str) -> Dict[str, Any]:
+        """获取任务状态，status 为 running 或 stopped，结束后 exitstatus 为 OK 或错误信息"""
+        try:
+            return self._call("read", node, lambda api: api.nodes(node).tasks(upid).status.get())
+        except Exception as e:
+            logger.error(f"获取任务 {upid} 状态失败: {str(e)}")
+            raise wrap_error(e, "获取任务状态失败")
+    
+    def get_node_tasks(self, node: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """获取节点上最近的任务（包括正在运行的任务），已结束的任务带有 endtime 和 status"""
+        try:
+            return self._call("read", node, lambda api: api.nodes(node).tasks.get(source="all", limit=limit))
+        except Exception as e:
+            logger.error(f"获取节点 {node} 任务列表失败: {str(e)}")
+            raise wrap_error(e, "获取任务列表失败")
+    
+    def _cached(self, key: tuple, loader):
+        if not self.cache.max_entries:
+            return loader()
+        return self.cache.get_or_load(key, CACHE_TTLS[key[0]], loader)
+    
+    def invalidate_vm(self, node: str, vmid: Optional[int]) -> None:
+        """虚拟机状态变化后清除其配置与所在节点状态的缓存"""
+        if vmid is not None:
+            self.cache.invalidate("get_vm_config", node, vmid)
+        self.cache.invalidate("get_node_status", node)
+
+class _TimeoutSession:
+    """给每个请求指定超时时间的会话包装"""
+    
+    def __init__(self, session, timeout):
+        self._session = session
+        self._timeout = timeout
+    
+    def request(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self._timeout)
+        return self._session.request(*args, **kwargs)
 
 proxmox_service = ProxmoxService() 
\ No newline at end of file
@@ -0,0 +1,424 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, List, Optional, Any
+
+import httpx
+
+from backend.app.core.config import settings
+from backend.app.services.proxmox_breaker import ProxmoxBreakers, retry_delay
+from backend.app.services.proxmox_errors import classify_error, error_for_status, wrap_error
+from backend.app.services.proxmox_scheduler import ProxmoxScheduler
+
+logger = logging.getLogger(__name__)
+
+# Proxmox 登录票据有效期为2小时，提前续期
+PVE_TICKET_RENEW_SECONDS = 90 * 60
+
+class AsyncProxmoxService:
+    """基于 httpx.AsyncClient 的异步 Proxmox VE API 客户端
+
+    方法与 ProxmoxService 一一对应，但全部为协程。客户端在第一次请求时创建，
+    复用长连接；每个主机同时在途的请求数由信号量限制。支持 API 令牌和
+    用户名/密码票据两种认证方式，票据过期前自动续期，收到 401 时重新登录一次。
+    配置了多个节点地址时，连接失败或超时会依次切换到下一个节点重试。
+    超时、读请求重试和熔断与 ProxmoxService 相同，同一集群的两个客户端可共用熔断器和调度器：
+    涉及节点的请求同样按节点占用轻操作名额，开关机走 interactive 通道。等待名额在线程池中进行，
+    不阻塞事件循环。
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        hosts: Optional[List[str]] = None,
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        token_name: Optional[str] = None,
+        token_value: Optional[str] = None,
+        port: Optional[int] = None,
+        verify_ssl: Optional[bool] = None,
+        timeout: Optional[float] = None,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        max_concurrency: Optional[int] = None,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        breakers: Optional[ProxmoxBreakers] = None,
+        scheduler: Optional[ProxmoxScheduler] = None
+    ):
+        self.hosts = list(hosts) if hosts else [host or settings.PVE_HOST]
+        self.user = user or settings.PVE_USER
+        self.password = password if password is not None else settings.PVE_PASSWORD
+        self.token_name = token_name or settings.PVE_TOKEN_NAME
+        self.token_value = token_value or settings.PVE_TOKEN_VALUE
+        self.port = port or settings.PVE_PORT
+        self.verify_ssl = settings.PVE_VERIFY_SSL if verify_ssl is None else verify_ssl
+        self.timeout = timeout or settings.PVE_TIMEOUT
+        self.max_connections = max_connections or settings.PVE_MAX_CONNECTIONS
+        self.max_keepalive_connections = max_keepalive_connections or settings.PVE_MAX_KEEPALIVE_CONNECTIONS
+        self.max_concurrency = max_concurrency or settings.PVE_MAX_CONCURRENCY_PER_HOST
+        self.transport = transport
+        self.breakers = breakers or ProxmoxBreakers(self.hosts[0])
+        self.scheduler = scheduler or ProxmoxScheduler(self.hosts[0])
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._login_lock: Optional[asyncio.Lock] = None
+        self._ticket: Optional[str] = None
+        self._csrf_token: Optional[str] = None
+        self._ticket_time = 0.0
+        self._host_index = 0
+
+    @property
+    def host(self) -> str:
+        """当前使用的API地址"""
+        return self.hosts[self._host_index]
+
+    @property
+    def base_url(self) -> str:
+        host = self.host
+        # 主机名中已带端口时不再追加
+        if host.startswith("["):
+            has_port = "]:" in host
+        elif host.count(":") > 1:
+            host, has_port = f"[{host}]", False
+        else:
+            has_port = ":" in host
+        if not has_port:
+            host = f"{host}:{self.port}"
+        return f"https://{host}/api2/json"
+
+    async def aclose(self) -> None:
+        """关闭连接池"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def get_nodes(self) -> List[Dict[str, Any]]:
+        """获取所有Proxmox节点"""
+        try:
+            return await self._get("/nodes")
+        except Exception as e:
+            logger.error(f"获取节点列表失败: {str(e)}")
+            raise wrap_error(e, "获取节点列表失败")
+
+    async def get_node_status(self, node: str) -> Dict[str, Any]:
+        """获取指定节点的状态"""
+        try:
+            return await self._get(f"/nodes/{node}/status")
+        except Exception as e:
+            logger.error(f"获取节点 {node} 状态失败: {str(e)}")
+            raise wrap_error(e, "获取节点状态失败")
+
+    async def get_vms(self, node: Optional[str] = None) -> List[Dict[str, Any]]:
+        """获取所有虚拟机
+
+        Args:
+            node: 可选的节点名称，如果指定则只返回该节点上的VM
+        """
+        try:
+            if node:
+                return await self._get(f"/nodes/{node}/qemu")
+
+            # 如果没有指定节点，一次集群级查询获取所有节点上的VM
+            return [vm for vm in (await self.get_vm_inventory()).values() if vm.get("type") == "qemu"]
+        except Exception as e:
+            logger.error(f"获取VM列表失败: {str(e)}")
+            raise wrap_error(e, "获取VM列表失败")
+
+    async def get_vm_inventory(self) -> Dict[int, Dict[str, Any]]:
+        """通过一次 /cluster/resources?type=vm 调用获取整个集群的虚拟机快照，以 vmid 为键"""
+        try:
+            resources = await self._get("/cluster/resources", {"type": "vm"})
+            return {int(resource["vmid"]): resource for resource in resources}
+        except Exception as e:
+            logger.error(f"获取集群虚拟机清单失败: {str(e)}")
+            raise wrap_error(e, "获取集群虚拟机清单失败")
+
+    async def get_vm_status(self, node: str, vmid: int) -> Dict[str, Any]:
+        """获取虚拟机状态"""
+        try:
+            return await self._get(f"/nodes/{node}/qemu/{vmid}/status/current")
+        except Exception as e:
+            logger.error(f"获取VM {vmid} 状态失败: {str(e)}")
+            raise wrap_error(e, "获取VM状态失败")
+
+    async def get_vm_config(self, node: str, vmid: int) -> Dict[str, Any]:
+        """获取虚拟机配置"""
+        try:
+            return await self._get(f"/nodes/{node}/qemu/{vmid}/config")
+        except Exception as e:
+            logger.error(f"获取VM {vmid} 配置失败: {str(e)}")
+            raise wrap_error(e, "获取VM配置失败")
+
+    async def start_vm(self, node: str, vmid: int) -> Any:
+        """启动虚拟机，返回任务UPID"""
+        try:
+            return await self._post(f"/nodes/{node}/qemu/{vmid}/status/start", priority="interactive")
+        except Exception as e:
+            logger.error(f"启动VM {vmid} 失败: {str(e)}")
+            raise wrap_error(e, "启动VM失败")
+
+    async def stop_vm(self, node: str, vmid: int) -> Any:
+        """关闭虚拟机，返回任务UPID"""
+        try:
+            return await self._post(f"/nodes/{node}/qemu/{vmid}/status/stop", priority="interactive")
+        except Exception as e:
+            logger.error(f"关闭VM {vmid} 失败: {str(e)}")
+            raise wrap_error(e, "关闭VM失败")
+
+    async def restart_vm(self, node: str, vmid: int) -> Any:
+        """重启虚拟机，返回任务UPID"""
+        try:
+            return await self._post(f"/nodes/{node}/qemu/{vmid}/status/reset", priority="interactive")
+        except Exception as e:
+            logger.error(f"重启VM {vmid} 失败: {str(e)}")
+            raise wrap_error(e, "重启VM失败")
+
+    async def create_vm(self, node: str, vm_params: Dict[str, Any]) -> Any:
+        """创建新虚拟机，返回任务UPID"""
+        try:
+            return await self._post(f"/nodes/{node}/qemu", vm_params)
+        except Exception as e:
+            logger.error(f"创建VM失败: {str(e)}")
+            raise wrap_error(e, "创建VM失败")
+
+    async def delete_vm(self, node: str, vmid: int) -> Any:
+        """删除虚拟机，返回任务UPID"""
+        try:
+            return await self._request("DELETE", f"/nodes/{node}/qemu/{vmid}")
+        except Exception as e:
+            logger.error(f"删除VM {vmid} 失败: {str(e)}")
+            raise wrap_error(e, "删除VM失败")
+
+    async def backup_vm(self, node: str, vmid: int, storage: str, compress: str = "zstd") -> Any:
+        """备份虚拟机，返回任务UPID"""
+        try:
+            backup_params = {
+                "vmid": vmid,
+                "storage": storage,
+                "compress": compress,
+                "mode": "snapshot"
+            }
+            return await self._post(f"/nodes/{node}/vzdump", backup_params)
+        except Exception as e:
+            logger.error(f"备份VM {vmid} 失败: {str(e)}")
+            raise wrap_error(e, "备份VM失败")
+
+    async def get_storage_list(self, node: str) -> List[Dict[str, Any]]:
+        """获取存储列表"""
+        try:
+            return await self._get(f"/nodes/{node}/storage")
+        except Exception as e:
+            logger.error(f"获取存储列表失败: {str(e)}")
+            raise wrap_error(e, "获取存储列表失败")
+
+    async def get_templates(self, node: str, storage: str) -> List[Dict[str, Any]]:
+        """获取可用模板列表"""
+        try:
+            return await self._get(f"/nodes/{node}/storage/{storage}/content", {"content": "vztmpl"})
+        except Exception as e:
+            logger.error(f"获取模板列表失败: {str(e)}")
+            raise wrap_error(e, "获取模板列表失败")
+
+    async def get_vm_backups(self, node: str, storage: str, vmid: Optional[int] = None) -> List[Dict[str, Any]]:
+        """获取备份列表"""
+        try:
+            backups = await self._get(f"/nodes/{node}/storage/{storage}/content", {"content": "backup"})
+            if vmid:
+                return [b for b in backups if f"vzdump-qemu-{vmid}-" in b["volid"]]
+            return backups
+        except Exception as e:
+            logger.error(f"获取备份列表失败: {str(e)}")
+            raise wrap_error(e, "获取备份列表失败")
+
+    async def get_task_status(self, node: str, upid: str) -> Dict[str, Any]:
+        """获取任务状态"""
+        try:
+            return await self._get(f"/nodes/{node}/tasks/{upid}/status")
+        except Exception as e:
+            logger.error(f"获取任务 {upid} 状态失败: {str(e)}")
+            raise wrap_error(e, "获取任务状态失败")
+
+    async def get_node_tasks(self, node: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """获取节点上最近的任务（包括正在运行的任务）"""
+        try:
+            return await self._get(f"/nodes/{node}/tasks", {"source": "all", "limit": limit})
+        except Exception as e:
+            logger.error(f"获取节点 {node} 任务列表失败: {str(e)}")
+            raise wrap_error(e, "获取任务列表失败")
+
+    async def _get(self, path: str, params: Optional[Dict[str, Any]] = None) -> Any:
+        return await self._request("GET", path, params=params)
+
+    async def _post(self, path: str, data: Optional[Dict[str, Any]] = None, priority: str = "normal") -> Any:
+        return await self._request("POST", path, data=data, priority=priority)
+
+    async def _request(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[Dict[str, Any]] = None,
+        priority: str = "normal"
+    ) -> Any:
+        """发送请求并返回响应中的 data 字段；GET 请求遇到暂时性故障时重试
+
+        涉及节点的请求在发送期间占用该节点的轻操作名额，priority 为等待名额时的优先级通道。
+        """
+        node = path.split("/")[2] if path.startswith("/nodes/") else None
+        attempts = 1 + (settings.PVE_READ_RETRIES if method == "GET" else 0)
+        for attempt in range(attempts):
+            try:
+                self.breakers.acquire(node)
+                async with self._slot(node, priority):
+                    result = await self._send(method, path, params, data)
+            except Exception as e:
+                error = classify_error(e)
+                self.breakers.record(node, error)
+                if not error.retryable or attempt + 1 >= attempts:
+                    raise error
+                delay = retry_delay(attempt)
+                logger.info(f"Proxmox读请求失败，{delay:.2f}秒后重试（第 {attempt + 1} 次）: {str(error)}")
+                await asyncio.sleep(delay)
+                continue
+
+            self.breakers.record(node)
+            return result
+
+    @asynccontextmanager
+    async def _slot(self, node: Optional[str], priority: str) -> AsyncIterator[None]:
+        """ProxmoxScheduler.slot 的协程版本：在线程池中等待名额，集群级请求不限制"""
+        if not node:
+            yield
+            return
+        # to_thread 复制当前上下文，proxmox_priority 设置的通道同样生效
+        lease = await asyncio.to_thread(self.scheduler.acquire, node, "light", priority=priority)
+        try:
+            yield
+        finally:
+            lease.release()
+
+    async def _send(
+        self,
+        method: str,
+        path: str,
+        params: Optional[Dict[str, Any]] = None,
+        data: Optional[Dict[str, Any]] = None
+    ) -> Any:
+        client = self._get_client()
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        read_timeout = settings.PVE_READ_TIMEOUT if method == "GET" else settings.PVE_WRITE_TIMEOUT
+        timeout = httpx.Timeout(read_timeout, connect=settings.PVE_CONNECT_TIMEOUT)
+
+        async with self._semaphore:
+            relogged = False
+            failovers = 0
+            while True:
+                headers = await self._auth_headers(method)
+                try:
+                    response = await client.request(
+                        method,
+                        self.base_url + path,
+                        params=self._encode(params),
+                        data=self._encode(data),
+                        headers=headers,
+                        timeout=timeout
+                    )
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    # 请求尚未发出，换一个节点重试不会重复执行写操作
+                    if failovers + 1 >= len(self.hosts):
+                        raise
+                    failovers += 1
+                    self._failover(e)
+                    continue
+                # 票据失效时重新登录一次
+                if response.status_code == 401 and not self.token_name and not relogged:
+                    relogged = True
+                    self._ticket = None
+                    continue
+                break
+
+        if response.status_code >= 400:
+            raise error_for_status(
+                response.status_code,
+                f"{response.status_code} {response.reason_phrase}: {response.text.strip()}"
+            )
+        return response.json().get("data")
+
+    async def _auth_headers(self, method: str) -> Dict[str, str]:
+        if self.token_name and self.token_value:
+            return {"Authorization": f"PVEAPIToken={self.user}!{self.token_name}={self.token_value}"}
+
+        if self._ticket is None or time.monotonic() - self._ticket_time > PVE_TICKET_RENEW_SECONDS:
+            await self._login()
+
+        headers = {"Cookie": f"PVEAuthCookie={self._ticket}"}
+        if method != "GET":
+            headers["CSRFPreventionToken"] = self._csrf_token
+        return headers
+
+    async def _login(self) -> None:
+        """使用用户名和密码获取票据，并发请求只登录一次"""
+        if self._login_lock is None:
+            self._login_lock = asyncio.Lock()
+
+        async with self._login_lock:
+            if self._ticket is not None and time.monotonic() - self._ticket_time <= PVE_TICKET_RENEW_SECONDS:
+                return
+
+            for failovers in range(len(self.hosts)):
+                try:
+                    response = await self._get_client().post(
+                        self.base_url + "/access/ticket",
+                        data={"username": self.user, "password": self.password}
+                    )
+                    break
+                except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                    if failovers + 1 >= len(self.hosts):
+                        raise
+                    self._failover(e)
+            if response.status_code >= 400:
+                raise error_for_status(
+                    401 if response.status_code < 500 else response.status_code,
+                    f"Proxmox认证失败: {response.status_code} {response.reason_phrase}"
+                )
+
+            result = response.json()["data"]
+            self._ticket = result["ticket"]
+            self._csrf_token = result["CSRFPreventionToken"]
+            self._ticket_time = time.monotonic()
+            logger.info(f"已获取Proxmox服务器 {self.host} 的登录票据")
+
+    def _failover(self, error: Exception) -> None:
+        """切换到下一个节点的API地址；票据在集群内通用，无需重新登录"""
+        failed = self.host
+        self._host_index = (self._host_index + 1) % len(self.hosts)
+        logger.warning(f"Proxmox节点 {failed} 不可达（{str(error)}），切换到 {self.host}")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # 不设置 base_url：请求使用当前节点的完整地址，连接池按主机分别保持长连接
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                verify=self.verify_ssl,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections
+                ),
+                transport=self.transport
+            )
+        return self._client
+
+    @staticmethod
+    def _encode(values: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Proxmox 的布尔参数使用 0/1"""
+        if values is None:
+            return None
+        return {
+            key: int(value) if isinstance(value, bool) else value
+            for key, value in values.items() if value is not None
+        }
+
+async_proxmox_service = AsyncProxmoxService()
@@ -0,0 +1,143 @@
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from backend.app.core.config import settings
+from backend.app.services.proxmox_errors import (
+    ProxmoxError, ProxmoxCircuitOpenError, ProxmoxUnavailableError, ProxmoxTimeoutError
+)
+
+logger = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    """熔断器
+
+    连续 failure_threshold 次暂时性故障后打开，打开期间直接拒绝调用；reset_timeout 秒后
+    进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+    探测请求 reset_timeout 秒内没有结果时允许下一个探测，避免一直停在半开状态。
+    """
+
+    def __init__(self, name: str, failure_threshold: Optional[int] = None, reset_timeout: Optional[float] = None):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.PVE_BREAKER_FAILURES
+        self.reset_timeout = reset_timeout or settings.PVE_BREAKER_RESET_TIMEOUT
+        self._lock = threading.Lock()
+        self._state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_at = 0.0
+
+    def allow(self) -> bool:
+        """是否放行一次调用"""
+        with self._lock:
+            if self._state == "closed":
+                return True
+            now = time.monotonic()
+            if self._state == "open":
+                if now - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = "half_open"
+            elif now - self._probe_at < self.reset_timeout:
+                return False
+            self._probe_at = now
+            return True
+
+    def abandon_probe(self) -> None:
+        """放行的探测请求没有发出时交还探测名额"""
+        with self._lock:
+            if self._state == "half_open":
+                self._probe_at = 0.0
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != "closed":
+                logger.info(f"Proxmox熔断器 {self.name} 已恢复")
+            self._state = "closed"
+            self._failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == "half_open" or (self._state == "closed" and self._failures >= self.failure_threshold):
+                logger.warning(f"Proxmox熔断器 {self.name} 打开（连续失败 {self._failures} 次）")
+                self._state = "open"
+                self._opened_at = time.monotonic()
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state == "closed":
+                return 0.0
+            started = self._opened_at if self._state == "open" else self._probe_at
+            return max(0.0, self.reset_timeout - (time.monotonic() - started))
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self._state, "failures": self._failures}
+
+class ProxmoxBreakers:
+    """一个集群的熔断器：整个集群一个（API地址不可达），每个节点一个（节点故障）"""
+
+    def __init__(self, cluster_name: str):
+        self.cluster_name = cluster_name
+        self.cluster = CircuitBreaker(cluster_name)
+        self._nodes: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def node(self, node: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._nodes.get(node)
+            if breaker is None:
+                breaker = self._nodes[node] = CircuitBreaker(f"{self.cluster_name}/{node}")
+            return breaker
+
+    def acquire(self, node: Optional[str] = None) -> None:
+        """熔断器打开时立即抛出 ProxmoxCircuitOpenError
+
+        先检查节点熔断器；被后面的熔断器拒绝时，交还前面半开熔断器已放行的探测名额，
+        否则没有发出的探测请求会让它一直停在半开状态。
+        """
+        breakers: List[CircuitBreaker] = [self.node(node)] if node else []
+        breakers.append(self.cluster)
+        for index, breaker in enumerate(breakers):
+            if not breaker.allow():
+                for allowed in breakers[:index]:
+                    allowed.abandon_probe()
+                raise ProxmoxCircuitOpenError(
+                    f"Proxmox {breaker.name} 暂不可用，{breaker.retry_after():.0f}秒后重试"
+                )
+
+    def record(self, node: Optional[str], error: Optional[ProxmoxError] = None) -> None:
+        """记录一次调用结果
+
+        连接失败计入集群熔断器；网关错误和超时发生在访问具体节点时计入节点熔断器。
+        其他错误说明Proxmox正常响应了请求，按成功处理。
+        """
+        if isinstance(error, ProxmoxCircuitOpenError):
+            return
+        if not isinstance(error, ProxmoxUnavailableError):
+            self.cluster.record_success()
+            if node:
+                self.node(node).record_success()
+            return
+
+        node_failure = node and (error.status_code is not None or isinstance(error, ProxmoxTimeoutError))
+        if node_failure:
+            self.cluster.record_success()
+            self.node(node).record_failure()
+        else:
+            self.cluster.record_failure()
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            nodes = dict(self._nodes)
+        return {
+            "cluster": self.cluster.status(),
+            "nodes": {name: breaker.status() for name, breaker in nodes.items()}
+        }
+
+def retry_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间，指数增长并加全抖动，避免故障恢复时请求同时涌入"""
+    ceiling = min(settings.PVE_RETRY_BACKOFF_MAX, settings.PVE_RETRY_BACKOFF * 2 ** attempt)
+    return random.uniform(0, ceiling)
@@ -0,0 +1,110 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class _Flight:
+    """一次正在进行的加载，同一键的并发请求等待它的结果"""
+
+    def __init__(self, generation: int):
+        self.generation = generation
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+class ProxmoxCache:
+    """带 TTL 与 LRU 上限的 Proxmox 读请求缓存
+
+    键为元组，第一个元素是方法名，其余为调用参数，例如 ("get_vm_config", "pve1", 100)。
+    同一键的并发未命中只会触发一次加载（single-flight），其余线程等待同一结果。
+    写操作通过 invalidate 按键前缀清除受影响的条目；加载期间发生的失效会使该次结果不被缓存。
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[float, Any]]" = OrderedDict()
+        self._flights: Dict[Tuple[Hashable, ...], _Flight] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._counters = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+        self._method_counters: Dict[str, Dict[str, int]] = {}
+
+    def get_or_load(self, key: Tuple[Hashable, ...], ttl: float, loader: Callable[[], Any]) -> Any:
+        """返回缓存中未过期的值，否则调用 loader 加载并缓存 ttl 秒"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._count(key, "hits")
+                return entry[1]
+
+            flight = self._flights.get(key)
+            if flight is not None:
+                self._count(key, "coalesced")
+                owner = False
+            else:
+                self._count(key, "misses")
+                flight = _Flight(self._generation)
+                self._flights[key] = flight
+                owner = True
+
+        if not owner:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = loader()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                if flight.error is None and flight.generation == self._generation:
+                    self._store(key, ttl, flight.result)
+            flight.event.set()
+
+        return flight.result
+
+    def invalidate(self, *prefix: Hashable) -> int:
+        """清除键以 prefix 开头的条目，不带参数时清空缓存，返回清除的条目数"""
+        with self._lock:
+            self._generation += 1
+            keys = [key for key in self._entries if key[:len(prefix)] == prefix]
+            for key in keys:
+                del self._entries[key]
+            self._counters["invalidations"] += len(keys)
+            return len(keys)
+
+    def clear(self) -> int:
+        return self.invalidate()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中/未命中计数，coalesced 为被合并到同一次加载的请求数"""
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"] + self._counters["coalesced"]
+            served = self._counters["hits"] + self._counters["coalesced"]
+            return dict(
+                self._counters,
+                entries=len(self._entries),
+                max_entries=self.max_entries,
+                hit_ratio=round(served / lookups, 4) if lookups else 0,
+                methods={method: dict(counters) for method, counters in self._method_counters.items()}
+            )
+
+    def _store(self, key: Tuple[Hashable, ...], ttl: float, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def _count(self, key: Tuple[Hashable, ...], counter: str) -> None:
+        self._counters[counter] += 1
+        method_counters = self._method_counters.setdefault(str(key[0]), {"hits": 0, "misses": 0, "coalesced": 0})
+        method_counters[counter] += 1
@@ -0,0 +1,134 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, TypeVar, Union
+
+from backend.app.core.config import settings
+from backend.app.services.proxmox import ProxmoxService, proxmox_service
+from backend.app.services.proxmox_async import AsyncProxmoxService, async_proxmox_service
+from backend.app.services.proxmox_simulator import PVESimulator
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLUSTER = "default"
+
+T = TypeVar("T")
+
+class ProxmoxClusterRegistry:
+    """Proxmox 集群注册表
+
+    每个集群各有一个同步客户端（ProxmoxService）和一个异步连接池客户端（AsyncProxmoxService），
+    二者都在集群的多个节点API地址之间故障切换，并共用该集群的熔断器和调度器。
+    未配置 PVE_CLUSTERS 时只有 default 集群，直接复用 proxmox_service 和 async_proxmox_service 单例。
+    配置了 PVE_SIMULATOR 时每个集群各接入一个进程内的 PVESimulator。
+    """
+
+    def __init__(self, clusters: Optional[Dict[str, Dict[str, Any]]] = None, default: Optional[str] = None):
+        if clusters is None:
+            clusters = self._load_config()
+
+        self._services: Dict[str, ProxmoxService] = {}
+        self._async_services: Dict[str, AsyncProxmoxService] = {}
+
+        if not clusters:
+            # 同一集群的同步与异步客户端共用熔断器和调度器
+            async_proxmox_service.breakers = proxmox_service.breakers
+            async_proxmox_service.scheduler = proxmox_service.scheduler
+            self._services[DEFAULT_CLUSTER] = proxmox_service
+            self._async_services[DEFAULT_CLUSTER] = async_proxmox_service
+            self.default_name = DEFAULT_CLUSTER
+            self._attach_simulators()
+            return
+
+        for name, options in clusters.items():
+            hosts = options.get("hosts") or [options.get("host") or settings.PVE_HOST]
+            auth = {key: options.get(key) for key in ("user", "password", "token_name", "token_value")}
+            service = ProxmoxService(name=name, hosts=hosts, **auth)
+            self._services[name] = service
+            self._async_services[name] = AsyncProxmoxService(
+                hosts=hosts, breakers=service.breakers, scheduler=service.scheduler, **auth
+            )
+
+        self.default_name = default or settings.PVE_DEFAULT_CLUSTER or next(iter(clusters))
+        if self.default_name not in self._services:
+            raise Exception(f"默认集群 {self.default_name} 不在集群配置中")
+        logger.info(f"已加载 {len(clusters)} 个Proxmox集群，默认集群: {self.default_name}")
+        self._attach_simulators()
+
+    def names(self) -> List[str]:
+        return list(self._services)
+
+    def resolve(self, name: Optional[str] = None) -> str:
+        """返回集群名称，为空时返回默认集群"""
+        name = name or self.default_name
+        if name not in self._services:
+            raise Exception(f"未知的Proxmox集群: {name}")
+        return name
+
+    def get(self, name: Optional[str] = None) -> ProxmoxService:
+        """获取集群的同步客户端，name 为空时返回默认集群"""
+        return self._services[self.resolve(name)]
+
+    def get_async(self, name: Optional[str] = None) -> AsyncProxmoxService:
+        """获取集群的异步客户端，name 为空时返回默认集群"""
+        return self._async_services[self.resolve(name)]
+
+    def fan_out(self, call: Callable[[ProxmoxService], T]) -> Dict[str, Union[T, Exception]]:
+        """在所有集群上并发执行 call，返回 集群名称 -> 结果；单个集群失败时对应的值为异常"""
+        services = list(self._services.items())
+        if len(services) == 1:
+            name, service = services[0]
+            return {name: self._call(call, name, service)}
+
+        with ThreadPoolExecutor(max_workers=min(settings.PVE_FANOUT_WORKERS, len(services))) as executor:
+            futures = {name: executor.submit(self._call, call, name, service) for name, service in services}
+            return {name: future.result() for name, future in futures.items()}
+
+    def connection_status(self) -> List[Dict[str, Any]]:
+        return [
+            dict(service.connection_status(), default=name == self.default_name)
+            for name, service in self._services.items()
+        ]
+
+    async def aclose(self) -> None:
+        """关闭所有集群的异步连接池"""
+        for service in self._async_services.values():
+            await service.aclose()
+
+    @staticmethod
+    def _call(call: Callable[[ProxmoxService], T], name: str, service: ProxmoxService) -> Union[T, Exception]:
+        try:
+            return call(service)
+        except Exception as e:
+            logger.warning(f"Proxmox集群 {name} 调用失败: {str(e)}")
+            return e
+
+    def _attach_simulators(self) -> None:
+        self.simulators: Dict[str, PVESimulator] = {}
+        if not settings.PVE_SIMULATOR:
+            return
+        try:
+            options = json.loads(settings.PVE_SIMULATOR)
+        except ValueError as e:
+            raise Exception(f"PVE_SIMULATOR 不是有效的JSON: {str(e)}")
+        if not isinstance(options, dict):
+            raise Exception("PVE_SIMULATOR 必须是JSON对象")
+        for name, service in self._services.items():
+            simulator = PVESimulator(cluster_name=name, **options)
+            simulator.attach(service, self._async_services[name])
+            self.simulators[name] = simulator
+        logger.warning(f"Proxmox集群 {', '.join(self.simulators)} 使用模拟器，不会访问真实的Proxmox")
+
+    @staticmethod
+    def _load_config() -> Dict[str, Dict[str, Any]]:
+        if not settings.PVE_CLUSTERS:
+            return {}
+        try:
+            clusters = json.loads(settings.PVE_CLUSTERS)
+        except ValueError as e:
+            raise Exception(f"PVE_CLUSTERS 不是有效的JSON: {str(e)}")
+        if not isinstance(clusters, dict):
+            raise Exception("PVE_CLUSTERS 必须是以集群名称为键的JSON对象")
+        return clusters
+
+proxmox_clusters = ProxmoxClusterRegistry()
@@ -0,0 +1,77 @@
+from typing import Optional
+
+import httpx
+import requests
+from proxmoxer.core import ResourceException, AuthenticationError
+
+# pveproxy 转发到其他节点失败时返回 595/596，与网关错误一样属于暂时性故障
+TRANSIENT_STATUS_CODES = {502, 503, 504, 595, 596}
+
+class ProxmoxError(Exception):
+    """Proxmox 调用失败
+
+    子类区分失败原因，retryable 表示对幂等的读请求重试可能成功。
+    """
+    retryable = False
+
+    def __init__(self, message: str, status_code: Optional[int] = None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def wrap(self, context: str) -> "ProxmoxError":
+        """返回同类型、消息前加上 context 的异常"""
+        return type(self)(f"{context}: {self}", self.status_code)
+
+class ProxmoxUnavailableError(ProxmoxError):
+    """网络不通、网关错误或节点不可达"""
+    retryable = True
+
+class ProxmoxTimeoutError(ProxmoxUnavailableError):
+    """请求超时"""
+
+class ProxmoxCircuitOpenError(ProxmoxUnavailableError):
+    """熔断器打开或连接处于退避期，未发出请求"""
+    retryable = False
+
+class ProxmoxAuthError(ProxmoxError):
+    """认证失败或权限不足"""
+
+class ProxmoxNotFoundError(ProxmoxError):
+    """资源不存在"""
+
+class ProxmoxRequestError(ProxmoxError):
+    """请求被Proxmox拒绝，例如参数错误或VM状态不允许该操作"""
+
+def classify_error(error: BaseException) -> ProxmoxError:
+    """把 proxmoxer、requests、httpx 的异常转换为 ProxmoxError"""
+    if isinstance(error, ProxmoxError):
+        return error
+
+    if isinstance(error, ResourceException):
+        message = f"{error.status_code} {error.status_message}: {error.content}"
+        return error_for_status(error.status_code, message)
+
+    if isinstance(error, AuthenticationError):
+        return ProxmoxAuthError(str(error))
+
+    if isinstance(error, (requests.exceptions.Timeout, httpx.TimeoutException)):
+        return ProxmoxTimeoutError(f"请求超时: {str(error)}")
+
+    if isinstance(error, (requests.exceptions.ConnectionError, httpx.TransportError)):
+        return ProxmoxUnavailableError(f"无法连接: {str(error)}")
+
+    return ProxmoxError(str(error))
+
+def error_for_status(status_code: int, message: str) -> ProxmoxError:
+    """根据HTTP状态码选择异常类型"""
+    if status_code in (401, 403):
+        return ProxmoxAuthError(message, status_code)
+    if status_code == 404:
+        return ProxmoxNotFoundError(message, status_code)
+    if status_code in TRANSIENT_STATUS_CODES:
+        return ProxmoxUnavailableError(message, status_code)
+    return ProxmoxRequestError(message, status_code)
+
+def wrap_error(error: BaseException, context: str) -> ProxmoxError:
+    """分类后在消息前加上 context，用于各接口方法重新抛出"""
+    return classify_error(error).wrap(context)
@@ -0,0 +1,221 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from backend.app.core.config import settings
+from backend.app.services.proxmox_errors import ProxmoxUnavailableError
+
+logger = logging.getLogger(__name__)
+
+# 优先级通道，数值越小越先获得执行名额
+PRIORITIES = {"interactive": 0, "normal": 1, "bulk": 2}
+
+# 当前调用链的优先级通道，批量任务用 proxmox_priority("bulk") 包住即可，不需要逐层传参
+_current_priority: ContextVar[Optional[str]] = ContextVar("proxmox_priority", default=None)
+
+@contextmanager
+def proxmox_priority(lane: str) -> Iterator[None]:
+    """在代码块内发出的Proxmox操作使用指定的优先级通道"""
+    if lane not in PRIORITIES:
+        raise Exception(f"未知的优先级: {lane}")
+    token = _current_priority.set(lane)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "event", "granted", "cancelled")
+
+    def __init__(self, priority: int, seq: int):
+        self.priority = priority
+        self.seq = seq
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+class PrioritySemaphore:
+    """按优先级分配名额的信号量，同一优先级先到先得
+
+    名额释放时直接交给优先级最高的等待者，不会被新来的请求插队。
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._in_use = 0
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def acquire(self, priority: int, timeout: Optional[float] = None) -> bool:
+        with self._lock:
+            if self._in_use < self.limit and not self._waiters:
+                self._in_use += 1
+                return True
+            waiter = _Waiter(priority, next(self._seq))
+            heapq.heappush(self._waiters, waiter)
+
+        if waiter.event.wait(timeout):
+            return True
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            return False
+
+    def release(self) -> None:
+        with self._lock:
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if waiter.cancelled:
+                    continue
+                # 名额直接转交，in_use 不变
+                waiter.granted = True
+                waiter.event.set()
+                return
+            self._in_use -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            waiting = sum(1 for waiter in self._waiters if not waiter.cancelled)
+            return {"in_use": self._in_use, "limit": self.limit, "waiting": waiting}
+
+class Lease:
+    """一次操作占用的执行名额"""
+
+    def __init__(self, semaphores: List[PrioritySemaphore]):
+        self._semaphores = semaphores
+        self._released = False
+        self._lock = threading.Lock()
+        self.acquired_at = time.monotonic()
+
+    def release(self) -> None:
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        for semaphore in reversed(self._semaphores):
+            semaphore.release()
+
+class ProxmoxScheduler:
+    """一个集群的Proxmox操作调度器
+
+    重操作（克隆/创建、备份、删除）按节点和存储分别限制并发，名额一直占用到Proxmox
+    任务结束（由任务跟踪线程调用 task_finished 释放；任务由其他进程的跟踪线程处理时，
+    本进程的跟踪线程按数据库中的任务状态释放）；轻操作（状态查询、开关机）
+    只在HTTP请求期间按节点限制并发。等待名额时按 interactive > normal > bulk 排队。
+    """
+
+    def __init__(self, cluster_name: str):
+        self.cluster_name = cluster_name
+        self._limiters: Dict[Tuple[str, str, str], PrioritySemaphore] = {}
+        self._held: Dict[str, Lease] = {}
+        self._lock = threading.Lock()
+
+    def acquire(
+        self,
+        node: str,
+        weight: str = "light",
+        storage: Optional[str] = None,
+        priority: str = "normal",
+        timeout: Optional[float] = None
+    ) -> Lease:
+        """获取执行名额，priority 会被 proxmox_priority 设置的通道覆盖；排队超时抛出 ProxmoxUnavailableError"""
+        if weight == "heavy":
+            self._expire_held()
+        lane = _current_priority.get() or priority
+        rank = PRIORITIES[lane]
+        timeout = settings.PVE_SCHEDULER_WAIT_TIMEOUT if timeout is None else timeout
+
+        # 固定按 节点 -> 存储 的顺序获取，避免互相等待
+        keys = [("node", node, weight)]
+        if weight == "heavy" and storage:
+            keys.append(("storage", storage, weight))
+
+        acquired: List[PrioritySemaphore] = []
+        deadline = time.monotonic() + timeout
+        for key in keys:
+            semaphore = self._limiter(key)
+            if not semaphore.acquire(rank, max(0.0, deadline - time.monotonic())):
+                Lease(acquired).release()
+                raise ProxmoxUnavailableError(
+                    f"{key[0]} {key[1]} 的{'重' if weight == 'heavy' else '轻'}操作排队超过 {timeout:.0f} 秒"
+                )
+            acquired.append(semaphore)
+        return Lease(acquired)
+
+    @contextmanager
+    def slot(self, node: Optional[str], weight: str = "light", priority: str = "normal") -> Iterator[None]:
+        """在代码块执行期间占用名额，node 为空（集群级请求）时不限制"""
+        if not node:
+            yield
+            return
+        lease = self.acquire(node, weight, priority=priority)
+        try:
+            yield
+        finally:
+            lease.release()
+
+    def hold(self, lease: Lease, upid: Any) -> None:
+        """名额一直占用到任务 upid 结束；upid 无效时立即释放"""
+        if not isinstance(upid, str) or not upid.startswith("UPID:"):
+            lease.release()
+            return
+        with self._lock:
+            self._held[upid] = lease
+
+    def task_finished(self, upid: str) -> None:
+        """Proxmox任务结束，释放其占用的名额"""
+        with self._lock:
+            lease = self._held.pop(upid, None)
+        if lease:
+            lease.release()
+
+    def held_upids(self) -> List[str]:
+        """仍占用名额的任务UPID"""
+        with self._lock:
+            return list(self._held)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            limiters = dict(self._limiters)
+            held = len(self._held)
+        return {
+            "held_tasks": held,
+            "limiters": {":".join(key): semaphore.stats() for key, semaphore in limiters.items()}
+        }
+
+    def _limiter(self, key: Tuple[str, str, str]) -> PrioritySemaphore:
+        with self._lock:
+            semaphore = self._limiters.get(key)
+            if semaphore is None:
+                scope, _, weight = key
+                if weight != "heavy":
+                    limit = settings.PVE_NODE_LIGHT_CONCURRENCY
+                elif scope == "node":
+                    limit = settings.PVE_NODE_HEAVY_CONCURRENCY
+                else:
+                    limit = settings.PVE_STORAGE_HEAVY_CONCURRENCY
+                semaphore = self._limiters[key] = PrioritySemaphore(limit)
+            return semaphore
+
+    def _expire_held(self) -> None:
+        """释放超过 PVE_HEAVY_LEASE_TIMEOUT 仍未收到结束通知的任务名额（例如任务未被跟踪）"""
+        now = time.monotonic()
+        with self._lock:
+            expired = [
+                upid for upid, lease in self._held.items()
+                if now - lease.acquired_at > settings.PVE_HEAVY_LEASE_TIMEOUT
+            ]
+            leases = [self._held.pop(upid) for upid in expired]
+        for upid, lease in zip(expired, leases):
+            logger.warning(f"Proxmox任务 {upid} 超时未结束，释放其执行名额")
+            lease.release()
@@ -0,0 +1,589 @@
+import asyncio
+import heapq
+import itertools
+import json
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from urllib.parse import parse_qsl, urlsplit
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter
+
+logger = logging.getLogger(__name__)
+
+# 各类任务的默认执行时间（秒），接近真实集群上小规格VM的耗时
+DEFAULT_TASK_DURATIONS = {
+    "qmstart": 1.0,
+    "qmstop": 1.0,
+    "qmshutdown": 3.0,
+    "qmreset": 1.0,
+    "qmcreate": 5.0,
+    "qmclone": 20.0,
+    "qmdestroy": 3.0,
+    "vzdump": 30.0
+}
+
+DEFAULT_TEMPLATES = [
+    "ubuntu-22.04-standard_22.04-1_amd64.tar.zst",
+    "debian-12-standard_12.2-1_amd64.tar.zst",
+    "centos-9-stream-default_20221109_amd64.tar.xz"
+]
+
+API_PREFIX = "/api2/json"
+
+class SimulatedError(Exception):
+    """模拟器返回的HTTP错误"""
+
+    def __init__(self, status_code: int, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+
+class _Fault:
+    __slots__ = ("method", "pattern", "status_code", "delay", "remaining")
+
+    def __init__(self, method: Optional[str], pattern: str, status_code: Optional[int], delay: float, times: Optional[int]):
+        self.method = method.upper() if method else None
+        self.pattern = re.compile(pattern)
+        self.status_code = status_code
+        self.delay = delay
+        self.remaining = times
+
+class PVESimulator:
+    """进程内的 Proxmox VE REST API 模拟器
+
+    实现 ProxmoxService 和 AsyncProxmoxService 用到的接口：节点、QEMU虚拟机（状态、配置、
+    创建/克隆、开关机、删除）、vzdump 备份、存储内容、任务和集群资源。写操作与真实集群一样
+    立即返回 UPID，任务按 task_durations 设置的时间在后台“执行”，结束时才改变虚拟机状态。
+
+    同步客户端通过 requests_adapter() 挂载到 proxmoxer 的会话上，异步客户端通过
+    httpx_transport() 接入，两者都不访问网络，可在笔记本上模拟上万台虚拟机的集群。
+
+    Args:
+        nodes: 节点数量或节点名称列表
+        vms: 初始虚拟机数量，VMID 从100开始依次分配到各节点
+        storages: 每个节点上的存储名称
+        latency/jitter: 每个请求的固定延迟和随机附加延迟（秒）
+        error_rate/error_status: 按该概率对非登录请求返回 error_status
+        task_durations: 覆盖各类任务的执行时间（秒）
+        task_failure_rate: 任务以错误结束的概率
+        time_scale: 所有任务执行时间乘以该系数，基准测试时可调小
+        seed: 随机数种子，便于重复测试
+    """
+
+    def __init__(
+        self,
+        nodes: Union[int, Iterable[str]] = 3,
+        vms: int = 0,
+        storages: Iterable[str] = ("local", "local-lvm"),
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_rate: float = 0.0,
+        error_status: int = 503,
+        task_durations: Optional[Dict[str, float]] = None,
+        task_failure_rate: float = 0.0,
+        time_scale: float = 1.0,
+        seed: Optional[int] = None,
+        cluster_name: str = "sim"
+    ):
+        names = [f"pve{index + 1}" for index in range(nodes)] if isinstance(nodes, int) else list(nodes)
+        if not names:
+            raise Exception("模拟集群至少需要一个节点")
+        self.cluster_name = cluster_name
+        self.storages = list(storages)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.task_durations = dict(DEFAULT_TASK_DURATIONS, **(task_durations or {}))
+        self.task_failure_rate = task_failure_rate
+        self.time_scale = time_scale
+
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._nodes: Dict[str, Dict[str, Any]] = {
+            name: {"node": name, "status": "online", "maxcpu": 64, "maxmem": 256 * 1024 ** 3} for name in names
+        }
+        self._vms: Dict[int, Dict[str, Any]] = {}
+        self._tasks: Dict[str, Dict[str, Any]] = {}
+        self._node_tasks: Dict[str, List[str]] = {name: [] for name in names}
+        self._pending: List[Tuple[float, str]] = []
+        self._backups: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        self._faults: List[_Fault] = []
+        self._pid = itertools.count(0x1000)
+        self._started = time.time()
+        self.requests: Counter = Counter()
+
+        for index in range(vms):
+            node = names[index % len(names)]
+            status = "running" if self._random.random() < 0.9 else "stopped"
+            self._add_vm(100 + index, node, {"name": f"vm{100 + index}", "cores": 2, "memory": 2048}, status)
+
+        self._routes: List[Tuple[str, re.Pattern, Callable[..., Any]]] = [
+            ("POST", re.compile(r"^/access/ticket$"), self._login),
+            ("GET", re.compile(r"^/version$"), lambda params: {"version": "8.1.3", "release": "8.1", "repoid": "sim"}),
+            ("GET", re.compile(r"^/cluster/resources$"), self._cluster_resources),
+            ("GET", re.compile(r"^/cluster/nextid$"), self._next_id),
+            ("GET", re.compile(r"^/nodes$"), self._list_nodes),
+            ("GET", re.compile(r"^/nodes/([^/]+)/status$"), self._node_status),
+            ("GET", re.compile(r"^/nodes/([^/]+)/qemu$"), self._list_vms),
+            ("POST", re.compile(r"^/nodes/([^/]+)/qemu$"), self._create_vm),
+            ("DELETE", re.compile(r"^/nodes/([^/]+)/qemu/(\d+)$"), self._destroy_vm),
+            ("GET", re.compile(r"^/nodes/([^/]+)/qemu/(\d+)/status/current$"), self._vm_status),
+            ("POST", re.compile(r"^/nodes/([^/]+)/qemu/(\d+)/status/(start|stop|shutdown|reset)$"), self._power),
+            ("GET", re.compile(r"^/nodes/([^/]+)/qemu/(\d+)/config$"), self._vm_config),
+            ("POST", re.compile(r"^/nodes/([^/]+)/qemu/(\d+)/clone$"), self._clone_vm),
+            ("POST", re.compile(r"^/nodes/([^/]+)/vzdump$"), self._vzdump),
+            ("GET", re.compile(r"^/nodes/([^/]+)/storage$"), self._list_storage),
+            ("GET", re.compile(r"^/nodes/([^/]+)/storage/([^/]+)/content$"), self._storage_content),
+            ("GET", re.compile(r"^/nodes/([^/]+)/tasks$"), self._list_tasks),
+            ("GET", re.compile(r"^/nodes/([^/]+)/tasks/([^/]+)/status$"), self._task_status)
+        ]
+
+    def requests_adapter(self) -> "SimulatorAdapter":
+        """供 proxmoxer（requests）会话挂载的传输适配器"""
+        return SimulatorAdapter(self)
+
+    def httpx_transport(self) -> httpx.MockTransport:
+        """供 httpx.AsyncClient 使用的传输层"""
+        async def handler(request: httpx.Request) -> httpx.Response:
+            params = dict(request.url.params.multi_items())
+            if request.content:
+                params.update(parse_qsl(request.content.decode()))
+            status_code, body, delay = self.dispatch(request.method, request.url.path, params)
+
+            read_timeout = (request.extensions.get("timeout") or {}).get("read")
+            if read_timeout is not None and delay > read_timeout:
+                await asyncio.sleep(read_timeout)
+                raise httpx.ReadTimeout("模拟请求超时", request=request)
+            if delay:
+                await asyncio.sleep(delay)
+            return httpx.Response(status_code, json=body, request=request)
+
+        return httpx.MockTransport(handler)
+
+    def attach(self, service: Any, async_service: Any = None) -> None:
+        """让同步客户端（以及可选的异步客户端）改为访问本模拟器
+
+        proxmoxer 的密码登录不经过会话，无法截获，因此同步客户端改用任意API令牌。
+        """
+        service.transport = self.requests_adapter()
+        if not (service.token_name and service.token_value):
+            service.token_name, service.token_value = "simulator", "simulator"
+        service.reset()
+        if async_service is not None:
+            async_service.transport = self.httpx_transport()
+            async_service._client = None
+
+    def inject(
+        self,
+        path: str,
+        method: Optional[str] = None,
+        status_code: Optional[int] = 503,
+        delay: float = 0.0,
+        times: Optional[int] = 1
+    ) -> None:
+        """让匹配 path（正则，不含 /api2/json）的请求返回 status_code 或额外延迟 delay 秒
+
+        status_code 为 None 时只增加延迟，可用于触发客户端超时；times 为 None 时一直生效。
+        """
+        with self._lock:
+            self._faults.append(_Fault(method, path, status_code, delay, times))
+
+    def clear_faults(self) -> None:
+        with self._lock:
+            self._faults.clear()
+
+    def set_node_online(self, node: str, online: bool = True) -> None:
+        """节点离线时该节点的请求返回 595，与 pveproxy 无法转发时相同"""
+        with self._lock:
+            self._get_node(node)["status"] = "online" if online else "offline"
+
+    def vm(self, vmid: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._advance()
+            vm = self._vms.get(vmid)
+            return dict(vm) if vm else None
+
+    def vm_list(self) -> List[Dict[str, Any]]:
+        """按 VMID 排序的所有虚拟机，用于按模拟集群准备测试数据"""
+        with self._lock:
+            self._advance()
+            return [self._vm_summary(self._vms[vmid]) for vmid in sorted(self._vms)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._advance()
+            return {
+                "nodes": len(self._nodes),
+                "vms": len(self._vms),
+                "running_tasks": len(self._pending),
+                "tasks": len(self._tasks),
+                "requests": sum(self.requests.values()),
+                "requests_by_route": dict(self.requests)
+            }
+
+    def dispatch(self, method: str, path: str, params: Dict[str, Any]) -> Tuple[int, Dict[str, Any], float]:
+        """处理一次请求，返回 (状态码, 响应体, 应延迟的秒数)；延迟由传输层负责等待"""
+        method = method.upper()
+        if path.startswith(API_PREFIX):
+            path = path[len(API_PREFIX):]
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+
+        with self._lock:
+            self._advance()
+            try:
+                fault = self._match_fault(method, path)
+                if fault is not None:
+                    delay += fault.delay
+                    if fault.status_code is not None:
+                        raise SimulatedError(fault.status_code, "模拟故障")
+                if path != "/access/ticket" and self.error_rate and self._random.random() < self.error_rate:
+                    raise SimulatedError(self.error_status, "模拟的随机错误")
+
+                for route_method, pattern, handler in self._routes:
+                    match = pattern.match(path)
+                    if match and route_method == method:
+                        self.requests[f"{method} {pattern.pattern}"] += 1
+                        node = match.group(1) if path.startswith("/nodes/") else None
+                        if node is not None and self._get_node(node)["status"] != "online":
+                            raise SimulatedError(595, f"Connection refused: no route to host {node}")
+                        return 200, {"data": handler(params, *match.groups())}, delay
+                raise SimulatedError(501, f"Method '{method} {path}' not implemented")
+            except SimulatedError as e:
+                return e.status_code, {"data": None, "message": str(e)}, delay
+
+    def _match_fault(self, method: str, path: str) -> Optional[_Fault]:
+        for fault in self._faults:
+            if fault.method not in (None, method) or not fault.pattern.search(path):
+                continue
+            if fault.remaining is not None:
+                fault.remaining -= 1
+                if fault.remaining <= 0:
+                    self._faults.remove(fault)
+            return fault
+        return None
+
+    def _start_task(
+        self,
+        node: str,
+        task_type: str,
+        object_id: Any,
+        effect: Callable[[], Optional[str]],
+        rollback: Optional[Callable[[], None]] = None,
+        user: str = "root@pam"
+    ) -> str:
+        """登记一个任务，到期时执行 effect，effect 返回错误信息时任务失败；按 task_failure_rate 失败时执行 rollback"""
+        now = time.time()
+        upid = f"UPID:{node}:{next(self._pid):08X}:{int((now - self._started) * 100):08X}:{int(now):08X}:{task_type}:{object_id}:{user}:"
+        duration = self.task_durations.get(task_type, 1.0) * self.time_scale
+        self._tasks[upid] = {
+            "upid": upid,
+            "node": node,
+            "type": task_type,
+            "id": str(object_id),
+            "user": user,
+            "pid": int(upid.split(":")[2], 16),
+            "starttime": int(now),
+            "effect": effect,
+            "rollback": rollback
+        }
+        self._node_tasks[node].append(upid)
+        heapq.heappush(self._pending, (time.monotonic() + duration, upid))
+        return upid
+
+    def _advance(self) -> None:
+        """结束所有到期的任务（调用方持有锁）"""
+        now = time.monotonic()
+        while self._pending and self._pending[0][0] <= now:
+            _, upid = heapq.heappop(self._pending)
+            task = self._tasks[upid]
+            effect, rollback = task.pop("effect"), task.pop("rollback")
+            if self.task_failure_rate and self._random.random() < self.task_failure_rate:
+                error = "模拟的任务失败"
+                if rollback is not None:
+                    rollback()
+            else:
+                try:
+                    error = effect()
+                except Exception as e:
+                    error = str(e)
+            task["endtime"] = int(time.time())
+            task["status"] = task["exitstatus"] = error or "OK"
+
+    def _task_entry(self, task: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in task.items() if key not in ("effect", "rollback", "exitstatus")}
+
+    def _list_tasks(self, params: Dict[str, Any], node: str) -> List[Dict[str, Any]]:
+        limit = int(params.get("limit", 50))
+        upids = self._node_tasks[node]
+        return [self._task_entry(self._tasks[upid]) for upid in reversed(upids[-limit:])]
+
+    def _task_status(self, params: Dict[str, Any], node: str, upid: str) -> Dict[str, Any]:
+        task = self._tasks.get(upid)
+        if task is None or task["node"] != node:
+            raise SimulatedError(500, f"no such task '{upid}'")
+        status = self._task_entry(task)
+        if "endtime" in task:
+            status.update(status="stopped", exitstatus=task["exitstatus"])
+        else:
+            status["status"] = "running"
+        return status
+
+    def _get_node(self, node: str) -> Dict[str, Any]:
+        info = self._nodes.get(node)
+        if info is None:
+            raise SimulatedError(595, f"no such cluster node '{node}'")
+        return info
+
+    def _node_usage(self, node: str) -> Tuple[int, int]:
+        vms = [vm for vm in self._vms.values() if vm["node"] == node and vm["status"] == "running"]
+        return sum(vm["cores"] for vm in vms), sum(vm["maxmem"] for vm in vms)
+
+    def _list_nodes(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        nodes = []
+        for name, info in self._nodes.items():
+            cores, memory = self._node_usage(name)
+            nodes.append(dict(
+                info,
+                cpu=min(1.0, cores / info["maxcpu"] / 4),
+                mem=min(memory, info["maxmem"]),
+                uptime=int(time.time() - self._started)
+            ))
+        return nodes
+
+    def _node_status(self, params: Dict[str, Any], node: str) -> Dict[str, Any]:
+        info = self._get_node(node)
+        cores, memory = self._node_usage(node)
+        used = min(memory, info["maxmem"])
+        return {
+            "cpu": min(1.0, cores / info["maxcpu"] / 4),
+            "cpuinfo": {"cpus": info["maxcpu"], "cores": info["maxcpu"] // 2, "sockets": 2},
+            "memory": {"total": info["maxmem"], "used": used, "free": info["maxmem"] - used},
+            "uptime": int(time.time() - self._started),
+            "pveversion": "pve-manager/8.1.3"
+        }
+
+    def _cluster_resources(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        kind = params.get("type")
+        resources: List[Dict[str, Any]] = []
+        if kind in (None, "node"):
+            resources.extend(
+                {"id": f"node/{node['node']}", "type": "node", **node} for node in self._list_nodes(params)
+            )
+        if kind in (None, "vm"):
+            resources.extend(
+                {"id": f"qemu/{vm['vmid']}", "type": "qemu", **self._vm_summary(vm)} for vm in self._vms.values()
+            )
+        if kind in (None, "storage"):
+            resources.extend(
+                {"id": f"storage/{node}/{storage}", "type": "storage", "node": node, "storage": storage, "status": "available"}
+                for node in self._nodes for storage in self.storages
+            )
+        return resources
+
+    def _next_id(self, params: Dict[str, Any]) -> int:
+        if params.get("vmid"):
+            vmid = int(params["vmid"])
+            if vmid in self._vms:
+                raise SimulatedError(400, f"VM {vmid} already exists")
+            return vmid
+        vmid = 100
+        while vmid in self._vms:
+            vmid += 1
+        return vmid
+
+    def _add_vm(self, vmid: int, node: str, params: Dict[str, Any], status: str = "stopped", lock: Optional[str] = None) -> None:
+        self._vms[vmid] = {
+            "vmid": vmid,
+            "node": node,
+            "name": params.get("name") or f"vm{vmid}",
+            "status": status,
+            "cores": int(params.get("cores", 1)),
+            "maxmem": int(params.get("memory", 512)) * 1024 ** 2,
+            "maxdisk": 32 * 1024 ** 3,
+            "template": 0,
+            "lock": lock,
+            "config": {key: value for key, value in params.items() if key not in ("vmid", "node", "storage")}
+        }
+
+    def _get_vm(self, node: str, vmid: str) -> Dict[str, Any]:
+        vm = self._vms.get(int(vmid))
+        if vm is None or vm["node"] != node:
+            raise SimulatedError(500, f"Configuration file 'nodes/{node}/qemu-server/{vmid}.conf' does not exist")
+        return vm
+
+    def _vm_summary(self, vm: Dict[str, Any]) -> Dict[str, Any]:
+        summary = {key: value for key, value in vm.items() if key not in ("config", "lock")}
+        summary.update(maxcpu=vm["cores"], cpus=vm["cores"], mem=vm["maxmem"] // 2 if vm["status"] == "running" else 0)
+        if vm["lock"]:
+            summary["lock"] = vm["lock"]
+        return summary
+
+    def _list_vms(self, params: Dict[str, Any], node: str) -> List[Dict[str, Any]]:
+        return [self._vm_summary(vm) for vm in self._vms.values() if vm["node"] == node]
+
+    def _vm_status(self, params: Dict[str, Any], node: str, vmid: str) -> Dict[str, Any]:
+        vm = self._get_vm(node, vmid)
+        return dict(self._vm_summary(vm), qmpstatus=vm["status"], uptime=0)
+
+    def _vm_config(self, params: Dict[str, Any], node: str, vmid: str) -> Dict[str, Any]:
+        vm = self._get_vm(node, vmid)
+        config = dict(vm["config"], name=vm["name"], cores=vm["cores"], memory=vm["maxmem"] // 1024 ** 2)
+        if vm["lock"]:
+            config["lock"] = vm["lock"]
+        return config
+
+    def _create_vm(self, params: Dict[str, Any], node: str) -> str:
+        if "vmid" not in params:
+            raise SimulatedError(400, "Parameter verification failed. vmid: property is missing")
+        vmid = int(params["vmid"])
+        if vmid in self._vms:
+            raise SimulatedError(500, f"unable to create VM {vmid} - VM {vmid} already exists on node '{self._vms[vmid]['node']}'")
+        # 配置文件立即写入并加锁，任务结束后解锁；失败时删除
+        self._add_vm(vmid, node, params, lock="create")
+        return self._start_task(
+            node, "qmcreate", vmid, lambda: self._finish_create(vmid), rollback=lambda: self._vms.pop(vmid, None)
+        )
+
+    def _clone_vm(self, params: Dict[str, Any], node: str, vmid: str) -> str:
+        source = self._get_vm(node, vmid)
+        if "newid" not in params:
+            raise SimulatedError(400, "Parameter verification failed. newid: property is missing")
+        newid = int(params["newid"])
+        if newid in self._vms:
+            raise SimulatedError(500, f"unable to create VM {newid}: config file already exists")
+        target = params.get("target") or node
+        self._get_node(target)
+        clone_params = dict(source["config"], name=params.get("name") or f"Copy-of-VM-{source['name']}")
+        clone_params.update(cores=source["cores"], memory=source["maxmem"] // 1024 ** 2)
+        self._add_vm(newid, target, clone_params, lock="clone")
+        return self._start_task(
+            node, "qmclone", vmid, lambda: self._finish_create(newid), rollback=lambda: self._vms.pop(newid, None)
+        )
+
+    def _finish_create(self, vmid: int) -> Optional[str]:
+        vm = self._vms.get(vmid)
+        if vm is None:
+            return f"VM {vmid} 在创建期间被删除"
+        vm["lock"] = None
+        return None
+
+    def _destroy_vm(self, params: Dict[str, Any], node: str, vmid: str) -> str:
+        vm = self._get_vm(node, vmid)
+
+        def effect() -> Optional[str]:
+            if vm["status"] == "running":
+                return f"VM {vm['vmid']} is running - destroy failed"
+            self._vms.pop(vm["vmid"], None)
+            return None
+
+        return self._start_task(node, "qmdestroy", vm["vmid"], effect)
+
+    def _power(self, params: Dict[str, Any], node: str, vmid: str, action: str) -> str:
+        vm = self._get_vm(node, vmid)
+        if vm["lock"]:
+            raise SimulatedError(500, f"VM is locked ({vm['lock']})")
+        final_status = "running" if action in ("start", "reset") else "stopped"
+
+        def effect() -> Optional[str]:
+            if action == "reset" and vm["status"] != "running":
+                return f"VM {vm['vmid']} not running"
+            vm["status"] = final_status
+            return None
+
+        return self._start_task(node, f"qm{action}", vm["vmid"], effect)
+
+    def _list_storage(self, params: Dict[str, Any], node: str) -> List[Dict[str, Any]]:
+        total = 4 * 1024 ** 4
+        return [
+            {"storage": storage, "type": "dir" if storage == "local" else "lvmthin", "active": 1,
+             "enabled": 1, "total": total, "used": total // 4, "avail": total - total // 4,
+             "content": "vztmpl,iso,backup" if storage == "local" else "images,rootdir"}
+            for storage in self.storages
+        ]
+
+    def _storage_content(self, params: Dict[str, Any], node: str, storage: str) -> List[Dict[str, Any]]:
+        if storage not in self.storages:
+            raise SimulatedError(500, f"storage '{storage}' does not exist")
+        content = params.get("content")
+        items: List[Dict[str, Any]] = []
+        if content in (None, "vztmpl"):
+            items.extend(
+                {"volid": f"{storage}:vztmpl/{name}", "content": "vztmpl", "format": name.split(".", 1)[1], "size": 200 * 1024 ** 2}
+                for name in DEFAULT_TEMPLATES
+            )
+        if content in (None, "backup"):
+            items.extend(self._backups.get((node, storage), []))
+        return items
+
+    def _vzdump(self, params: Dict[str, Any], node: str) -> str:
+        if "vmid" not in params:
+            raise SimulatedError(400, "Parameter verification failed. vmid: property is missing")
+        vm = self._get_vm(node, params["vmid"])
+        storage = params.get("storage", "local")
+        if storage not in self.storages:
+            raise SimulatedError(500, f"storage '{storage}' does not exist")
+
+        def effect() -> Optional[str]:
+            ctime = int(time.time())
+            stamp = time.strftime("%Y_%m_%d-%H_%M_%S", time.gmtime(ctime))
+            self._backups.setdefault((node, storage), []).append({
+                "volid": f"{storage}:backup/vzdump-qemu-{vm['vmid']}-{stamp}.vma.zst",
+                "content": "backup",
+                "format": "vma.zst",
+                "vmid": vm["vmid"],
+                "ctime": ctime,
+                "size": 1024 ** 3
+            })
+            return None
+
+        return self._start_task(node, "vzdump", vm["vmid"], effect)
+
+    def _login(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        username = params.get("username", "root@pam")
+        return {
+            "username": username,
+            "ticket": f"PVE:{username}:{int(time.time()):08X}::simulated",
+            "CSRFPreventionToken": f"{int(time.time()):08X}:simulated"
+        }
+
+class SimulatorAdapter(BaseAdapter):
+    """把 requests 会话的请求交给 PVESimulator 处理的传输适配器"""
+
+    def __init__(self, simulator: PVESimulator):
+        super().__init__()
+        self.simulator = simulator
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        url = urlsplit(request.url)
+        params = dict(parse_qsl(url.query))
+        body = request.body
+        if body:
+            params.update(parse_qsl(body.decode() if isinstance(body, bytes) else body))
+        status_code, payload, delay = self.simulator.dispatch(request.method, url.path, params)
+
+        read_timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        if read_timeout is not None and delay > read_timeout:
+            time.sleep(read_timeout)
+            raise requests.exceptions.ReadTimeout("模拟请求超时", request=request)
+        if delay:
+            time.sleep(delay)
+
+        response = requests.Response()
+        response.status_code = status_code
+        response.reason = payload.get("message") or "OK"
+        response.headers["Content-Type"] = "application/json;charset=UTF-8"
+        response._content = json.dumps(payload).encode()
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self) -> None:
+        pass
@@ -0,0 +1,445 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from backend.app.core.config import settings
+from backend.app.core.database import SessionLocal
+from backend.app.models.proxmox_task import ProxmoxTask
+from backend.app.models.vps import VPSServer, VPSBackup
+from backend.app.models.ip import IPAllocation
+from backend.app.services.ip_bulk import IPBulkService
+from backend.app.services.proxmox_cluster import proxmox_clusters
+from backend.app.services.vmid_allocator import VMIDAllocatorService
+
+logger = logging.getLogger(__name__)
+
+# 各类任务的初始轮询间隔（秒）：开关机通常几秒内结束，创建与备份需要数分钟
+TASK_POLL_INTERVALS = {
+    "qmstart": 1,
+    "qmstop": 1,
+    "qmreset": 1,
+    "qmshutdown": 2,
+    "qmcreate": 3,
+    "qmclone": 3,
+    "qmdestroy": 3,
+    "vzdump": 10
+}
+# 每次轮询仍未结束时间隔乘以该系数，直到 PVE_TASK_POLL_MAX_INTERVAL
+TASK_POLL_BACKOFF = 1.5
+
+# Session.info 中的标记：该会话记录了新任务，提交后唤醒跟踪线程
+WAKE_TRACKER_ON_COMMIT = "wake_task_tracker"
+
+class ProxmoxTaskService:
+    """Proxmox 任务（UPID）记录服务
+
+    Proxmox 的创建、开关机、备份等接口立即返回 UPID，实际操作在节点上异步执行。
+    调用方用 track 记录 UPID 以及任务结束后要写入的状态，由 ProxmoxTaskTracker
+    在后台批量轮询，任务真正结束时才更新数据库。
+
+    payload 支持的键：
+        success_status / failure_status: 任务成功/失败后VPS的状态
+        start_after: 成功后启动VM（创建VM后使用）
+        release_ips: 失败后释放VPS占用的IP地址
+        storage: 备份任务的存储名称，用于查询备份文件
+        release_vmid: 成功后将该VMID归还到任务所在集群的空闲区间（删除VM后使用）
+    """
+
+    @staticmethod
+    def track(
+        db: Session,
+        upid: Any,
+        cluster_name: Optional[str] = None,
+        node_name: Optional[str] = None,
+        vps_id: Optional[int] = None,
+        backup_id: Optional[int] = None,
+        payload: Optional[Dict[str, Any]] = None,
+        commit: bool = True
+    ) -> Optional[ProxmoxTask]:
+        """记录一个需要跟踪的任务，upid 不是有效的UPID时返回 None"""
+        if not isinstance(upid, str) or not upid.startswith("UPID:"):
+            logger.warning(f"Proxmox没有返回任务UPID: {upid}")
+            return None
+
+        fields = ProxmoxTaskService.parse_upid(upid)
+        task = ProxmoxTask(
+            upid=upid,
+            cluster_name=cluster_name,
+            node_name=node_name or fields["node"],
+            task_type=fields["type"],
+            status="running",
+            vps_id=vps_id,
+            backup_id=backup_id,
+            payload=payload or {},
+            poll_count=0,
+            next_poll_at=datetime.utcnow() + timedelta(seconds=ProxmoxTaskTracker.interval(fields["type"], 0))
+        )
+        db.add(task)
+        # 任务提交后跟踪线程才能查到，在提交时唤醒；调用方回滚时不唤醒
+        db.info[WAKE_TRACKER_ON_COMMIT] = True
+        if commit:
+            db.commit()
+            db.refresh(task)
+        else:
+            db.flush()
+        return task
+
+    @staticmethod
+    def parse_upid(upid: str) -> Dict[str, str]:
+        """解析 UPID:节点:PID:PSTART:开始时间:类型:对象ID:用户: 格式"""
+        parts = upid.split(":")
+        if len(parts) < 8:
+            raise Exception(f"无效的UPID: {upid}")
+        return {"node": parts[1], "type": parts[5], "id": parts[6], "user": parts[7]}
+
+    @staticmethod
+    def get_task(db: Session, task_id: int) -> Optional[ProxmoxTask]:
+        """通过ID获取任务"""
+        return db.query(ProxmoxTask).filter(ProxmoxTask.id == task_id).first()
+
+    @staticmethod
+    def get_task_by_upid(db: Session, upid: str) -> Optional[ProxmoxTask]:
+        """通过UPID获取任务"""
+        return db.query(ProxmoxTask).filter(ProxmoxTask.upid == upid).first()
+
+    @staticmethod
+    def get_tasks(
+        db: Session,
+        vps_id: Optional[int] = None,
+        status: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[ProxmoxTask]:
+        """获取任务列表"""
+        query = db.query(ProxmoxTask)
+
+        if vps_id:
+            query = query.filter(ProxmoxTask.vps_id == vps_id)
+
+        if status:
+            query = query.filter(ProxmoxTask.status == status)
+
+        return query.order_by(ProxmoxTask.id.desc()).offset(skip).limit(limit).all()
+
+    @staticmethod
+    def finish(db: Session, task: ProxmoxTask, exitstatus: Optional[str]) -> ProxmoxTask:
+        """记录任务结果并更新相关的VPS和备份记录"""
+        task.exitstatus = exitstatus
+        # vzdump 有警告时退出状态为 "WARNINGS: n"，备份文件仍然有效
+        succeeded = exitstatus == "OK" or (exitstatus or "").startswith("WARNINGS")
+        task.status = "success" if succeeded else "failed"
+        task.finished_at = datetime.utcnow()
+        ProxmoxTaskService._release_slot(task)
+
+        payload = task.payload or {}
+        vps = db.query(VPSServer).filter(VPSServer.id == task.vps_id).first() if task.vps_id else None
+        if vps:
+            ProxmoxTaskService._apply_vps(db, task, vps, payload, succeeded)
+        if task.backup_id:
+            ProxmoxTaskService._apply_backup(db, task, vps, payload, succeeded)
+        if succeeded and payload.get("release_vmid") is not None:
+            VMIDAllocatorService.release(
+                db, proxmox_clusters.resolve(task.cluster_name), [payload["release_vmid"]]
+            )
+
+        db.commit()
+
+        if not succeeded:
+            logger.warning(f"Proxmox任务 {task.upid} 失败: {exitstatus}")
+            if vps and payload.get("release_ips"):
+                addresses = [
+                    address for (address,) in db.query(IPAllocation.ip_address).filter(
+                        IPAllocation.id.in_([vps.ip_allocation_id, vps.ip6_allocation_id])
+                    )
+                ]
+                if addresses:
+                    IPBulkService.bulk_release(db, addresses)
+        return task
+
+    @staticmethod
+    def _release_slot(task: ProxmoxTask) -> None:
+        """释放重操作在调度器中占用的节点/存储名额"""
+        try:
+            proxmox_clusters.get(task.cluster_name).scheduler.task_finished(task.upid)
+        except Exception as e:
+            logger.warning(f"释放任务 {task.upid} 的执行名额失败: {str(e)}")
+
+    @staticmethod
+    def _apply_vps(db: Session, task: ProxmoxTask, vps: VPSServer, payload: Dict[str, Any], succeeded: bool) -> None:
+        try:
+            proxmox = proxmox_clusters.get(vps.cluster_name)
+        except Exception as e:
+            logger.warning(f"VPS {vps.id} 所在集群不可用: {str(e)}")
+            proxmox = None
+        if proxmox:
+            proxmox.invalidate_vm(vps.node_name, vps.vmid)
+
+        new_status = payload.get("success_status" if succeeded else "failure_status")
+        if new_status:
+            vps.status = new_status
+
+        if succeeded and payload.get("start_after") and proxmox:
+            try:
+                upid = proxmox.start_vm(vps.node_name, vps.vmid)
+            except Exception as e:
+                logger.error(f"VPS {vps.id} 创建完成但启动失败: {str(e)}")
+                return
+            if ProxmoxTaskService.track(
+                db, upid,
+                cluster_name=vps.cluster_name,
+                node_name=vps.node_name,
+                vps_id=vps.id,
+                payload={"success_status": "running", "failure_status": vps.status},
+                commit=False
+            ):
+                vps.status = "starting"
+
+    @staticmethod
+    def _apply_backup(
+        db: Session,
+        task: ProxmoxTask,
+        vps: Optional[VPSServer],
+        payload: Dict[str, Any],
+        succeeded: bool
+    ) -> None:
+        backup = db.query(VPSBackup).filter(VPSBackup.id == task.backup_id).first()
+        if not backup:
+            return
+
+        if not succeeded:
+            backup.status = "failed"
+            return
+
+        backup.status = "success"
+        if vps:
+            vps.last_backup_at = task.finished_at
+
+        # 从存储中找到该VM最新的备份文件
+        storage = payload.get("storage")
+        if not vps or not storage:
+            return
+        try:
+            proxmox = proxmox_clusters.get(vps.cluster_name)
+            proxmox.cache.invalidate("get_vm_backups", task.node_name, storage)
+            files = proxmox.get_vm_backups(task.node_name, storage, vps.vmid)
+        except Exception as e:
+            logger.warning(f"获取备份 {backup.id} 的文件信息失败: {str(e)}")
+            return
+
+        newest = max(files, key=lambda item: item.get("ctime", 0), default=None)
+        if newest:
+            backup.backup_id = newest["volid"]
+            backup.file_name = newest["volid"].split("/")[-1]
+            backup.file_size = round(newest.get("size", 0) / 1024 / 1024, 2)
+
+class ProxmoxTaskTracker:
+    """后台轮询 Proxmox 任务的线程
+
+    每轮取出到期的任务，按 (集群, 节点) 分组：同一节点上有多个任务时用一次
+    /nodes/{node}/tasks 列表查询它们的状态，只有一个任务或列表中查不到时才逐个查询
+    /nodes/{node}/tasks/{upid}/status。任务的轮询间隔从其类型的初始值开始按
+    TASK_POLL_BACKOFF 增长，新任务加入时立即唤醒线程。
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._waiters: Dict[str, List[threading.Event]] = defaultdict(list)
+
+    def start(self) -> None:
+        """启动轮询线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="proxmox-task-tracker", daemon=True)
+        self._thread.start()
+        logger.info("Proxmox任务跟踪线程已启动")
+
+    def stop(self, timeout: float = 5) -> None:
+        """停止轮询线程"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def wake(self) -> None:
+        """有新任务时提前开始下一轮轮询"""
+        self._wake.set()
+
+    def wait(self, db: Session, upid: str, timeout: float) -> Optional[ProxmoxTask]:
+        """等待任务结束，超时返回仍在运行的任务记录
+
+        本进程的轮询线程完成任务时立即返回；任务由其他进程完成时每秒查询一次数据库。
+        每次查询后回滚只读事务、归还连接，调用方不能有未提交的修改。
+        """
+        event = threading.Event()
+        with self._lock:
+            self._waiters[upid].append(event)
+        try:
+            deadline = time.monotonic() + timeout
+            while True:
+                db.expire_all()
+                task = ProxmoxTaskService.get_task_by_upid(db, upid)
+                remaining = deadline - time.monotonic()
+                if not task or task.status != "running" or remaining <= 0:
+                    return task
+                # 结束只读事务，等待期间不占用数据库连接
+                db.rollback()
+                event.wait(min(remaining, 1))
+        finally:
+            with self._lock:
+                self._waiters[upid].remove(event)
+                if not self._waiters[upid]:
+                    del self._waiters[upid]
+
+    def poll_once(self, db: Session) -> float:
+        """轮询一批到期的任务，返回距离下一个任务到期的秒数"""
+        now = datetime.utcnow()
+        # 先把到期任务的下次轮询时间推后作为租约，多个进程不会同时轮询同一任务
+        tasks = (
+            db.query(ProxmoxTask)
+            .filter(ProxmoxTask.status == "running", ProxmoxTask.next_poll_at <= now)
+            .order_by(ProxmoxTask.next_poll_at)
+            .limit(settings.PVE_TASK_POLL_BATCH)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        for task in tasks:
+            task.next_poll_at = now + timedelta(seconds=settings.PVE_TASK_POLL_MAX_INTERVAL)
+        db.commit()
+
+        groups: Dict[Tuple[Optional[str], str], List[ProxmoxTask]] = defaultdict(list)
+        for task in tasks:
+            groups[(task.cluster_name, task.node_name)].append(task)
+
+        finished = []
+        timeout_before = now - timedelta(seconds=settings.PVE_TASK_TIMEOUT)
+        for (cluster_name, node_name), group in groups.items():
+            try:
+                statuses = self._fetch_statuses(cluster_name, node_name, group)
+            except Exception as e:
+                logger.warning(f"查询节点 {node_name} 的任务状态失败: {str(e)}")
+                statuses = {}
+
+            for task in group:
+                done, exitstatus = statuses.get(task.upid, (False, None))
+                if not done and task.created_at < timeout_before:
+                    done, exitstatus = True, "任务状态查询超时"
+
+                if done:
+                    try:
+                        ProxmoxTaskService.finish(db, task, exitstatus)
+                        finished.append(task.upid)
+                    except Exception as e:
+                        db.rollback()
+                        logger.error(f"处理任务 {task.upid} 结果失败: {str(e)}")
+                    continue
+
+                task.poll_count = (task.poll_count or 0) + 1
+                task.next_poll_at = datetime.utcnow() + timedelta(
+                    seconds=self.interval(task.task_type, task.poll_count)
+                )
+            db.commit()
+
+        self._notify(finished)
+        self.release_finished_leases(db)
+
+        next_poll_at = (
+            db.query(ProxmoxTask.next_poll_at)
+            .filter(ProxmoxTask.status == "running")
+            .order_by(ProxmoxTask.next_poll_at)
+            .limit(1)
+            .scalar()
+        )
+        if next_poll_at is None:
+            return settings.PVE_TASK_POLL_MAX_INTERVAL
+        delay = (next_poll_at - datetime.utcnow()).total_seconds()
+        return min(max(delay, 0), settings.PVE_TASK_POLL_MAX_INTERVAL)
+
+    def release_finished_leases(self, db: Session) -> int:
+        """释放本进程持有、但任务已由其他进程处理完的重操作名额，返回释放的数量"""
+        released = 0
+        for cluster_name in proxmox_clusters.names():
+            scheduler = proxmox_clusters.get(cluster_name).scheduler
+            for chunk in IPBulkService._chunks(scheduler.held_upids()):
+                finished = db.query(ProxmoxTask.upid).filter(
+                    ProxmoxTask.upid.in_(chunk),
+                    ProxmoxTask.status != "running"
+                )
+                for (upid,) in finished:
+                    scheduler.task_finished(upid)
+                    released += 1
+        return released
+
+    @staticmethod
+    def interval(task_type: Optional[str], poll_count: int) -> float:
+        """任务第 poll_count 次轮询后的等待时间"""
+        base = max(TASK_POLL_INTERVALS.get(task_type, 2), settings.PVE_TASK_POLL_MIN_INTERVAL)
+        return min(base * TASK_POLL_BACKOFF ** poll_count, settings.PVE_TASK_POLL_MAX_INTERVAL)
+
+    def _fetch_statuses(
+        self,
+        cluster_name: Optional[str],
+        node_name: str,
+        tasks: List[ProxmoxTask]
+    ) -> Dict[str, Tuple[bool, Optional[str]]]:
+        """返回 UPID -> (是否结束, 退出状态)"""
+        proxmox = proxmox_clusters.get(cluster_name)
+        statuses: Dict[str, Tuple[bool, Optional[str]]] = {}
+
+        if len(tasks) > 1:
+            wanted = {task.upid for task in tasks}
+            for entry in proxmox.get_node_tasks(node_name, limit=max(50, 2 * len(tasks))):
+                if entry.get("upid") in wanted:
+                    statuses[entry["upid"]] = ("endtime" in entry, entry.get("status"))
+
+        # 列表中查不到的任务（较早开始的任务可能已被挤出列表）逐个查询
+        for task in tasks:
+            if task.upid in statuses:
+                continue
+            try:
+                result = proxmox.get_task_status(node_name, task.upid)
+            except Exception as e:
+                logger.warning(f"查询任务 {task.upid} 状态失败: {str(e)}")
+                continue
+            statuses[task.upid] = (result.get("status") == "stopped", result.get("exitstatus"))
+        return statuses
+
+    def _notify(self, upids: List[str]) -> None:
+        with self._lock:
+            for upid in upids:
+                for event in self._waiters.get(upid, []):
+                    event.set()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            db = SessionLocal()
+            try:
+                delay = self.poll_once(db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"轮询Proxmox任务失败: {str(e)}")
+                delay = settings.PVE_TASK_POLL_MAX_INTERVAL
+            finally:
+                db.close()
+            self._wake.wait(delay)
+            self._wake.clear()
+
+proxmox_task_tracker = ProxmoxTaskTracker()
+
+@event.listens_for(Session, "after_commit")
+def _wake_tracker_after_commit(session: Session) -> None:
+    if session.info.pop(WAKE_TRACKER_ON_COMMIT, False):
+        proxmox_task_tracker.wake()
+
+@event.listens_for(Session, "after_rollback")
+def _clear_wake_after_rollback(session: Session) -> None:
+    session.info.pop(WAKE_TRACKER_ON_COMMIT, None)
@@ -0,0 +1,230 @@
+import logging
+from bisect import bisect_left, bisect_right
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from backend.app.core.config import settings
+from backend.app.models.proxmox_task import ProxmoxTask
+from backend.app.models.vmid import VMIDCluster, VMIDFreeRange
+from backend.app.models.vps import VPSServer
+from backend.app.services.ip_bulk import IPBulkService
+from backend.app.services.ip_manager import IPManagerService
+from backend.app.services.proxmox_cluster import proxmox_clusters
+
+logger = logging.getLogger(__name__)
+
+# 并发分配时条件更新落空后的最大重试次数
+CLAIM_RETRIES = 50
+
+class VMIDAllocatorService:
+    """VMID分配服务
+
+    每个集群的空闲VMID以区间（vmid_free_ranges）保存在数据库中，范围为 PVE_VMID_MIN..PVE_VMID_MAX。
+    分配时读取最小的区间，用带原 range_start 条件的 UPDATE/DELETE 从头部切出所需数量，
+    条件不满足（被其他请求抢先）时重新读取，因此并发分配不会拿到同一个VMID，每次分配只涉及一行。
+    分配与释放都不提交事务，与VPS记录的写入/删除在同一事务中生效，回滚时VMID自动归还。
+
+    集群第一次分配时用Proxmox虚拟机清单和数据库中已有的VMID初始化区间（由 vmid_clusters 保证
+    只初始化一次）；之后由状态同步线程定期调用 exclude，把在Proxmox上被其他途径占用的VMID
+    从空闲区间中剔除。
+    """
+
+    @staticmethod
+    def claim(db: Session, cluster_name: str, count: int = 1) -> List[int]:
+        """从集群的空闲区间中取出 count 个VMID（按从小到大的顺序，不提交事务）"""
+        VMIDAllocatorService._ensure_ranges(db, cluster_name)
+
+        vmids: List[int] = []
+        conflicts = 0
+        while len(vmids) < count:
+            free_range = (
+                db.query(VMIDFreeRange)
+                .filter(VMIDFreeRange.cluster_name == cluster_name)
+                .order_by(VMIDFreeRange.range_start)
+                .populate_existing()
+                .first()
+            )
+            if not free_range:
+                raise Exception(f"集群 {cluster_name} 中没有可用的VMID")
+
+            range_start, range_end = free_range.range_start, free_range.range_end
+            take_end = min(range_end, range_start + count - len(vmids) - 1)
+            if take_end == range_end:
+                statement = delete(VMIDFreeRange)
+            else:
+                statement = update(VMIDFreeRange).values(range_start=take_end + 1)
+            try:
+                # 冲突只回滚出错的语句，调用方事务中已有的修改不受影响。PostgreSQL 中语句出错会
+                # 中止整个事务，需要保存点；SQLite 本身只回滚该语句，而 pysqlite 的保存点会提前提交事务
+                with db.begin_nested() if db.get_bind().dialect.name != "sqlite" else nullcontext():
+                    rowcount = db.execute(
+                        statement.where(VMIDFreeRange.id == free_range.id, VMIDFreeRange.range_start == range_start)
+                        .execution_options(synchronize_session=False)
+                    ).rowcount
+            except IntegrityError:
+                rowcount = 0
+            if not rowcount:
+                conflicts += 1
+                if conflicts > CLAIM_RETRIES:
+                    raise Exception("分配VMID时冲突过多，请稍后重试")
+                continue
+            vmids.extend(range(range_start, take_end + 1))
+        return vmids
+
+    @staticmethod
+    def release(db: Session, cluster_name: str, vmids: Iterable[int]) -> None:
+        """将VMID归还到集群的空闲区间并与相邻区间合并（不提交事务）"""
+        vmids = sorted({
+            vmid for vmid in vmids
+            if vmid is not None and settings.PVE_VMID_MIN <= vmid <= settings.PVE_VMID_MAX
+        })
+        if not vmids or not VMIDAllocatorService._is_seeded(db, cluster_name):
+            # 尚未初始化的集群在第一次分配时会按实际使用情况生成区间
+            return
+
+        neighbours = db.query(VMIDFreeRange).filter(
+            VMIDFreeRange.cluster_name == cluster_name,
+            VMIDFreeRange.range_start <= vmids[-1] + 1,
+            VMIDFreeRange.range_end >= vmids[0] - 1
+        ).with_for_update().all()
+
+        spans = [(vmid, vmid) for vmid in vmids]
+        spans.extend((free_range.range_start, free_range.range_end) for free_range in neighbours)
+        VMIDAllocatorService._replace_ranges(
+            db, cluster_name, [free_range.id for free_range in neighbours], IPBulkService._coalesce(spans)
+        )
+
+    @staticmethod
+    def exclude(
+        db: Session, cluster_name: str, used_vmids: Iterable[int], since: Optional[datetime] = None
+    ) -> int:
+        """把已被占用的VMID从空闲区间中剔除（不提交事务），返回剔除的数量
+
+        用于定期与Proxmox的虚拟机清单同步：在其他工具或Proxmox界面中创建的VM不会再被分配。
+        since 为获取清单的时间，之后才由删除任务归还的VMID已不再被占用，不会剔除。
+        """
+        used_vmids = sorted(set(used_vmids))
+        if not used_vmids or not VMIDAllocatorService._is_seeded(db, cluster_name):
+            return 0
+
+        ranges = db.query(VMIDFreeRange).filter(
+            VMIDFreeRange.cluster_name == cluster_name,
+            VMIDFreeRange.range_start <= used_vmids[-1],
+            VMIDFreeRange.range_end >= used_vmids[0]
+        ).order_by(VMIDFreeRange.range_start).with_for_update().all()
+        if since is not None:
+            # 在锁定区间之后读取，读取之前提交的归还已包含在上面的区间中
+            released = VMIDAllocatorService._released_since(db, cluster_name, since)
+            used_vmids = [vmid for vmid in used_vmids if vmid not in released]
+
+        affected_ids = []
+        remaining = []
+        excluded = 0
+        for free_range in ranges:
+            # 只取落在该区间内的VMID
+            hits = used_vmids[
+                bisect_left(used_vmids, free_range.range_start):bisect_right(used_vmids, free_range.range_end)
+            ]
+            if not hits:
+                continue
+            affected_ids.append(free_range.id)
+            remaining.extend(
+                IPManagerService._subtract_addresses([(free_range.range_start, free_range.range_end)], hits)
+            )
+            excluded += len(hits)
+
+        if affected_ids:
+            VMIDAllocatorService._replace_ranges(db, cluster_name, affected_ids, remaining)
+            logger.warning(f"集群 {cluster_name} 中有 {excluded} 个VMID已被其他途径占用，不再分配")
+        return excluded
+
+    @staticmethod
+    def _released_since(db: Session, cluster_name: str, since: datetime) -> Set[int]:
+        """since 之后成功结束的删除任务归还的VMID"""
+        tasks = db.query(ProxmoxTask.cluster_name, ProxmoxTask.payload).filter(
+            ProxmoxTask.status == "success",
+            ProxmoxTask.finished_at >= since
+        )
+        return {
+            payload["release_vmid"] for task_cluster, payload in tasks
+            if payload and payload.get("release_vmid") is not None
+            # 任务的集群名称为空表示默认集群
+            and (task_cluster or proxmox_clusters.default_name) == cluster_name
+        }
+
+    @staticmethod
+    def _has_ranges(db: Session, cluster_name: str) -> bool:
+        return db.query(VMIDFreeRange.id).filter(VMIDFreeRange.cluster_name == cluster_name).first() is not None
+
+    @staticmethod
+    def _is_seeded(db: Session, cluster_name: str) -> bool:
+        """集群的空闲区间是否已初始化；VMID全部分配完时区间为空，但仍是已初始化的"""
+        if db.query(VMIDCluster.cluster_name).filter(VMIDCluster.cluster_name == cluster_name).first():
+            return True
+        # 有 vmid_clusters 之前初始化的集群只有区间
+        return VMIDAllocatorService._has_ranges(db, cluster_name)
+
+    @staticmethod
+    def _ensure_ranges(db: Session, cluster_name: str) -> None:
+        """集群还没有初始化空闲区间时，按Proxmox虚拟机清单和数据库中的VMID生成
+
+        先插入集群的 vmid_clusters 行，持有该行的锁再检查并写入区间，与区间在同一事务中提交。
+        并发初始化的其他进程插入同一行时等待前者提交，随后因主键冲突放弃。
+        """
+        if VMIDAllocatorService._is_seeded(db, cluster_name):
+            return
+
+        # 在同一数据库的单独会话中初始化并提交，不影响调用方的事务
+        session = Session(bind=db.get_bind())
+        try:
+            session.add(VMIDCluster(cluster_name=cluster_name))
+            session.flush()
+            # 持有锁后再检查一次：区间可能在有 vmid_clusters 之前已经生成
+            if VMIDAllocatorService._has_ranges(session, cluster_name):
+                session.commit()
+                return
+
+            # vps_manager 导入了本模块，这里延迟导入
+            from backend.app.services.vps_manager import VPSManagerService
+
+            used_vmids = set(proxmox_clusters.get(cluster_name).get_vm_inventory())
+            query = VPSManagerService._filter_cluster(session.query(VPSServer.vmid), cluster_name)
+            used_vmids.update(vmid for (vmid,) in query)
+
+            ranges = IPManagerService._subtract_addresses(
+                [(settings.PVE_VMID_MIN, settings.PVE_VMID_MAX)], used_vmids
+            )
+            if ranges:
+                session.execute(insert(VMIDFreeRange.__table__), [
+                    {"cluster_name": cluster_name, "range_start": range_start, "range_end": range_end}
+                    for range_start, range_end in ranges
+                ])
+            session.commit()
+            logger.info(f"已初始化集群 {cluster_name} 的VMID空闲区间，共 {len(ranges)} 段")
+        except IntegrityError:
+            # 其他进程已经完成初始化
+            session.rollback()
+        except Exception as e:
+            session.rollback()
+            raise Exception(f"初始化集群 {cluster_name} 的VMID区间失败: {str(e)}")
+        finally:
+            session.close()
+
+    @staticmethod
+    def _replace_ranges(db: Session, cluster_name: str, range_ids: List[int], ranges: List[tuple]) -> None:
+        """删除一组空闲区间并写入替换后的区间"""
+        for chunk in IPBulkService._chunks(range_ids):
+            db.execute(
+                delete(VMIDFreeRange).where(VMIDFreeRange.id.in_(chunk))
+                .execution_options(synchronize_session=False)
+            )
+        if ranges:
+            db.execute(insert(VMIDFreeRange.__table__), [
+                {"cluster_name": cluster_name, "range_start": range_start, "range_end": range_end}
+                for range_start, range_end in ranges
+            ])
@@ -1,26 +1,63 @@
+import asyncio
 import logging
 import random
-from typing import Dict, List, Optional, Any, Union
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, List, Optional, Any, Union, Tuple
 from datetime import datetime
+from sqlalchemy import bindparam, select, update
 from sqlalchemy.orm import Session
 
 from backend.app.models.vps import VPSServer, VPSBackup
-from backend.app.models.ip import IPAllocation
-from backend.app.services.proxmox import proxmox_service
+from backend.app.models.ip import IPPool, IPAllocation
+from backend.app.models.job import Job
+from backend.app.models.proxmox_task import ProxmoxTask
+from backend.app.services.proxmox_cluster import proxmox_clusters
+from backend.app.services.proxmox_task import ProxmoxTaskService, proxmox_task_tracker
+from backend.app.services.proxmox_scheduler import proxmox_priority
+from backend.app.services.job import JobService, job_worker_pool
 from backend.app.services.ip_manager import IPManagerService
+from backend.app.services.ip_allocator import ip_allocator
+from backend.app.services.ip_bulk import IPBulkService
+from backend.app.services.vps_placement import placement_engine
+from backend.app.services.vmid_allocator import VMIDAllocatorService
 from backend.app.core.config import settings
+from backend.app.core.database import SessionLocal
 
 logger = logging.getLogger(__name__)
 
+# 状态同步时每次从数据库取回的VPS记录数
+STATUS_SYNC_BATCH_SIZE = 1000
+
 class VPSManagerService:
     """VPS服务器管理服务"""
     
+    # 创建任务的跟踪参数：完成后启动VM，失败时释放IP
+    _CREATE_TASK_PAYLOAD = {
+        "success_status": "stopped",
+        "failure_status": "failed",
+        "start_after": True,
+        "release_ips": True
+    }
+    
+    # 状态同步的条件更新：状态和节点在读取之后被修改过的行不更新
+    _STATUS_SYNC_UPDATE = (
+        update(VPSServer.__table__)
+        .where(
+            VPSServer.__table__.c.id == bindparam("vps_id"),
+            VPSServer.__table__.c.status.is_not_distinct_from(bindparam("old_status")),
+            VPSServer.__table__.c.node_name.is_not_distinct_from(bindparam("old_node"))
+        )
+        .values(status=bindparam("new_status"), node_name=bindparam("new_node"), updated_at=bindparam("now"))
+    )
+    
     @staticmethod
     def create_vps(
         db: Session,
         user_id: int,
         name: str,
-        node_name: str,
+        node_name: Optional[str],
         cpu_cores: int,
         memory: int,
         disk_size: int,
@@ -30,7 +67,10 @@ class VPSManagerService:
         ip_pool_id: Optional[int] = None,
         bandwidth: int = 1000,
         notes: Optional[str] = None,
-        config: Optional[Dict[str, Any]] = None
+        config: Optional[Dict[str, Any]] = None,
+        ip6_pool_id: Optional[int] = None,
+        cluster_name: Optional[str] = None,
+        placement_policy: Optional[str] = None
     ) -> VPSServer:
         """创建新的VPS服务器
         
@@ -38,7 +78,7 @@ class VPSManagerService:
             db: 数据库会话
             user_id: 用户ID
             name: VPS名称
-            node_name: Proxmox节点名称
+            node_name: Proxmox节点名称，为空时由调度策略选择
             cpu_cores: CPU核心数
             memory: 内存大小(MB)
             disk_size: 磁盘大小(GB)
@@ -49,43 +89,76 @@ class VPSManagerService:
             bandwidth: 带宽(Mbps)
             notes: 备注
             config: 其他配置
+            ip6_pool_id: IPv6池ID，指定时额外分配一个IPv6地址（双栈）
+            cluster_name: Proxmox集群名称，为空时使用默认集群
+            placement_policy: 未指定节点时的调度策略，为空时使用 PVE_PLACEMENT_POLICY
         """
         try:
-            # 获取可用的VMID
-            vmid = VPSManagerService._get_next_vmid(db)
+            cluster_name = proxmox_clusters.resolve(cluster_name)
+            proxmox = proxmox_clusters.get(cluster_name)
+            
+            # 未指定节点时按调度策略选择，在分配IP之前完成，资源不足时不占用地址
+            if not node_name:
+                node_name = placement_engine.place(
+                    db, cluster_name, cpu_cores, memory, disk_size, user_id=user_id, policy=placement_policy
+                )[0]
             
             # 确保IP地址分配
-            ip_allocation = None
             if ip_allocation_id:
                 ip_allocation = db.query(IPAllocation).filter(IPAllocation.id == ip_allocation_id).first()
                 if not ip_allocation or ip_allocation.status != "available":
                     raise Exception("指定的IP地址不可用")
-            elif ip_pool_id:
-                ip_allocation = IPManagerService.get_available_ip(db, ip_pool_id)
-                if not ip_allocation:
-                    raise Exception(f"IP池中没有可用的IP地址")
+                
+                ip_allocation = IPManagerService.allocate_ip(
+                    db, 
+                    ip_allocation.ip_address,
+                    user_id=user_id,
+                    hostname=name
+                )
             else:
-                ip_allocation = IPManagerService.get_available_ip(db)
+                # 优先使用进程内空闲地址缓存，数据库原子占用保证并发创建不会拿到同一地址
+                ip_allocation = ip_allocator.allocate(
+                    db,
+                    ip_pool_id=ip_pool_id,
+                    user_id=user_id,
+                    hostname=name
+                )
                 if not ip_allocation:
-                    raise Exception("没有可用的IP地址")
-            
-            # 分配IP
-            ip_allocation = IPManagerService.allocate_ip(
-                db, 
-                ip_allocation.ip_address,
-                user_id=user_id,
-                hostname=name
-            )
+                    raise Exception("IP池中没有可用的IP地址" if ip_pool_id else "没有可用的IP地址")
             
             # 准备Proxmox VM创建参数
             ip_pool = db.query(IPPool).filter(IPPool.id == ip_allocation.ip_pool_id).first()
             if not ip_pool:
                 raise Exception("找不到IP池信息")
             
-            # 创建VPS记录
+            # 双栈：从IPv6池按需生成地址
+            ip6_allocation = None
+            ip6_pool = None
+            if ip6_pool_id:
+                ip6_allocation = IPManagerService.claim_next_ip(
+                    db,
+                    ip_pool_id=ip6_pool_id,
+                    user_id=user_id,
+                    hostname=name
+                )
+                if not ip6_allocation:
+                    IPManagerService.release_ip(db, ip_allocation.ip_address)
+                    raise Exception("IPv6池中没有可用的IP地址")
+                ip6_pool = db.query(IPPool).filter(IPPool.id == ip6_pool_id).first()
+            
+            # 分配VMID并创建VPS记录，二者在同一事务中提交
+            try:
+                vmid = VMIDAllocatorService.claim(db, cluster_name)[0]
+            except Exception:
+                db.rollback()
+                for allocation in (ip_allocation, ip6_allocation):
+                    if allocation:
+                        IPManagerService.release_ip(db, allocation.ip_address)
+                raise
             vps_server = VPSServer(
                 name=name,
                 vmid=vmid,
+                cluster_name=cluster_name,
                 node_name=node_name,
                 user_id=user_id,
                 status="creating",
@@ -96,6 +169,7 @@ class VPSManagerService:
                 os_type=os_type,
                 os_template=os_template,
                 ip_allocation_id=ip_allocation.id,
+                ip6_allocation_id=ip6_allocation.id if ip6_allocation else None,
                 notes=notes,
                 config=config or {}
             )
@@ -103,54 +177,29 @@ class VPSManagerService:
             db.commit()
             db.refresh(vps_server)
             
-            # 准备网络配置
-            net_config = {
-                "ip": f"{ip_allocation.ip_address}/{VPSManagerService._convert_subnet_mask_to_cidr(ip_pool.subnet_mask)}",
-                "gw": ip_pool.gateway,
-                "nameserver": ip_pool.dns_servers.split(",")[0]
-            }
-            
-            # 构建VM创建参数
-            vm_params = {
-                "vmid": vmid,
-                "name": name,
-                "cores": cpu_cores,
-                "memory": memory,
-                "storage": "local-lvm",  # 这里应该根据实际情况配置存储
-                "net0": f"virtio,bridge=vmbr0",
-                "ipconfig0": f"ip={net_config['ip']},gw={net_config['gw']}",
-                "nameserver": net_config['nameserver'],
-                "ostype": "l26" if os_type == "linux" else "win10"
-            }
-            
-            if os_type == "linux":
-                # 对于Linux系统，使用克隆或模板
-                if "ubuntu" in os_template or "debian" in os_template:
-                    vm_params["clone"] = f"template-{os_template}"
-                else:
-                    vm_params["template"] = f"template-{os_template}"
-            else:
-                # 对于Windows系统，通常使用ISO安装
-                vm_params["ide2"] = f"local:iso/windows-{os_template}.iso,media=cdrom"
-                vm_params["boot"] = "d"
+            vm_params = VPSManagerService._build_vm_params(
+                vps_server, [(ip_allocation, ip_pool), (ip6_allocation, ip6_pool)], ip_pool.dns_servers
+            )
             
             # 创建VM
             try:
-                result = proxmox_service.create_vm(node_name, vm_params)
+                upid = proxmox.create_vm(node_name, vm_params)
                 
-                # 更新状态
-                vps_server.status = "stopped"
-                db.commit()
-                
-                # 启动VM
-                proxmox_service.start_vm(node_name, vmid)
-                vps_server.status = "running"
-                db.commit()
+                # 创建在节点上异步执行，由任务跟踪线程在完成后启动VM；失败时释放IP
+                ProxmoxTaskService.track(
+                    db, upid,
+                    cluster_name=cluster_name,
+                    node_name=node_name,
+                    vps_id=vps_server.id,
+                    payload=dict(VPSManagerService._CREATE_TASK_PAYLOAD)
+                )
                 
                 return vps_server
             except Exception as e:
                 # 发生错误，释放IP并标记VPS为失败状态
                 IPManagerService.release_ip(db, ip_allocation.ip_address)
+                if ip6_allocation:
+                    IPManagerService.release_ip(db, ip6_allocation.ip_address)
                 vps_server.status = "failed"
                 db.commit()
                 raise Exception(f"创建VM失败: {str(e)}")
@@ -161,114 +210,425 @@ class VPSManagerService:
             raise Exception(f"创建VPS失败: {str(e)}")
     
     @staticmethod
-    def delete_vps(db: Session, vps_id: int) -> Dict[str, Any]:
-        """删除VPS服务器"""
-        vps_server = db.query(VPSServer).filter(VPSServer.id == vps_id).first()
-        if not vps_server:
-            raise Exception(f"找不到ID为 {vps_id} 的VPS服务器")
+    def submit_create_job(db: Session, user_id: int, params: Dict[str, Any]) -> Job:
+        """提交创建VPS的后台任务，params 为 create_vps 除 db、user_id 以外的参数"""
+        # 提交前先检查集群名称和调度策略，明显错误的请求直接返回
+        params = dict(params, cluster_name=proxmox_clusters.resolve(params.get("cluster_name")))
+        if not params.get("node_name"):
+            placement_engine.policy(params.get("placement_policy"))
+        return job_worker_pool.submit(db, "vps_create", user_id=user_id, payload=params, total=3)
+    
+    @staticmethod
+    def run_create_job(job_id: int) -> None:
+        """执行 vps_create 任务
         
+        进度分三步：写入VPS记录并提交创建（克隆）任务、创建任务完成、开机任务完成。
+        任务结果中的 vps_id 在第一步完成后即可用于查询VPS。
+        """
+        db = SessionLocal()
         try:
-            # 先关闭VM
-            if vps_server.status == "running":
-                proxmox_service.stop_vm(vps_server.node_name, vps_server.vmid)
+            job = JobService.get_job(db, job_id)
+            if not job:
+                logger.warning(f"找不到任务 {job_id}")
+                return
             
-            # 删除VM
-            result = proxmox_service.delete_vm(vps_server.node_name, vps_server.vmid)
+            JobService.start_job(db, job, total=3)
+            try:
+                vps_server = VPSManagerService.create_vps(db, user_id=job.user_id, **(job.payload or {}))
+                job.target_id = vps_server.id
+                job.result = {"vps_id": vps_server.id, "vmid": vps_server.vmid}
+                JobService.update_progress(db, job, 1)
+                
+                # 创建任务完成后，任务跟踪线程会提交开机任务
+                for step, task_types in ((2, ("qmcreate", "qmclone")), (3, ("qmstart",))):
+                    tasks = ProxmoxTaskService.get_tasks(db, vps_id=vps_server.id, limit=1)
+                    task = tasks[0] if tasks and tasks[0].task_type in task_types else None
+                    if task is None:
+                        break
+                    if task.status == "running":
+                        task = proxmox_task_tracker.wait(db, task.upid, settings.PVE_TASK_TIMEOUT)
+                    if task.status == "failed":
+                        raise Exception(f"Proxmox任务 {task.upid} 失败: {task.exitstatus}")
+                    if task.status == "running":
+                        raise Exception(f"等待Proxmox任务 {task.upid} 超时")
+                    JobService.update_progress(db, job, step)
+                
+                db.refresh(vps_server)
+                JobService.finish_job(
+                    db, job, {"vps_id": vps_server.id, "vmid": vps_server.vmid, "status": vps_server.status}
+                )
+            except Exception as e:
+                JobService.fail_job(db, job, str(e))
+        finally:
+            db.close()
+    
+    @staticmethod
+    def reserve_vps_batch(
+        db: Session,
+        user_id: int,
+        name_prefix: str,
+        count: int,
+        cpu_cores: int,
+        memory: int,
+        disk_size: int,
+        os_type: str,
+        os_template: str,
+        ip_pool_id: int,
+        node_names: Optional[List[str]] = None,
+        bandwidth: int = 1000,
+        notes: Optional[str] = None,
+        config: Optional[Dict[str, Any]] = None,
+        ip6_pool_id: Optional[int] = None,
+        cluster_name: Optional[str] = None,
+        placement_policy: Optional[str] = None
+    ) -> List[VPSServer]:
+        """在一个事务中为整批VPS分配VMID和IP地址并写入 creating 状态的记录
+        
+        VPS名称为 {name_prefix}-{序号}，节点按 node_names 的顺序轮流分配，为空时由调度策略
+        逐台选择。任何一步失败时整批回滚，不会留下占用的VMID或IP地址。
+        """
+        cluster_name = proxmox_clusters.resolve(cluster_name)
+        if node_names:
+            placements = [node_names[index % len(node_names)] for index in range(count)]
+        else:
+            placements = placement_engine.place(
+                db, cluster_name, cpu_cores, memory, disk_size, user_id=user_id, count=count, policy=placement_policy
+            )
+        names = [f"{name_prefix}-{index + 1}" for index in range(count)]
+        
+        try:
+            # VMID最先分配：首次分配时需要初始化区间，此时事务中还没有写入
+            vmids = VMIDAllocatorService.claim(db, cluster_name, count)
+            ipv4 = IPBulkService.bulk_claim_next(db, ip_pool_id, count, user_id=user_id, commit=False)
+            ipv6 = IPBulkService.bulk_claim_next(
+                db, ip6_pool_id, count, user_id=user_id, commit=False
+            ) if ip6_pool_id else []
             
-            # 释放IP
-            if vps_server.ip_allocation_id:
-                ip_allocation = db.query(IPAllocation).filter(IPAllocation.id == vps_server.ip_allocation_id).first()
-                if ip_allocation:
-                    IPManagerService.release_ip(db, ip_allocation.ip_address)
+            # 地址按主机名逐个标记，一次按主键批量更新
+            hostnames = [
+                {"id": item["allocation_id"], "hostname": name}
+                for items in (ipv4, ipv6) for item, name in zip(items, names)
+            ]
+            db.execute(update(IPAllocation), hostnames)
             
-            # 删除VPS记录
-            db.delete(vps_server)
+            vps_servers = [
+                VPSServer(
+                    name=name,
+                    vmid=vmid,
+                    cluster_name=cluster_name,
+                    node_name=placements[index],
+                    user_id=user_id,
+                    status="creating",
+                    cpu_cores=cpu_cores,
+                    memory=memory,
+                    disk_size=disk_size,
+                    bandwidth=bandwidth,
+                    os_type=os_type,
+                    os_template=os_template,
+                    ip_allocation_id=ipv4[index]["allocation_id"],
+                    ip6_allocation_id=ipv6[index]["allocation_id"] if ipv6 else None,
+                    notes=notes,
+                    config=config or {}
+                )
+                for index, (name, vmid) in enumerate(zip(names, vmids))
+            ]
+            db.add_all(vps_servers)
             db.commit()
-            
-            return {"status": "success", "message": f"VPS {vps_server.name} 已成功删除"}
+            return vps_servers
         except Exception as e:
             db.rollback()
-            logger.error(f"删除VPS失败: {str(e)}")
-            raise Exception(f"删除VPS失败: {str(e)}")
+            logger.error(f"批量预留VPS失败: {str(e)}")
+            raise Exception(f"批量预留VPS失败: {str(e)}")
     
     @staticmethod
-    def start_vps(db: Session, vps_id: int) -> VPSServer:
-        """启动VPS服务器"""
+    def submit_batch_create_job(db: Session, user_id: int, params: Dict[str, Any]) -> Job:
+        """提交批量创建VPS的后台任务，params 为 reserve_vps_batch 除 db、user_id 以外的参数以及 concurrency"""
+        params = dict(params, cluster_name=proxmox_clusters.resolve(params.get("cluster_name")))
+        if not params.get("node_names"):
+            placement_engine.policy(params.get("placement_policy"))
+        return job_worker_pool.submit(
+            db, "vps_batch_create", user_id=user_id, payload=params, total=params["count"]
+        )
+    
+    @staticmethod
+    def run_batch_create_job(job_id: int) -> None:
+        """执行 vps_batch_create 任务
+        
+        先在一个事务中预留整批VPS的VMID和IP，然后按节点分组，每个节点同时克隆
+        concurrency 台（默认且最多 PVE_NODE_HEAVY_CONCURRENCY），各节点之间互不等待，
+        N 台的总耗时约为 N / (节点数 × concurrency) × 单台克隆耗时。整个任务的克隆线程
+        不超过 JOB_BATCH_MAX_THREADS，超出时后面的线程等前面的节点队列完成后再开始。
+        克隆完成后由任务跟踪线程启动VM，不占用节点的克隆名额。
+        任务结果 items 中逐台记录VPS ID、VMID、节点和状态（pending/cloning/created/failed）。
+        """
+        db = SessionLocal()
+        try:
+            job = JobService.get_job(db, job_id)
+            if not job:
+                logger.warning(f"找不到任务 {job_id}")
+                return
+            
+            params = dict(job.payload or {})
+            # 超过节点的重操作名额也只是在调度器中排队，没有意义
+            concurrency = min(
+                params.pop("concurrency", None) or settings.PVE_NODE_HEAVY_CONCURRENCY,
+                settings.PVE_NODE_HEAVY_CONCURRENCY
+            )
+            JobService.start_job(db, job, total=params.get("count"))
+            try:
+                vps_servers = VPSManagerService.reserve_vps_batch(db, user_id=job.user_id, **params)
+            except Exception as e:
+                JobService.fail_job(db, job, str(e))
+                return
+            
+            items = [
+                {
+                    "index": index,
+                    "name": vps_server.name,
+                    "vps_id": vps_server.id,
+                    "vmid": vps_server.vmid,
+                    "node_name": vps_server.node_name,
+                    "status": "pending",
+                    "error": None
+                }
+                for index, vps_server in enumerate(vps_servers)
+            ]
+            lock = threading.Lock()
+            
+            def snapshot() -> Dict[str, Any]:
+                with lock:
+                    return {"items": [dict(item) for item in items]}
+            
+            job.result = snapshot()
+            JobService.update_progress(db, job, 0)
+            
+            # 每个节点一个待克隆队列，由该节点的 concurrency 个线程消费
+            queues: Dict[str, deque] = defaultdict(deque)
+            for item in items:
+                queues[item["node_name"]].append(item)
+            
+            def lane(queue: deque) -> None:
+                session = SessionLocal()
+                try:
+                    # 批量克隆让位于用户发起的开关机等操作
+                    with proxmox_priority("bulk"):
+                        while True:
+                            with lock:
+                                if not queue:
+                                    return
+                                item = queue.popleft()
+                                item["status"] = "cloning"
+                            try:
+                                VPSManagerService._clone_reserved(session, item["vps_id"])
+                                status, error = "created", None
+                            except Exception as e:
+                                session.rollback()
+                                status, error = "failed", str(e)
+                            with lock:
+                                item.update(status=status, error=error)
+                finally:
+                    session.close()
+            
+            # 先给每个节点各开一个线程，再开第二个，线程数受限时各节点都能开始克隆
+            lanes = [
+                queue for slot in range(concurrency) for queue in queues.values() if len(queue) > slot
+            ]
+            max_workers = min(len(lanes), settings.JOB_BATCH_MAX_THREADS)
+            with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"vps-batch-{job_id}") as executor:
+                pending = {executor.submit(lane, queue) for queue in lanes}
+                while pending:
+                    done, pending = wait(pending, timeout=settings.JOB_POLL_INTERVAL)
+                    for future in done:
+                        future.result()
+                    job.result = snapshot()
+                    JobService.update_progress(
+                        db, job, sum(1 for item in job.result["items"] if item["status"] in ("created", "failed"))
+                    )
+            
+            result = snapshot()
+            result["succeeded"] = sum(1 for item in result["items"] if item["status"] == "created")
+            result["failed"] = len(result["items"]) - result["succeeded"]
+            JobService.finish_job(db, job, result)
+        except Exception as e:
+            JobService.fail_job(db, job, str(e))
+        finally:
+            db.close()
+    
+    @staticmethod
+    def _clone_reserved(db: Session, vps_id: int) -> VPSServer:
+        """为已预留的VPS记录提交创建（克隆）任务并等待其完成
+        
+        提交失败时释放IP并将VPS标记为 failed；任务失败时由任务跟踪线程做同样的处理。
+        """
         vps_server = db.query(VPSServer).filter(VPSServer.id == vps_id).first()
         if not vps_server:
             raise Exception(f"找不到ID为 {vps_id} 的VPS服务器")
         
-        if vps_server.status == "running":
-            return vps_server
+        allocation_ids = [vps_server.ip_allocation_id, vps_server.ip6_allocation_id]
+        allocations = {
+            ip_allocation.id: ip_allocation
+            for ip_allocation in db.query(IPAllocation).filter(IPAllocation.id.in_(allocation_ids))
+        }
+        pools = {
+            ip_pool.id: ip_pool
+            for ip_pool in db.query(IPPool).filter(
+                IPPool.id.in_([ip_allocation.ip_pool_id for ip_allocation in allocations.values()])
+            )
+        }
+        pairs = []
+        for allocation_id in allocation_ids:
+            ip_allocation = allocations.get(allocation_id)
+            pairs.append((ip_allocation, pools.get(ip_allocation.ip_pool_id) if ip_allocation else None))
+        ip_pool = pairs[0][1]
+        if not ip_pool:
+            raise Exception("找不到IP池信息")
         
         try:
-            proxmox_service.start_vm(vps_server.node_name, vps_server.vmid)
-            vps_server.status = "running"
-            db.commit()
-            return vps_server
+            upid = proxmox_clusters.get(vps_server.cluster_name).create_vm(
+                vps_server.node_name,
+                VPSManagerService._build_vm_params(vps_server, pairs, ip_pool.dns_servers)
+            )
+            task = ProxmoxTaskService.track(
+                db, upid,
+                cluster_name=vps_server.cluster_name,
+                node_name=vps_server.node_name,
+                vps_id=vps_server.id,
+                payload=dict(VPSManagerService._CREATE_TASK_PAYLOAD)
+            )
         except Exception as e:
-            logger.error(f"启动VPS失败: {str(e)}")
-            raise Exception(f"启动VPS失败: {str(e)}")
+            db.rollback()
+            addresses = [ip_allocation.ip_address for ip_allocation in allocations.values()]
+            if addresses:
+                IPBulkService.bulk_release(db, addresses)
+            vps_server.status = "failed"
+            db.commit()
+            raise Exception(f"提交创建任务失败: {str(e)}")
+        
+        if task:
+            task = proxmox_task_tracker.wait(db, task.upid, settings.PVE_TASK_TIMEOUT)
+            if task.status == "failed":
+                raise Exception(f"Proxmox任务 {task.upid} 失败: {task.exitstatus}")
+            if task.status == "running":
+                raise Exception(f"等待Proxmox任务 {task.upid} 超时")
+        return vps_server
     
     @staticmethod
-    def stop_vps(db: Session, vps_id: int) -> VPSServer:
-        """关闭VPS服务器"""
+    def delete_vps(db: Session, vps_id: int) -> Dict[str, Any]:
+        """删除VPS服务器"""
         vps_server = db.query(VPSServer).filter(VPSServer.id == vps_id).first()
         if not vps_server:
             raise Exception(f"找不到ID为 {vps_id} 的VPS服务器")
         
-        if vps_server.status == "stopped":
-            return vps_server
-        
         try:
-            proxmox_service.stop_vm(vps_server.node_name, vps_server.vmid)
-            vps_server.status = "stopped"
+            proxmox = proxmox_clusters.get(vps_server.cluster_name)
+            
+            # 先关闭VM
+            if vps_server.status == "running":
+                proxmox.stop_vm(vps_server.node_name, vps_server.vmid)
+            
+            # 删除VM，VPS记录随后删除；VMID在删除任务成功后才归还，任务失败时VM仍然存在
+            upid = proxmox.delete_vm(vps_server.node_name, vps_server.vmid)
+            task = ProxmoxTaskService.track(
+                db, upid,
+                cluster_name=vps_server.cluster_name,
+                node_name=vps_server.node_name,
+                payload={"release_vmid": vps_server.vmid},
+                commit=False
+            )
+            
+            # 释放IP
+            for allocation_id in (vps_server.ip_allocation_id, vps_server.ip6_allocation_id):
+                if allocation_id:
+                    ip_allocation = db.query(IPAllocation).filter(IPAllocation.id == allocation_id).first()
+                    if ip_allocation:
+                        IPManagerService.release_ip(db, ip_allocation.ip_address)
+            
+            # 删除VPS记录；没有返回任务时无法确认删除结果，直接归还VMID
+            if not task:
+                VMIDAllocatorService.release(db, vps_server.cluster_name, [vps_server.vmid])
+            db.delete(vps_server)
             db.commit()
-            return vps_server
+            
+            return {"status": "success", "message": f"VPS {vps_server.name} 已成功删除"}
         except Exception as e:
-            logger.error(f"关闭VPS失败: {str(e)}")
-            raise Exception(f"关闭VPS失败: {str(e)}")
+            db.rollback()
+            logger.error(f"删除VPS失败: {str(e)}")
+            raise Exception(f"删除VPS失败: {str(e)}")
     
     @staticmethod
-    def restart_vps(db: Session, vps_id: int) -> VPSServer:
-        """重启VPS服务器"""
-        vps_server = db.query(VPSServer).filter(VPSServer.id == vps_id).first()
+    async def change_power_state(db: Session, vps_id: int, action: str) -> VPSServer:
+        """通过异步Proxmox客户端启动、关闭或重启VPS，等待Proxmox期间不占用线程
+        
+        数据库读写是同步的，放到线程池中执行，事件循环上只等待Proxmox请求。
+        返回时VPS处于 starting/stopping/restarting 状态，任务结束后由任务跟踪线程更新为最终状态。
+        """
+        actions = {
+            "start": ("start_vm", "starting", "running", "启动"),
+            "stop": ("stop_vm", "stopping", "stopped", "关闭"),
+            "restart": ("restart_vm", "restarting", "running", "重启")
+        }
+        if action not in actions:
+            raise Exception(f"不支持的操作: {action}")
+        method, pending_status, new_status, label = actions[action]
+        
+        vps_server = await asyncio.to_thread(VPSManagerService.get_vps_by_id, db, vps_id)
         if not vps_server:
             raise Exception(f"找不到ID为 {vps_id} 的VPS服务器")
         
+        if action != "restart" and vps_server.status == new_status:
+            return vps_server
+        
         try:
-            proxmox_service.restart_vm(vps_server.node_name, vps_server.vmid)
-            vps_server.status = "running"
-            db.commit()
+            proxmox_call = getattr(proxmox_clusters.get_async(vps_server.cluster_name), method)
+            upid = await proxmox_call(vps_server.node_name, vps_server.vmid)
+            
+            def record_task() -> None:
+                proxmox_clusters.get(vps_server.cluster_name).invalidate_vm(vps_server.node_name, vps_server.vmid)
+                VPSManagerService._track_power_task(db, vps_server, upid, pending_status, new_status)
+                # 提交后属性已过期，在线程中重新加载，调用方读取时不会再访问数据库
+                db.refresh(vps_server)
+            
+            await asyncio.to_thread(record_task)
             return vps_server
         except Exception as e:
-            logger.error(f"重启VPS失败: {str(e)}")
-            raise Exception(f"重启VPS失败: {str(e)}")
+            logger.error(f"{label}VPS失败: {str(e)}")
+            raise Exception(f"{label}VPS失败: {str(e)}")
     
     @staticmethod
     def create_backup(db: Session, vps_id: int, storage: str = "local", is_auto: bool = False, notes: Optional[str] = None) -> VPSBackup:
-        """创建VPS备份"""
+        """创建VPS备份
+        
+        备份记录先以 running 状态保存，备份任务结束后由任务跟踪线程写入实际的
+        备份卷ID、文件名和大小，并更新VPS最后备份时间。
+        """
         vps_server = db.query(VPSServer).filter(VPSServer.id == vps_id).first()
         if not vps_server:
             raise Exception(f"找不到ID为 {vps_id} 的VPS服务器")
         
         try:
-            result = proxmox_service.backup_vm(vps_server.node_name, vps_server.vmid, storage)
+            upid = proxmox_clusters.get(vps_server.cluster_name).backup_vm(vps_server.node_name, vps_server.vmid, storage)
             
-            # 这里假设结果中包含备份ID和文件名等信息
-            # 实际实现中，可能需要等待备份完成并获取详细信息
+            # 备份完成前以任务UPID作为备份ID
             backup = VPSBackup(
                 vps_id=vps_id,
-                backup_id=f"{vps_server.vmid}-{datetime.now().strftime('%Y%m%d%H%M%S')}",
-                file_name=f"vzdump-qemu-{vps_server.vmid}-{datetime.now().strftime('%Y_%m_%d-%H_%M_%S')}.vma.zst",
-                file_size=0,  # 这里需要实际获取文件大小
+                backup_id=upid,
+                status="running",
                 notes=notes,
                 is_auto=is_auto
             )
             db.add(backup)
+            db.flush()
             
-            # 更新VPS最后备份时间
-            vps_server.last_backup_at = datetime.utcnow()
+            if not ProxmoxTaskService.track(
+                db, upid,
+                cluster_name=vps_server.cluster_name,
+                node_name=vps_server.node_name,
+                vps_id=vps_id,
+                backup_id=backup.id,
+                payload={"storage": storage},
+                commit=False
+            ):
+                raise Exception("Proxmox没有返回备份任务")
             
             db.commit()
             db.refresh(backup)
@@ -299,48 +659,147 @@ class VPSManagerService:
         return db.query(VPSBackup).filter(VPSBackup.vps_id == vps_id).offset(skip).limit(limit).all()
     
     @staticmethod
-    def update_vps_status(db: Session) -> None:
-        """更新所有VPS状态"""
-        vps_servers = db.query(VPSServer).all()
+    def update_vps_status(db: Session) -> Dict[str, Any]:
+        """用各集群的虚拟机快照核对所有VPS的状态和所在节点，只写回有变化的记录
         
-        for vps in vps_servers:
-            try:
-                status = proxmox_service.get_vm_status(vps.node_name, vps.vmid)
-                vps.status = status["status"]
-            except Exception as e:
-                logger.warning(f"无法更新VPS {vps.id} 状态: {str(e)}")
+        每个集群只调用一次 /cluster/resources（各集群并发获取），数据库只读取比较所需的列，
+        变化的记录用一次批量的条件 UPDATE 写回：只有状态和节点仍与读取时相同的行才会更新，
+        读取之后被开关机等操作修改过的VPS不会被快照中的旧状态覆盖。有进行中Proxmox任务的VPS
+        由任务跟踪线程更新状态，这里跳过。快照中的VMID同时从空闲VMID区间中剔除（获取快照后
+        才由删除任务归还的除外）。
+        返回核对、更新、VM不存在和剔除VMID的数量。
+        """
+        summary = {"checked": 0, "updated": 0, "missing": 0, "vmids_excluded": 0, "failed_clusters": []}
+        # 在获取清单之前记录时间，之后结束的删除任务归还的VMID不会被剔除
+        now = datetime.utcnow()
+        inventories = proxmox_clusters.fan_out(lambda proxmox: proxmox.get_vm_inventory())
+        busy = select(ProxmoxTask.vps_id).where(ProxmoxTask.status == "running", ProxmoxTask.vps_id.isnot(None))
         
-        db.commit()
-    
-    @staticmethod
-    def _get_next_vmid(db: Session) -> int:
-        """获取下一个可用的VMID"""
-        try:
-            # 从Proxmox获取当前使用的VMID列表
-            vms = []
-            for node in proxmox_service.get_nodes():
-                try:
-                    node_vms = proxmox_service.get_vms(node["node"])
-                    vms.extend(node_vms)
-                except:
-                    pass
+        for cluster_name, inventory in inventories.items():
+            if isinstance(inventory, Exception):
+                logger.warning(f"无法获取集群 {cluster_name} 的虚拟机清单: {str(inventory)}")
+                summary["failed_clusters"].append(cluster_name)
+                continue
             
-            used_vmids = set(vm["vmid"] for vm in vms)
+            query = VPSManagerService._filter_cluster(
+                db.query(VPSServer.id, VPSServer.vmid, VPSServer.status, VPSServer.node_name), cluster_name
+            ).filter(VPSServer.id.notin_(busy))
             
-            # 寻找可用的VMID（通常从100开始）
-            vmid = 100
-            while vmid in used_vmids:
-                vmid += 1
+            changes = []
+            missing = 0
+            for vps_id, vmid, status, node_name in query.yield_per(STATUS_SYNC_BATCH_SIZE):
+                summary["checked"] += 1
+                vm = inventory.get(vmid)
+                if not vm:
+                    missing += 1
+                    continue
+                # VM 可能被迁移到其他节点
+                new_node = vm.get("node") or node_name
+                if vm["status"] != status or new_node != node_name:
+                    changes.append({
+                        "vps_id": vps_id,
+                        "old_status": status,
+                        "old_node": node_name,
+                        "new_status": vm["status"],
+                        "new_node": new_node,
+                        "now": now
+                    })
             
-            return vmid
-        except Exception as e:
-            # 如果无法从Proxmox获取，尝试从数据库获取最大值
-            max_vmid = db.query(VPSServer).order_by(VPSServer.vmid.desc()).first()
-            return (max_vmid.vmid + 1) if max_vmid else 100
+            updated = 0
+            if changes:
+                result = db.execute(VPSManagerService._STATUS_SYNC_UPDATE, changes)
+                # 部分驱动的批量执行不返回准确的行数
+                updated = result.rowcount if db.get_bind().dialect.supports_sane_multi_rowcount else len(changes)
+            # 在Proxmox上被其他途径占用的VMID不再分配
+            summary["vmids_excluded"] += VMIDAllocatorService.exclude(db, cluster_name, inventory, since=now)
+            if missing:
+                logger.warning(f"集群 {cluster_name} 中有 {missing} 台VPS对应的VM不存在")
+            summary["updated"] += updated
+            summary["missing"] += missing
+        
+        db.commit()
+        return summary
+    
+    @staticmethod
+    def _track_power_task(db: Session, vps_server: VPSServer, upid: Any, pending_status: str, final_status: str) -> None:
+        """开关机任务结束后再写入最终状态，失败时恢复原状态"""
+        task = ProxmoxTaskService.track(
+            db, upid,
+            cluster_name=vps_server.cluster_name,
+            node_name=vps_server.node_name,
+            vps_id=vps_server.id,
+            payload={"success_status": final_status, "failure_status": vps_server.status},
+            commit=False
+        )
+        vps_server.status = pending_status if task else final_status
+        db.commit()
+    
+    @staticmethod
+    def _filter_cluster(query, cluster_name: str):
+        """按集群筛选VPS"""
+        return query.filter(VPSServer.cluster_name == cluster_name)
+    
+    @staticmethod
+    def _build_vm_params(
+        vps_server: VPSServer,
+        allocations: List[Tuple[Optional[IPAllocation], Optional[IPPool]]],
+        dns_servers: str
+    ) -> Dict[str, Any]:
+        """根据VPS记录和分配到的地址构建Proxmox VM创建参数"""
+        # 准备网络配置
+        net_config = {
+            "ipconfig": VPSManagerService._build_ipconfig(allocations),
+            "nameserver": dns_servers.split(",")[0]
+        }
+        
+        vm_params = {
+            "vmid": vps_server.vmid,
+            "name": vps_server.name,
+            "cores": vps_server.cpu_cores,
+            "memory": vps_server.memory,
+            "storage": "local-lvm",  # 这里应该根据实际情况配置存储
+            "net0": f"virtio,bridge=vmbr0",
+            "ipconfig0": net_config['ipconfig'],
+            "nameserver": net_config['nameserver'],
+            "ostype": "l26" if vps_server.os_type == "linux" else "win10"
+        }
+        
+        if vps_server.os_type == "linux":
+            # 对于Linux系统，使用克隆或模板
+            if "ubuntu" in vps_server.os_template or "debian" in vps_server.os_template:
+                vm_params["clone"] = f"template-{vps_server.os_template}"
+            else:
+                vm_params["template"] = f"template-{vps_server.os_template}"
+        else:
+            # 对于Windows系统，通常使用ISO安装
+            vm_params["ide2"] = f"local:iso/windows-{vps_server.os_template}.iso,media=cdrom"
+            vm_params["boot"] = "d"
+        
+        return vm_params
+    
+    @staticmethod
+    def _build_ipconfig(allocations: List[Tuple[Optional[IPAllocation], Optional[IPPool]]]) -> str:
+        """根据分配到的IPv4/IPv6地址生成Proxmox cloud-init的ipconfig参数"""
+        parts = []
+        for ip_allocation, ip_pool in allocations:
+            if not ip_allocation or not ip_pool:
+                continue
+            prefix = VPSManagerService._convert_subnet_mask_to_cidr(ip_pool.subnet_mask)
+            if ip_pool.ip_version == 6:
+                parts.append(f"ip6={ip_allocation.ip_address}/{prefix}")
+                if ip_pool.gateway:
+                    parts.append(f"gw6={ip_pool.gateway}")
+            else:
+                parts.append(f"ip={ip_allocation.ip_address}/{prefix}")
+                parts.append(f"gw={ip_pool.gateway}")
+        return ",".join(parts)
     
     @staticmethod
     def _convert_subnet_mask_to_cidr(subnet_mask: str) -> int:
         """将子网掩码转换为CIDR表示法"""
+        # IPv6池直接保存前缀长度
+        if subnet_mask.isdigit():
+            return int(subnet_mask)
         mask_octets = subnet_mask.split('.')
         binary_mask = ''
         for octet in mask_octets:
@@ -0,0 +1,185 @@
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session
+
+from backend.app.core.config import settings
+from backend.app.models.vps import VPSServer
+from backend.app.services.proxmox_cluster import proxmox_clusters
+
+logger = logging.getLogger(__name__)
+
+# 新VM默认使用的存储，与 VPSManagerService._build_vm_params 一致
+DEFAULT_VM_STORAGE = "local-lvm"
+
+class PlacementPolicy(ABC):
+    """节点选择策略：在资源足够的节点中选择 score 最小的节点"""
+
+    name = ""
+
+    @abstractmethod
+    def score(self, node: Dict[str, Any], request: Dict[str, Any]) -> Tuple[float, ...]:
+        """节点的排序键，越小越优先"""
+
+    @staticmethod
+    def load(node: Dict[str, Any]) -> float:
+        """节点的综合负载：内存、CPU、存储使用率的平均值
+
+        按 1% 取整，负载相近的节点之间再比较VM数量，避免瞬时CPU的小幅波动决定放置结果。
+        """
+        memory = 1 - node["mem_free"] / node["mem_total"] if node["mem_total"] else 1
+        storage = 1 - node["storage_free"] / node["storage_total"] if node["storage_total"] else 1
+        return round((memory + node["cpu"] + storage) / 3, 2)
+
+class SpreadPolicy(PlacementPolicy):
+    """分散：优先选择负载最低、VM最少的节点"""
+
+    name = "spread"
+
+    def score(self, node: Dict[str, Any], request: Dict[str, Any]) -> Tuple[float, ...]:
+        return (self.load(node), node["vm_count"])
+
+class BinPackPolicy(PlacementPolicy):
+    """装箱：优先填满负载最高但仍能容纳的节点，空出整台节点"""
+
+    name = "binpack"
+
+    def score(self, node: Dict[str, Any], request: Dict[str, Any]) -> Tuple[float, ...]:
+        return (-self.load(node), -node["vm_count"])
+
+class AntiAffinityPolicy(PlacementPolicy):
+    """用户反亲和：优先选择该用户VM最少的节点，同一用户的VM分散到不同节点，其次按负载分散"""
+
+    name = "anti_affinity"
+
+    def score(self, node: Dict[str, Any], request: Dict[str, Any]) -> Tuple[float, ...]:
+        return (node["user_vm_count"], self.load(node), node["vm_count"])
+
+class PlacementEngine:
+    """新VPS的节点调度
+
+    节点负载来自缓存的 get_nodes / get_node_status / get_storage_list（各节点并发获取），
+    VM数量、同一用户的VM数和尚未开机（creating）的VM内存来自数据库。
+    排除离线节点、内存不足（保留 PVE_PLACEMENT_MEMORY_HEADROOM 比例）或存储空间不足的节点后，
+    由策略对剩余节点排序。一次放置多台时，每放置一台就在内存中扣减该节点的资源。
+    """
+
+    def __init__(self):
+        self._policies: Dict[str, PlacementPolicy] = {}
+        for policy in (SpreadPolicy(), BinPackPolicy(), AntiAffinityPolicy()):
+            self.register(policy)
+
+    def register(self, policy: PlacementPolicy) -> None:
+        """注册（或替换）一个节点选择策略"""
+        self._policies[policy.name] = policy
+
+    def policy(self, name: Optional[str] = None) -> PlacementPolicy:
+        """按名称获取策略，为空时使用 PVE_PLACEMENT_POLICY"""
+        name = name or settings.PVE_PLACEMENT_POLICY
+        if name not in self._policies:
+            raise Exception(f"未知的调度策略: {name}，可选: {', '.join(self._policies)}")
+        return self._policies[name]
+
+    def policies(self) -> List[str]:
+        return list(self._policies)
+
+    def place(
+        self,
+        db: Session,
+        cluster_name: str,
+        cpu_cores: int,
+        memory: int,
+        disk_size: int,
+        user_id: Optional[int] = None,
+        count: int = 1,
+        policy: Optional[str] = None,
+        storage: str = DEFAULT_VM_STORAGE
+    ) -> List[str]:
+        """为 count 台相同规格的VPS选择节点，返回每台的节点名称；资源不足时抛出异常"""
+        placement_policy = self.policy(policy)
+        nodes = self.node_loads(db, cluster_name, user_id, storage)
+        request = {"cpu_cores": cpu_cores, "memory": memory, "disk_size": disk_size, "user_id": user_id}
+        memory_bytes = memory * 1024 ** 2
+        disk_bytes = disk_size * 1024 ** 3
+
+        placements = []
+        for _ in range(count):
+            candidates = [
+                node for node in nodes
+                if node["mem_free"] - memory_bytes >= node["mem_total"] * settings.PVE_PLACEMENT_MEMORY_HEADROOM
+                and node["storage_free"] >= disk_bytes
+            ]
+            if not candidates:
+                raise Exception(
+                    f"集群 {cluster_name} 中没有资源足够的节点（已放置 {len(placements)}/{count} 台）"
+                )
+            best = min(candidates, key=lambda node: (placement_policy.score(node, request), node["node"]))
+            best["mem_free"] -= memory_bytes
+            best["storage_free"] -= disk_bytes
+            best["vm_count"] += 1
+            best["user_vm_count"] += 1
+            placements.append(best["node"])
+        return placements
+
+    def node_loads(
+        self,
+        db: Session,
+        cluster_name: str,
+        user_id: Optional[int] = None,
+        storage: str = DEFAULT_VM_STORAGE
+    ) -> List[Dict[str, Any]]:
+        """集群中各在线节点的资源和VM数量"""
+        proxmox = proxmox_clusters.get(cluster_name)
+        names = [node["node"] for node in proxmox.get_nodes() if node.get("status", "online") == "online"]
+        if not names:
+            raise Exception(f"集群 {cluster_name} 中没有在线的节点")
+
+        def load_node(name: str) -> Optional[Dict[str, Any]]:
+            try:
+                status = proxmox.get_node_status(name)
+                volume = next((item for item in proxmox.get_storage_list(name) if item.get("storage") == storage), None)
+            except Exception as e:
+                logger.warning(f"获取节点 {name} 的负载失败，本次不调度到该节点: {str(e)}")
+                return None
+            if not volume or not volume.get("active", 1):
+                return None
+            memory = status.get("memory") or {}
+            return {
+                "node": name,
+                "cpu": float(status.get("cpu") or 0),
+                "mem_total": memory.get("total") or 0,
+                "mem_free": memory.get("free", (memory.get("total") or 0) - (memory.get("used") or 0)),
+                "storage_total": volume.get("total") or 0,
+                "storage_free": volume.get("avail") or 0,
+                "vm_count": 0,
+                "user_vm_count": 0
+            }
+
+        with ThreadPoolExecutor(max_workers=min(settings.PVE_FANOUT_WORKERS, len(names))) as executor:
+            nodes = [node for node in executor.map(load_node, names) if node]
+        if not nodes:
+            raise Exception(f"集群 {cluster_name} 中没有可调度的节点（需要存储 {storage}）")
+
+        # vps_manager 导入了本模块，这里延迟导入
+        from backend.app.services.vps_manager import VPSManagerService
+
+        # 一次分组查询：VM总数、该用户的VM数、尚未开机因而不计入节点内存的VM内存
+        query = VPSManagerService._filter_cluster(db.query(
+            VPSServer.node_name,
+            func.count(VPSServer.id),
+            func.sum(case((VPSServer.user_id == user_id, 1), else_=0)),
+            func.sum(case((VPSServer.status == "creating", VPSServer.memory), else_=0))
+        ), cluster_name)
+        by_node = {node["node"]: node for node in nodes}
+        for node_name, vm_count, user_vm_count, creating_memory in query.group_by(VPSServer.node_name):
+            node = by_node.get(node_name)
+            if node:
+                node["vm_count"] = vm_count
+                node["user_vm_count"] = user_vm_count or 0
+                node["mem_free"] -= (creating_memory or 0) * 1024 ** 2
+        return nodes
+
+placement_engine = PlacementEngine()
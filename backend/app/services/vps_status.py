@@ -0,0 +1,76 @@
+import logging
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from backend.app.core.config import settings
+from backend.app.core.database import SessionLocal
+from backend.app.services.vps_manager import VPSManagerService
+
+logger = logging.getLogger(__name__)
+
+class VPSStatusReconciler:
+    """定期用集群快照同步VPS状态的后台线程
+
+    每隔 VPS_STATUS_SYNC_INTERVAL 秒调用一次 VPSManagerService.update_vps_status，
+    每次同步使用自己的数据库会话，不依赖请求的会话。手动触发的同步与定时同步共用一把锁，
+    已有同步在进行时直接跳过，不会重复请求Proxmox。
+    """
+
+    def __init__(self):
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._running = threading.Lock()
+        self.last_summary: Optional[Dict[str, Any]] = None
+
+    def start(self) -> None:
+        """启动定时同步线程，VPS_STATUS_SYNC_INTERVAL 不大于 0 时不启动"""
+        if settings.VPS_STATUS_SYNC_INTERVAL <= 0:
+            logger.info("未启用VPS状态定时同步")
+            return
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="vps-status-reconciler", daemon=True)
+        self._thread.start()
+        logger.info("VPS状态同步线程已启动")
+
+    def stop(self, timeout: float = 5) -> None:
+        """停止定时同步线程"""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run_once(self) -> Optional[Dict[str, Any]]:
+        """立即同步一次，返回同步结果；已有同步在进行时返回 None"""
+        if not self._running.acquire(blocking=False):
+            logger.info("VPS状态同步正在进行，跳过本次同步")
+            return None
+        db = SessionLocal()
+        try:
+            start = time.monotonic()
+            summary = VPSManagerService.update_vps_status(db)
+            summary["elapsed"] = round(time.monotonic() - start, 3)
+            self.last_summary = summary
+            logger.info(
+                f"VPS状态同步完成: 核对 {summary['checked']} 台，更新 {summary['updated']} 台，"
+                f"耗时 {summary['elapsed']} 秒"
+            )
+            return summary
+        except Exception as e:
+            db.rollback()
+            logger.error(f"VPS状态同步失败: {str(e)}")
+            return None
+        finally:
+            db.close()
+            self._running.release()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self.run_once()
+            self._wake.wait(settings.VPS_STATUS_SYNC_INTERVAL)
+
+vps_status_reconciler = VPSStatusReconciler()
@@ -0,0 +1,91 @@
+import argparse
+import ipaddress
+import logging
+import sys
+import os
+import time
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.models.base import Base
+from backend.app.models.ip import IPPool, IPAllocation
+from backend.app.services.ip_manager import IPManagerService, BULK_CHUNK_SIZE
+
+# 配置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+PREFIXES = [24, 20, 16]
+
+def orm_loop(db, net: ipaddress.IPv4Network) -> int:
+    """旧实现：逐个 db.add，最后一次性提交"""
+    ip_pool = IPPool(name=f"orm-{net}", network=str(net), gateway=str(net.network_address + 1),
+                     subnet_mask=str(net.netmask), dns_servers="8.8.8.8")
+    db.add(ip_pool)
+    db.commit()
+    count = 0
+    for ip in list(net.hosts()):
+        db.add(IPAllocation(ip_address=str(ip), ip_pool_id=ip_pool.id, status="available"))
+        count += 1
+    db.commit()
+    return count
+
+def chunked_insert(db, net: ipaddress.IPv4Network, chunk_size: int = BULK_CHUNK_SIZE) -> int:
+    """分批 executemany 插入，逐批提交"""
+    ip_pool = IPPool(name=f"bulk-{net}", network=str(net), gateway=str(net.network_address + 1),
+                     subnet_mask=str(net.netmask), dns_servers="8.8.8.8")
+    db.add(ip_pool)
+    db.commit()
+    rows = (
+        {"ip_address": str(ip), "ip_version": 4, "ip_value": int(ip), "ip_pool_id": ip_pool.id, "status": "available"}
+        for ip in net.hosts()
+    )
+    return IPManagerService._bulk_insert(db, IPAllocation.__table__, rows, chunk_size=chunk_size, commit=True)
+
+def range_encoded(db, net: ipaddress.IPv4Network) -> int:
+    """区间存储：只写入空闲区间"""
+    IPManagerService.create_ip_pool(
+        db,
+        name=f"range-{net}",
+        network=str(net.network_address),
+        gateway=str(net.network_address + 1),
+        subnet_mask=str(net.netmask),
+        dns_servers="8.8.8.8"
+    )
+    return net.num_addresses - 2
+
+def run(database_url: str, base_network: str) -> None:
+    engine = create_engine(database_url)
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    strategies = [("ORM逐行", orm_loop), ("分批插入", chunked_insert), ("区间存储", range_encoded)]
+    
+    print(f"{'网段':<8}{'方式':<10}{'地址数':>10}{'耗时(s)':>10}{'行/秒':>14}")
+    for prefix in PREFIXES:
+        net = ipaddress.IPv4Network(f"{base_network}/{prefix}", strict=False)
+        for label, strategy in strategies:
+            Base.metadata.drop_all(bind=engine)
+            Base.metadata.create_all(bind=engine)
+            db = Session()
+            try:
+                start = time.perf_counter()
+                count = strategy(db, net)
+                elapsed = time.perf_counter() - start
+            finally:
+                db.close()
+            print(f"/{prefix:<7}{label:<10}{count:>10}{elapsed:>10.3f}{count / elapsed:>14,.0f}")
+    
+    Base.metadata.drop_all(bind=engine)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IP池写入性能基准测试")
+    parser.add_argument("--database-url", default="sqlite://", help="数据库连接串，默认使用内存SQLite")
+    parser.add_argument("--network", default="10.0.0.0", help="测试使用的网络地址")
+    args = parser.parse_args()
+    run(args.database_url, args.network)
@@ -0,0 +1,189 @@
+import argparse
+import logging
+import sys
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.models.base import Base
+from backend.app.models.user import User
+from backend.app.models.vps import VPSServer
+from backend.app.models.proxmox_task import ProxmoxTask
+from backend.app.services.ip_manager import IPManagerService
+from backend.app.services.proxmox_cluster import proxmox_clusters
+from backend.app.services.proxmox_simulator import PVESimulator
+from backend.app.services.proxmox_task import proxmox_task_tracker
+from backend.app.services.vps_manager import VPSManagerService
+
+# 配置日志
+logging.basicConfig(
+    level=logging.WARNING,
+    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+)
+logger = logging.getLogger(__name__)
+
+def seed_vps(db, simulator: PVESimulator, count: int) -> None:
+    """按模拟器中的虚拟机写入VPS记录，状态设为 unknown，第一次同步会更新所有行"""
+    rows = []
+    for vm in simulator.vm_list()[:count]:
+        rows.append({
+            "name": vm["name"], "vmid": vm["vmid"], "cluster_name": proxmox_clusters.default_name,
+            "node_name": vm["node"], "user_id": 1, "status": "unknown",
+            "cpu_cores": vm["cores"], "memory": vm["maxmem"] // 1024 ** 2, "disk_size": 32, "bandwidth": 1000,
+            "os_type": "linux", "os_template": "ubuntu-22.04", "config": {}
+        })
+    db.execute(VPSServer.__table__.insert(), rows)
+    db.commit()
+
+def cold_start() -> None:
+    """清空读缓存并断开连接，下一次调用要重新连接，所有读取都回源到Proxmox"""
+    proxmox = proxmox_clusters.get()
+    proxmox.cache.clear()
+    proxmox.reset()
+
+def bench_status_sync(Session, simulator: PVESimulator, count: int) -> None:
+    db = Session()
+    try:
+        seed_vps(db, simulator, count)
+        # 冷启动与无变化的数据库写入相同，差值即建立连接和缓存未命中的开销
+        for label, cold in (("全部变化", False), ("无变化", False), ("冷启动", True)):
+            if cold:
+                cold_start()
+            requests_before = simulator.stats()["requests"]
+            start = time.perf_counter()
+            VPSManagerService.update_vps_status(db)
+            elapsed = time.perf_counter() - start
+            requests = simulator.stats()["requests"] - requests_before
+            print(f"{'状态同步':<10}{label:<10}{count:>10}{elapsed:>10.3f}{count / elapsed:>14,.0f}{requests:>10}")
+    finally:
+        db.close()
+
+def bench_provision(Session, simulator: PVESimulator, count: int, workers: int) -> None:
+    db = Session()
+    try:
+        ip_pool = IPManagerService.create_ip_pool(
+            db, name="bench", network="10.0.0.0", gateway="10.0.0.1", subnet_mask="255.255.0.0", dns_servers="8.8.8.8"
+        )
+        ip_pool_id = ip_pool.id
+    finally:
+        db.close()
+
+    nodes = [node["node"] for node in proxmox_clusters.get().get_nodes()]
+
+    def create(index: int) -> str:
+        session = Session()
+        try:
+            VPSManagerService.create_vps(
+                session, user_id=1, name=f"bench-{index}", node_name=nodes[index % len(nodes)],
+                cpu_cores=1, memory=1024, disk_size=10, os_type="linux", os_template="ubuntu-22.04",
+                ip_pool_id=ip_pool_id
+            )
+            return "ok"
+        except Exception as e:
+            return str(e).split(":")[0]
+        finally:
+            session.close()
+
+    # 重操作的节点名额在任务结束时才释放，提交期间就要同时轮询任务
+    submitting = threading.Event()
+    submitting.set()
+
+    def track() -> None:
+        session = Session()
+        try:
+            while submitting.is_set() or session.query(ProxmoxTask).filter(ProxmoxTask.status == "running").count():
+                time.sleep(min(proxmox_task_tracker.poll_once(session), 0.5))
+        finally:
+            session.close()
+
+    tracker = threading.Thread(target=track, daemon=True)
+    # 上面取节点列表时已填充缓存，计时前恢复到进程刚启动时的状态
+    cold_start()
+    requests_before = simulator.stats()["requests"]
+    start = time.perf_counter()
+    tracker.start()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = Counter(executor.map(create, range(count)))
+    submitted = time.perf_counter() - start
+    submitting.clear()
+    print(f"{'创建提交':<10}{f'{workers}线程':<10}{count:>10}{submitted:>10.3f}{count / submitted:>14,.0f}{'':>10}")
+
+    # 等待创建和随后的开机任务全部结束
+    tracker.join()
+    elapsed = time.perf_counter() - start
+    requests = simulator.stats()["requests"] - requests_before
+    print(f"{'创建完成':<10}{'':<10}{count:>10}{elapsed:>10.3f}{count / elapsed:>14,.0f}{requests:>10}")
+
+    db = Session()
+    try:
+        statuses = Counter(status for (status,) in db.query(VPSServer.status).filter(VPSServer.name.like("bench-%")))
+    finally:
+        db.close()
+    print(f"提交结果: {dict(results)}")
+    print(f"VPS状态: {dict(statuses)}")
+
+def run(args) -> None:
+    simulator = PVESimulator(
+        nodes=args.nodes,
+        vms=args.vms,
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        task_failure_rate=args.task_failure_rate,
+        time_scale=args.time_scale,
+        seed=42
+    )
+    simulator.attach(proxmox_clusters.get(), proxmox_clusters.get_async())
+
+    database_url = args.database_url
+    database_file = None
+    if not database_url:
+        # 多线程创建需要共享同一个数据库，内存SQLite每个连接各是一个库
+        fd, database_file = tempfile.mkstemp(suffix=".db")
+        os.close(fd)
+        database_url = f"sqlite:///{database_file}"
+    engine = create_engine(database_url, connect_args={"timeout": 30} if database_url.startswith("sqlite") else {})
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    db = Session()
+    db.add(User(id=1, username="bench", email="bench@example.com", hashed_password="-"))
+    db.commit()
+    db.close()
+
+    print(f"模拟集群: {args.nodes} 个节点, {args.vms} 台虚拟机, 请求延迟 {args.latency * 1000:.0f}ms")
+    print(f"{'场景':<10}{'说明':<10}{'VPS数':>10}{'耗时(s)':>10}{'VPS/秒':>14}{'API请求':>10}")
+    try:
+        bench_status_sync(Session, simulator, min(args.vms, args.sync_count))
+        if args.provision:
+            bench_provision(Session, simulator, args.provision, args.workers)
+    finally:
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
+        if database_file:
+            os.remove(database_file)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="使用进程内Proxmox模拟器测试状态同步和VPS创建的性能")
+    parser.add_argument("--database-url", default="", help="数据库连接串，默认使用临时SQLite文件")
+    parser.add_argument("--nodes", type=int, default=4, help="模拟节点数")
+    parser.add_argument("--vms", type=int, default=10000, help="模拟集群中已有的虚拟机数")
+    parser.add_argument("--sync-count", type=int, default=10000, help="参与状态同步的VPS记录数")
+    parser.add_argument("--provision", type=int, default=100, help="创建的VPS数量，0 表示跳过")
+    parser.add_argument("--workers", type=int, default=1, help="并发创建的线程数")
+    parser.add_argument("--latency", type=float, default=0.005, help="每个API请求的延迟（秒）")
+    parser.add_argument("--jitter", type=float, default=0.005, help="每个API请求的随机附加延迟（秒）")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="API请求随机返回503的概率")
+    parser.add_argument("--task-failure-rate", type=float, default=0.0, help="任务失败的概率")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="任务执行时间的缩放系数")
+    run(parser.parse_args())
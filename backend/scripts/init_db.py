@@ -8,6 +8,7 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 from sqlalchemy.orm import Session
 
 from backend.app.core.database import engine, get_db
+from backend.app.core.migrations import upgrade_schema
 from backend.app.models.base import Base
 from backend.app.models.user import User
 from backend.app.models.ip import IPPool, IPAllocation
@@ -33,6 +34,18 @@ def init_db():
     # 创建表格
     Base.metadata.create_all(bind=engine)
     logger.info("数据库表创建完成")
+    
+    # 升级已有表的结构（新增的列、索引和约束）
+    upgrade_schema(engine)
+    logger.info("数据库表结构升级完成")
+    
+    # 补齐旧数据的整数地址列
+    db = next(get_db())
+    try:
+        updated = IPManagerService.backfill_ip_values(db)
+        logger.info(f"已补齐 {updated} 条记录的整数地址")
+    finally:
+        db.close()
 
 def create_initial_data(db: Session):
     """创建初始数据"""
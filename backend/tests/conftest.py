@@ -0,0 +1,46 @@
+import os
+import sys
+
+# 添加项目根目录到Python路径
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../..')))
+
+import pytest
+from sqlalchemy import create_engine
+
+import backend.app.models  # noqa: F401  注册所有模型
+from backend.app.core.database import SessionLocal
+from backend.app.core.migrations import upgrade_schema
+from backend.app.models.base import Base
+from backend.app.models.user import User
+
+@pytest.fixture
+def engine(tmp_path):
+    """每个测试使用独立的数据库
+
+    默认是临时目录下的 SQLite 文件（多个线程可以共享）；设置 TEST_DATABASE_URL
+    （例如一个空的 PostgreSQL 库）时改用该数据库，SKIP LOCKED / FOR UPDATE 才会真正生效。
+    SessionLocal 在测试期间绑定到该数据库，服务内部自己打开的会话也使用它。
+    """
+    url = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{tmp_path / 'test.db'}"
+    connect_args = {"timeout": 30, "check_same_thread": False} if url.startswith("sqlite") else {}
+    engine = create_engine(url, connect_args=connect_args)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    SessionLocal.configure(bind=engine)
+    yield engine
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+@pytest.fixture
+def db(engine):
+    session = SessionLocal()
+    yield session
+    session.close()
+
+@pytest.fixture
+def user(db):
+    user = User(username="tester", email="tester@example.com", hashed_password="-")
+    db.add(user)
+    db.commit()
+    return user
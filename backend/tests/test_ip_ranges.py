@@ -0,0 +1,228 @@
+import ipaddress
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.app.core.database import SessionLocal
+from backend.app.models.ip import IPAllocation, IPFreeRange, IPPoolCounter
+from backend.app.services.ip_allocator import IPAllocator
+from backend.app.services.ip_bulk import IPBulkService
+from backend.app.services.ip_manager import COUNTER_SHARDS, IPManagerService
+
+def ip_int(address: str) -> int:
+    return int(ipaddress.ip_address(address))
+
+def free_ranges(db, ip_pool_id: int):
+    return [
+        (IPManagerService._int_to_ip(start), IPManagerService._int_to_ip(end))
+        for start, end in db.query(IPFreeRange.range_start, IPFreeRange.range_end)
+        .filter(IPFreeRange.ip_pool_id == ip_pool_id)
+        .order_by(IPFreeRange.range_start)
+    ]
+
+@pytest.fixture
+def pool(db):
+    # 10.0.0.0/28：主机地址 .1-.14，.1 为网关
+    return IPManagerService.create_ip_pool(
+        db, name="test", network="10.0.0.0", gateway="10.0.0.1",
+        subnet_mask="255.255.255.240", dns_servers="8.8.8.8"
+    )
+
+def test_create_pool_stores_one_range_without_address_rows(db, pool):
+    assert free_ranges(db, pool.id) == [("10.0.0.2", "10.0.0.14")]
+    assert db.query(IPAllocation).count() == 0
+    stats = IPManagerService.get_ip_usage_statistics(db, pool.id)
+    assert (stats["total"], stats["available"], stats["allocated"]) == (13, 13, 0)
+
+def test_claim_next_takes_lowest_free_address(db, pool):
+    first = IPManagerService.claim_next_ip(db, ip_pool_id=pool.id)
+    second = IPManagerService.claim_next_ip(db, ip_pool_id=pool.id, status="reserved")
+    assert (first.ip_address, first.status) == ("10.0.0.2", "allocated")
+    assert (second.ip_address, second.status) == ("10.0.0.3", "reserved")
+    assert free_ranges(db, pool.id) == [("10.0.0.4", "10.0.0.14")]
+    stats = IPManagerService.get_ip_usage_statistics(db, pool.id)
+    assert (stats["available"], stats["allocated"], stats["reserved"]) == (11, 1, 1)
+
+def test_allocate_specific_address_splits_range_and_release_merges_it_back(db, pool):
+    IPManagerService.allocate_ip(db, "10.0.0.8", hostname="web")
+    assert free_ranges(db, pool.id) == [("10.0.0.2", "10.0.0.7"), ("10.0.0.9", "10.0.0.14")]
+    with pytest.raises(Exception):
+        IPManagerService.allocate_ip(db, "10.0.0.8")
+    db.rollback()
+
+    IPManagerService.release_ip(db, "10.0.0.8")
+    assert free_ranges(db, pool.id) == [("10.0.0.2", "10.0.0.14")]
+    assert db.query(IPAllocation).count() == 0
+    assert IPManagerService.get_ip_usage_statistics(db, pool.id)["available"] == 13
+
+def test_gateway_and_addresses_outside_pool_cannot_be_allocated(db, pool):
+    for address in ("10.0.0.1", "10.0.0.15", "10.0.1.2"):
+        with pytest.raises(Exception):
+            IPManagerService.allocate_ip(db, address)
+        db.rollback()
+
+def test_exhausted_pool_returns_none(db, pool):
+    claimed = [IPManagerService.claim_next_ip(db, ip_pool_id=pool.id).ip_address for _ in range(13)]
+    assert len(set(claimed)) == 13
+    assert IPManagerService.claim_next_ip(db, ip_pool_id=pool.id) is None
+    assert free_ranges(db, pool.id) == []
+
+    IPManagerService.release_ip(db, "10.0.0.5")
+    assert free_ranges(db, pool.id) == [("10.0.0.5", "10.0.0.5")]
+    assert IPManagerService.claim_next_ip(db, ip_pool_id=pool.id).ip_address == "10.0.0.5"
+
+def test_rebuild_converts_legacy_rows_without_losing_free_addresses(db, pool):
+    # 模拟旧版布局：每个空闲地址一条 available 记录，另有一个已分配地址
+    db.query(IPFreeRange).filter(IPFreeRange.ip_pool_id == pool.id).delete()
+    for value in range(ip_int("10.0.0.2"), ip_int("10.0.0.14") + 1):
+        address = IPManagerService._int_to_ip(value)
+        db.add(IPAllocation(
+            ip_address=address, ip_pool_id=pool.id,
+            status="allocated" if address == "10.0.0.6" else "available"
+        ))
+    db.commit()
+
+    def free_addresses():
+        legacy = {
+            address for (address,) in db.query(IPAllocation.ip_address)
+            .filter(IPAllocation.ip_pool_id == pool.id, IPAllocation.status == "available")
+        }
+        ranged = {
+            IPManagerService._int_to_ip(value)
+            for start, end in db.query(IPFreeRange.range_start, IPFreeRange.range_end)
+            .filter(IPFreeRange.ip_pool_id == pool.id)
+            for value in range(start, end + 1)
+        }
+        assert not legacy & ranged
+        return legacy | ranged
+
+    expected = free_addresses()
+    snapshots = []
+    range_count = IPManagerService.rebuild_free_ranges(
+        db, pool.id, chunk_size=3, progress=lambda processed, total: snapshots.append(free_addresses())
+    )
+
+    # 每一批提交后，空闲地址既不丢失也不重复
+    assert len(snapshots) == 5
+    assert all(snapshot == expected for snapshot in snapshots)
+    assert range_count == 2
+    assert free_ranges(db, pool.id) == [("10.0.0.2", "10.0.0.5"), ("10.0.0.7", "10.0.0.14")]
+    stats = IPManagerService.get_ip_usage_statistics(db, pool.id)
+    assert (stats["available"], stats["allocated"]) == (12, 1)
+
+def test_concurrent_claims_never_hand_out_the_same_address(db, engine):
+    ip_pool = IPManagerService.create_ip_pool(
+        db, name="wide", network="10.1.0.0", gateway="10.1.0.1",
+        subnet_mask="255.255.255.0", dns_servers="8.8.8.8"
+    )
+
+    def worker(_):
+        session = SessionLocal()
+        try:
+            return [IPManagerService.claim_next_ip(session, ip_pool_id=ip_pool.id).ip_address for _ in range(20)]
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        claimed = [address for addresses in executor.map(worker, range(6)) for address in addresses]
+
+    assert len(claimed) == len(set(claimed)) == 120
+    db.expire_all()
+    stats = IPManagerService.get_ip_usage_statistics(db, ip_pool.id)
+    assert (stats["available"], stats["allocated"]) == (253 - 120, 120)
+    assert free_ranges(db, ip_pool.id) == [("10.1.0.122", "10.1.0.254")]
+
+def test_counters_are_spread_over_shards_and_rebuild_matches(db, pool):
+    assert db.query(IPPoolCounter).filter(IPPoolCounter.ip_pool_id == pool.id).count() == COUNTER_SHARDS
+    for _ in range(6):
+        IPManagerService.claim_next_ip(db, ip_pool_id=pool.id)
+    IPManagerService.reserve_ip(db, "10.0.0.12")
+    IPManagerService.release_ip(db, "10.0.0.3")
+    before = IPManagerService.get_ip_usage_statistics(db, pool.id)
+    assert (before["total"], before["available"], before["allocated"], before["reserved"]) == (13, 7, 5, 1)
+
+    IPManagerService.rebuild_ip_usage_counters(db, pool.id)
+    assert IPManagerService.get_ip_usage_statistics(db, pool.id) == before
+
+def test_allocation_does_not_touch_the_pool_row(db, pool):
+    version = pool.free_version
+    IPManagerService.claim_next_ip(db, ip_pool_id=pool.id)
+    IPManagerService.allocate_ip(db, "10.0.0.9")
+    IPManagerService.reserve_ip(db, "10.0.0.10")
+    db.refresh(pool)
+    assert pool.free_version == version
+
+    # 释放会增加空闲地址，需要通知各进程的分配缓存
+    IPManagerService.release_ip(db, "10.0.0.9")
+    db.refresh(pool)
+    assert pool.free_version == version + 1
+
+def test_ipv6_address_spellings_map_to_one_allocation(db):
+    IPManagerService.create_ip_pool(
+        db, name="v6", network="2001:db8::", gateway="2001:db8::1", subnet_mask="64", dns_servers="2001:4860:4860::8888"
+    )
+    ip_allocation = IPManagerService.allocate_ip(db, "2001:DB8::10")
+    assert ip_allocation.ip_address == "2001:db8::10"
+
+    for spelling in ("2001:db8::10", "2001:0db8:0000:0000:0000:0000:0000:0010"):
+        with pytest.raises(Exception):
+            IPManagerService.allocate_ip(db, spelling)
+        db.rollback()
+    assert IPManagerService.get_ip_allocation_by_ip(db, "2001:0DB8::0010").id == ip_allocation.id
+
+    IPManagerService.release_ip(db, "2001:db8:0::10")
+    assert db.query(IPAllocation).count() == 0
+
+def test_bulk_claim_and_release_span_several_pools(db, pool):
+    other = IPManagerService.create_ip_pool(
+        db, name="other", network="10.0.0.32", gateway="10.0.0.33",
+        subnet_mask="255.255.255.240", dns_servers="8.8.8.8"
+    )
+    results = IPBulkService.bulk_claim(db, ["10.0.0.5", "10.0.0.9", "10.0.0.40", "10.0.0.20"])
+    assert [item["success"] for item in results] == [True, True, True, False]
+    assert free_ranges(db, pool.id) == [("10.0.0.2", "10.0.0.4"), ("10.0.0.6", "10.0.0.8"), ("10.0.0.10", "10.0.0.14")]
+    assert free_ranges(db, other.id) == [("10.0.0.34", "10.0.0.39"), ("10.0.0.41", "10.0.0.46")]
+
+    # 只锁定包含请求地址的区间，其他区间不受影响
+    locked = IPBulkService._lock_ranges(db, pool.id, [(ip_int("10.0.0.3"), ip_int("10.0.0.3"))])
+    assert [(item.range_start, item.range_end) for item in locked] == [(ip_int("10.0.0.2"), ip_int("10.0.0.4"))]
+    db.rollback()
+
+    IPBulkService.bulk_release(db, ["10.0.0.5", "10.0.0.40"])
+    assert free_ranges(db, pool.id) == [("10.0.0.2", "10.0.0.8"), ("10.0.0.10", "10.0.0.14")]
+    assert free_ranges(db, other.id) == [("10.0.0.34", "10.0.0.46")]
+
+def test_loading_one_pool_does_not_block_allocations_from_another(db, pool, monkeypatch):
+    other = IPManagerService.create_ip_pool(
+        db, name="other", network="10.2.0.0", gateway="10.2.0.1",
+        subnet_mask="255.255.255.240", dns_servers="8.8.8.8"
+    )
+    allocator = IPAllocator()
+    load_pool = IPAllocator._load_pool
+    loading, resume = threading.Event(), threading.Event()
+
+    def slow_load(db, ip_pool_id, version):
+        if ip_pool_id == pool.id:
+            loading.set()
+            resume.wait(5)
+        return load_pool(db, ip_pool_id, version)
+
+    monkeypatch.setattr(IPAllocator, "_load_pool", staticmethod(slow_load))
+
+    def allocate(ip_pool_id):
+        session = SessionLocal()
+        try:
+            return allocator.allocate(session, ip_pool_id).ip_address
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        slow = executor.submit(allocate, pool.id)
+        assert loading.wait(5)
+        # 第一个IP池仍在加载，第二个IP池照常分配
+        try:
+            assert executor.submit(allocate, other.id).result(2) == "10.2.0.2"
+        finally:
+            resume.set()
+        assert slow.result(5) == "10.0.0.2"
@@ -0,0 +1,127 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from backend.app.core.migrations import upgrade_schema
+from backend.app.models.base import Base
+from backend.app.models.vps import VPSServer
+from backend.app.services.ip_manager import IPManagerService
+from backend.app.services.proxmox_cluster import proxmox_clusters
+
+# 本系列修改之前的表结构（只包含被修改过的表）
+BASELINE_SCHEMA = [
+    """CREATE TABLE users (
+        id {serial} PRIMARY KEY, username VARCHAR UNIQUE, email VARCHAR UNIQUE, hashed_password VARCHAR,
+        first_name VARCHAR, last_name VARCHAR, role VARCHAR, is_active BOOLEAN, is_superuser BOOLEAN,
+        created_at TIMESTAMP, updated_at TIMESTAMP
+    )""",
+    """CREATE TABLE ip_pools (
+        id {serial} PRIMARY KEY, name VARCHAR, network VARCHAR, gateway VARCHAR, subnet_mask VARCHAR,
+        dns_servers VARCHAR, vlan_id INTEGER, notes TEXT, is_active BOOLEAN,
+        created_at TIMESTAMP, updated_at TIMESTAMP
+    )""",
+    "CREATE UNIQUE INDEX ix_ip_pools_name ON ip_pools (name)",
+    """CREATE TABLE ip_allocations (
+        id {serial} PRIMARY KEY, ip_address VARCHAR, ip_pool_id INTEGER REFERENCES ip_pools (id),
+        user_id INTEGER REFERENCES users (id), status VARCHAR, hostname VARCHAR, mac_address VARCHAR,
+        notes TEXT, created_at TIMESTAMP, updated_at TIMESTAMP
+    )""",
+    "CREATE UNIQUE INDEX ix_ip_allocations_ip_address ON ip_allocations (ip_address)",
+    """CREATE TABLE vps_servers (
+        id {serial} PRIMARY KEY, name VARCHAR, vmid INTEGER, node_name VARCHAR,
+        user_id INTEGER REFERENCES users (id), status VARCHAR, cpu_cores INTEGER, memory INTEGER,
+        disk_size INTEGER, bandwidth INTEGER, os_type VARCHAR, os_template VARCHAR,
+        ip_allocation_id INTEGER REFERENCES ip_allocations (id), notes TEXT, config JSON,
+        created_at TIMESTAMP, updated_at TIMESTAMP, last_backup_at TIMESTAMP
+    )""",
+    "CREATE UNIQUE INDEX ix_vps_servers_vmid ON vps_servers (vmid)",
+    """CREATE TABLE vps_backups (
+        id {serial} PRIMARY KEY, vps_id INTEGER REFERENCES vps_servers (id), backup_id VARCHAR UNIQUE,
+        file_name VARCHAR, file_size FLOAT, notes TEXT, is_auto BOOLEAN, created_at TIMESTAMP
+    )""",
+]
+
+@pytest.fixture
+def legacy_engine(tmp_path):
+    """按旧表结构建库并写入几行旧数据，再执行 create_all 和 upgrade_schema"""
+    url = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{tmp_path / 'legacy.db'}"
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    serial = "SERIAL" if engine.dialect.name == "postgresql" else "INTEGER"
+    with engine.begin() as conn:
+        for statement in BASELINE_SCHEMA:
+            conn.execute(text(statement.format(serial=serial)))
+        conn.execute(text(
+            "INSERT INTO ip_pools (id, name, network, gateway, subnet_mask, dns_servers) "
+            "VALUES (1, 'old', '10.9.0.0/24', '10.9.0.1', '255.255.255.0', '8.8.8.8')"
+        ))
+        conn.execute(text("INSERT INTO users (id, username, email, hashed_password) VALUES (1, 'u', 'u@x', '-')"))
+        conn.execute(text(
+            "INSERT INTO ip_allocations (id, ip_address, ip_pool_id, status) VALUES (1, '10.9.0.7', 1, 'allocated')"
+        ))
+        conn.execute(text(
+            "INSERT INTO vps_servers (id, name, vmid, node_name, user_id, status, ip_allocation_id) "
+            "VALUES (1, 'old-vm', 101, 'pve1', 1, 'running', 1)"
+        ))
+        conn.execute(text("INSERT INTO vps_backups (id, vps_id, backup_id, file_name) VALUES (1, 1, 'b1', 'f1')"))
+
+    Base.metadata.create_all(engine)
+    upgrade_schema(engine)
+    # 重复执行不做任何修改
+    upgrade_schema(engine)
+    yield engine
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+def columns(engine, table_name):
+    return {column["name"]: column for column in inspect(engine).get_columns(table_name)}
+
+def test_ip_pools_gains_free_version(legacy_engine):
+    assert not columns(legacy_engine, "ip_pools")["free_version"]["nullable"]
+    with legacy_engine.connect() as conn:
+        assert conn.execute(text("SELECT free_version FROM ip_pools")).scalar() == 0
+
+def test_ipv6_columns_are_added_with_defaults(legacy_engine):
+    assert {"ip_version", "allocation_mode", "next_cursor"} <= set(columns(legacy_engine, "ip_pools"))
+    assert "ip6_allocation_id" in columns(legacy_engine, "vps_servers")
+    with legacy_engine.connect() as conn:
+        row = conn.execute(text("SELECT ip_version, allocation_mode, next_cursor FROM ip_pools")).one()
+    assert tuple(row) == (4, "sequential", None)
+
+def test_integer_ip_columns_are_added_and_backfilled(legacy_engine):
+    index_names = {index["name"] for index in inspect(legacy_engine).get_indexes("ip_allocations")}
+    assert "ix_ip_allocations_version_value" in index_names
+    assert "ix_ip_allocations_pool_status" in index_names
+    with Session(bind=legacy_engine) as db:
+        assert IPManagerService.backfill_ip_values(db) == 2
+        assert IPManagerService.get_ip_pool_by_ip(db, "10.9.0.200").name == "old"
+        found = IPManagerService.get_ip_allocations(db, cidr="10.9.0.0/29")
+        assert [ip_allocation.ip_address for ip_allocation in found] == ["10.9.0.7"]
+
+def test_vps_cluster_name_is_backfilled_and_vmid_unique_per_cluster(legacy_engine):
+    assert not columns(legacy_engine, "vps_servers")["cluster_name"]["nullable"]
+    indexes = {index["name"]: index for index in inspect(legacy_engine).get_indexes("vps_servers")}
+    assert not indexes["ix_vps_servers_vmid"]["unique"]
+    assert indexes["uq_vps_servers_cluster_vmid"]["unique"]
+
+    insert = "INSERT INTO vps_servers (name, vmid, cluster_name, node_name, user_id) VALUES ('vm', 101, '{}', 'pve1', 1)"
+    with legacy_engine.begin() as conn:
+        assert conn.execute(text("SELECT cluster_name FROM vps_servers")).scalar() == proxmox_clusters.default_name
+        conn.execute(text(insert.format("other")))
+    with pytest.raises(IntegrityError):
+        with legacy_engine.begin() as conn:
+            conn.execute(text(insert.format(proxmox_clusters.default_name)))
+
+def test_backup_status_defaults_to_success(legacy_engine):
+    with legacy_engine.connect() as conn:
+        assert conn.execute(text("SELECT status FROM vps_backups")).scalar() == "success"
+
+def test_every_model_can_be_queried_after_upgrade(legacy_engine):
+    with Session(bind=legacy_engine) as db:
+        for mapper in Base.registry.mappers:
+            db.query(mapper.class_).all()
+        vps_server = db.query(VPSServer).one()
+        assert (vps_server.backups[0].status, vps_server.ip_allocation.ip_address) == ("success", "10.9.0.7")
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.models.proxmox_task import ProxmoxTask
+from backend.app.services.proxmox_async import AsyncProxmoxService
+from backend.app.services.proxmox_breaker import CircuitBreaker, ProxmoxBreakers
+from backend.app.services.proxmox_cluster import proxmox_clusters
+from backend.app.services.proxmox_errors import ProxmoxCircuitOpenError, ProxmoxUnavailableError
+from backend.app.services.proxmox_task import ProxmoxTaskService, proxmox_task_tracker
+
+UPID = "UPID:pve1:0000A1B2:0001C3D4:65000000:qmstart:101:root@pam:"
+
+def test_tracker_is_woken_only_after_the_task_is_committed(db):
+    proxmox_task_tracker._wake.clear()
+    task = ProxmoxTaskService.track(db, UPID, cluster_name="default", commit=False)
+    assert task.status == "running"
+    assert not proxmox_task_tracker._wake.is_set()
+    db.commit()
+    assert proxmox_task_tracker._wake.is_set()
+
+    proxmox_task_tracker._wake.clear()
+    ProxmoxTaskService.track(db, UPID.replace("101", "102"), commit=False)
+    db.rollback()
+    db.commit()
+    assert not proxmox_task_tracker._wake.is_set()
+    assert db.query(ProxmoxTask).count() == 1
+
+@pytest.fixture
+def scheduler():
+    scheduler = proxmox_clusters.get().scheduler
+    yield scheduler
+    for upid in scheduler.held_upids():
+        scheduler.task_finished(upid)
+
+def test_heavy_lease_is_held_until_the_task_finishes(scheduler):
+    upids = [
+        UPID.replace("qmstart:101", f"qmcreate:{vmid}")
+        for vmid in range(201, 201 + settings.PVE_NODE_HEAVY_CONCURRENCY)
+    ]
+    for upid in upids:
+        scheduler.hold(scheduler.acquire("lease-node", "heavy"), upid)
+    with pytest.raises(ProxmoxUnavailableError):
+        scheduler.acquire("lease-node", "heavy", timeout=0.05)
+
+    scheduler.task_finished(upids[0])
+    scheduler.acquire("lease-node", "heavy", timeout=0.05).release()
+
+def test_leases_of_tasks_finished_by_another_process_are_swept(db, scheduler):
+    upid = UPID.replace("qmstart:101", "qmcreate:301")
+    scheduler.hold(scheduler.acquire("sweep-node", "heavy"), upid)
+    task = ProxmoxTaskService.track(db, upid, cluster_name=proxmox_clusters.default_name)
+    assert proxmox_task_tracker.release_finished_leases(db) == 0
+
+    # 其他进程的跟踪线程完成了任务，本进程的调度器没有收到通知
+    task.status = "success"
+    db.commit()
+    assert proxmox_task_tracker.release_finished_leases(db) == 1
+    assert upid not in scheduler.held_upids()
+
+def test_waiting_heavy_requests_are_served_by_priority(scheduler):
+    leases = [scheduler.acquire("priority-node", "heavy") for _ in range(settings.PVE_NODE_HEAVY_CONCURRENCY)]
+    order = []
+
+    def wait(lane: str) -> None:
+        scheduler.acquire("priority-node", "heavy", priority=lane, timeout=5).release()
+        order.append(lane)
+
+    threads = []
+    for lane in ("bulk", "normal", "interactive"):
+        threads.append(threading.Thread(target=wait, args=(lane,)))
+        threads[-1].start()
+        time.sleep(0.05)
+    # 放出一个名额，依次转交给排队的请求
+    leases[0].release()
+    for thread in threads:
+        thread.join(5)
+    assert order == ["interactive", "normal", "bulk"]
+    for lease in leases[1:]:
+        lease.release()
+
+def test_async_power_requests_wait_for_a_light_slot_in_the_interactive_lane(scheduler):
+    order = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        order.append(request.url.path)
+        return httpx.Response(200, json={"data": UPID})
+
+    proxmox = AsyncProxmoxService(
+        host="pve.test",
+        token_name="test",
+        token_value="secret",
+        transport=httpx.MockTransport(handler),
+        scheduler=scheduler
+    )
+    leases = [scheduler.acquire("async-node") for _ in range(settings.PVE_NODE_LIGHT_CONCURRENCY)]
+
+    def wait_bulk() -> None:
+        scheduler.acquire("async-node", priority="bulk", timeout=5).release()
+        order.append("bulk")
+
+    async def start() -> None:
+        waiter = threading.Thread(target=wait_bulk)
+        waiter.start()
+        time.sleep(0.05)
+        request = asyncio.ensure_future(proxmox.start_vm("async-node", 101))
+        await asyncio.sleep(0.1)
+        assert order == []
+        # 放出一个名额，开机请求排在先等待的 bulk 请求前面
+        leases[0].release()
+        assert await request == UPID
+        waiter.join(5)
+        await proxmox.aclose()
+
+    asyncio.run(start())
+    assert order == ["/api2/json/nodes/async-node/qemu/101/status/start", "bulk"]
+    for lease in leases[1:]:
+        lease.release()
+
+def test_open_node_breaker_does_not_use_up_the_cluster_probe():
+    breakers = ProxmoxBreakers("breaker-test")
+    breakers.cluster = CircuitBreaker("breaker-test", failure_threshold=1, reset_timeout=0.05)
+    node = breakers.node("pve1")
+    node.failure_threshold, node.reset_timeout = 1, 60
+    breakers.cluster.record_failure()
+    node.record_failure()
+    time.sleep(0.06)
+
+    # 集群熔断器已半开，节点熔断器仍打开：被节点拒绝的请求不占用集群的探测名额
+    with pytest.raises(ProxmoxCircuitOpenError):
+        breakers.acquire("pve1")
+    breakers.acquire("pve2")
+    breakers.record("pve2")
+    assert breakers.cluster.status()["state"] == "closed"
@@ -0,0 +1,117 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.core.database import SessionLocal
+from backend.app.models.vmid import VMIDFreeRange
+from backend.app.services.proxmox_cluster import proxmox_clusters
+from backend.app.services.proxmox_task import ProxmoxTaskService
+from backend.app.services.vmid_allocator import VMIDAllocatorService
+from backend.app.services.vps_manager import VPSManagerService
+
+UPID = "UPID:pve1:0000A1B2:0001C3D4:65000000:qmdestroy:{vmid}:root@pam:"
+
+class FakeCluster:
+    """Proxmox上已有VMID 100 和 105 的虚拟机"""
+
+    def get_vm_inventory(self):
+        return {100: {"status": "running"}, 105: {"status": "stopped"}}
+
+@pytest.fixture
+def cluster(monkeypatch):
+    monkeypatch.setattr(settings, "PVE_VMID_MIN", 100)
+    monkeypatch.setattr(settings, "PVE_VMID_MAX", 199)
+    monkeypatch.setattr(proxmox_clusters, "get", lambda name=None: FakeCluster())
+    return proxmox_clusters.default_name
+
+def free_ranges(db, cluster_name):
+    return [
+        tuple(row) for row in db.query(VMIDFreeRange.range_start, VMIDFreeRange.range_end)
+        .filter(VMIDFreeRange.cluster_name == cluster_name)
+        .order_by(VMIDFreeRange.range_start)
+    ]
+
+def test_claim_skips_vmids_used_in_proxmox_and_release_merges(db, cluster):
+    assert VMIDAllocatorService.claim(db, cluster, 5) == [101, 102, 103, 104, 106]
+    db.commit()
+    assert free_ranges(db, cluster) == [(107, 199)]
+
+    VMIDAllocatorService.release(db, cluster, [104, 106])
+    db.commit()
+    assert free_ranges(db, cluster) == [(104, 104), (106, 199)]
+
+def test_rolled_back_claim_returns_the_vmids(db, cluster):
+    VMIDAllocatorService.claim(db, cluster, 3)
+    db.rollback()
+    assert VMIDAllocatorService.claim(db, cluster, 1) == [101]
+
+def test_exhausted_cluster_is_not_seeded_again(db, cluster):
+    assert len(VMIDAllocatorService.claim(db, cluster, 98)) == 98
+    db.commit()
+    with pytest.raises(Exception):
+        VMIDAllocatorService.claim(db, cluster, 1)
+    db.rollback()
+
+    VMIDAllocatorService.release(db, cluster, [150])
+    db.commit()
+    assert VMIDAllocatorService.claim(db, cluster, 1) == [150]
+
+def test_concurrent_first_claims_seed_once_and_never_share_a_vmid(db, cluster):
+    def claim(_) -> list:
+        session = SessionLocal()
+        try:
+            vmids = VMIDAllocatorService.claim(session, cluster, 4)
+            session.commit()
+            return vmids
+        finally:
+            session.close()
+
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(claim, range(12)))
+
+    vmids = sorted(vmid for result in results for vmid in result)
+    assert len(vmids) == len(set(vmids)) == 48
+    assert not {100, 105} & set(vmids)
+    # 只初始化了一次：剩余区间没有重叠，与已分配的VMID合起来正好是整个范围
+    ranges = free_ranges(db, cluster)
+    assert all(previous[1] < current[0] for previous, current in zip(ranges, ranges[1:]))
+    free = {vmid for range_start, range_end in ranges for vmid in range(range_start, range_end + 1)}
+    assert free | set(vmids) | {100, 105} == set(range(100, 200))
+
+def test_deleted_vm_returns_its_vmid_only_when_destroy_succeeds(db, cluster):
+    VMIDAllocatorService.claim(db, cluster, 2)
+    db.commit()
+    for vmid, exitstatus in ((101, "command failed"), (102, "OK")):
+        task = ProxmoxTaskService.track(
+            db, UPID.format(vmid=vmid), cluster_name=cluster, payload={"release_vmid": vmid}
+        )
+        ProxmoxTaskService.finish(db, task, exitstatus)
+    assert free_ranges(db, cluster) == [(102, 104), (106, 199)]
+
+def test_status_sync_keeps_vmids_released_after_its_snapshot(db, cluster, monkeypatch):
+    VMIDAllocatorService.claim(db, cluster, 1)
+    db.commit()
+    task = ProxmoxTaskService.track(
+        db, UPID.format(vmid=101), cluster_name=cluster, payload={"release_vmid": 101}
+    )
+    snapshot = {100: {"status": "running"}, 101: {"status": "running"}, 105: {"status": "stopped"}}
+
+    def fan_out(call):
+        # 清单中还有VM 101，但删除任务在状态同步剔除之前结束并归还了VMID
+        session = SessionLocal()
+        try:
+            ProxmoxTaskService.finish(session, session.merge(task), "OK")
+        finally:
+            session.close()
+        return {cluster: snapshot}
+
+    monkeypatch.setattr(proxmox_clusters, "fan_out", fan_out)
+    VPSManagerService.update_vps_status(db)
+    db.expire_all()
+    assert free_ranges(db, cluster) == [(101, 104), (106, 199)]
+
+    # 之后的同步仍会剔除清单中被其他途径占用的VMID
+    monkeypatch.setattr(proxmox_clusters, "fan_out", lambda call: {cluster: snapshot})
+    VPSManagerService.update_vps_status(db)
+    assert free_ranges(db, cluster) == [(102, 104), (106, 199)]
@@ -0,0 +1,61 @@
+import pytest
+
+from backend.app.models.vps import VPSServer
+from backend.app.services.proxmox_cluster import proxmox_clusters
+from backend.app.services.vps_placement import PlacementPolicy, placement_engine
+
+GB = 1024 ** 3
+
+class FakeCluster:
+    """三个节点：pve1 负载低，pve2 负载高，pve3 内存几乎用完"""
+
+    nodes = {
+        "pve1": {"cpu": 0.1, "memory": {"total": 64 * GB, "free": 56 * GB}},
+        "pve2": {"cpu": 0.6, "memory": {"total": 64 * GB, "free": 24 * GB}},
+        "pve3": {"cpu": 0.2, "memory": {"total": 64 * GB, "free": 4 * GB}}
+    }
+
+    def get_nodes(self):
+        return [{"node": name, "status": "online"} for name in self.nodes]
+
+    def get_node_status(self, node):
+        return self.nodes[node]
+
+    def get_storage_list(self, node):
+        return [{"storage": "local-lvm", "active": 1, "total": 1000 * GB, "avail": 500 * GB}]
+
+@pytest.fixture
+def cluster(monkeypatch):
+    monkeypatch.setattr(proxmox_clusters, "get", lambda name=None: FakeCluster())
+    return proxmox_clusters.default_name
+
+def test_policies_rank_nodes_and_skip_full_ones(db, cluster):
+    assert placement_engine.place(db, cluster, 2, 8192, 20, policy="spread") == ["pve1"]
+    assert placement_engine.place(db, cluster, 2, 8192, 20, policy="binpack") == ["pve2"]
+    # pve3 空闲内存不足（保留 PVE_PLACEMENT_MEMORY_HEADROOM），不会被选中
+    placements = placement_engine.place(db, cluster, 2, 8192, 20, count=6, policy="binpack")
+    assert "pve3" not in placements
+    with pytest.raises(Exception):
+        placement_engine.place(db, cluster, 2, 64 * 1024, 20)
+
+def test_anti_affinity_spreads_one_users_vms(db, user, cluster):
+    db.add_all([
+        VPSServer(
+            name=f"vm-{vmid}", vmid=vmid, cluster_name=cluster, node_name="pve1", user_id=user.id, status="running"
+        )
+        for vmid in (101, 102)
+    ])
+    db.commit()
+    assert placement_engine.place(db, cluster, 1, 1024, 10, user_id=user.id, policy="anti_affinity") == ["pve2"]
+    assert placement_engine.place(db, cluster, 1, 1024, 10, user_id=user.id, count=2, policy="anti_affinity") == [
+        "pve2", "pve2"
+    ]
+
+def test_policy_must_implement_score():
+    class Incomplete(PlacementPolicy):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+    with pytest.raises(Exception):
+        placement_engine.policy("unknown")
@@ -0,0 +1,50 @@
+from datetime import datetime
+
+import pytest
+
+from backend.app.models.vps import VPSServer
+from backend.app.services.proxmox_cluster import proxmox_clusters
+from backend.app.services.vps_manager import VPSManagerService
+
+@pytest.fixture
+def vps_servers(db, user):
+    vps_servers = [
+        VPSServer(
+            name=f"vm-{vmid}", vmid=vmid, cluster_name=proxmox_clusters.default_name, node_name="pve1",
+            user_id=user.id, status="stopped"
+        )
+        for vmid in (101, 102, 103)
+    ]
+    db.add_all(vps_servers)
+    db.commit()
+    return vps_servers
+
+def test_status_sync_writes_only_changed_rows(db, vps_servers, monkeypatch):
+    inventory = {
+        101: {"status": "running", "node": "pve1"},
+        102: {"status": "stopped", "node": "pve2"},
+        103: {"status": "stopped", "node": "pve1"}
+    }
+    monkeypatch.setattr(proxmox_clusters, "fan_out", lambda call: {proxmox_clusters.default_name: inventory})
+    summary = VPSManagerService.update_vps_status(db)
+    assert (summary["checked"], summary["updated"], summary["missing"]) == (3, 2, 0)
+
+    db.expire_all()
+    assert [(vps.status, vps.node_name) for vps in vps_servers] == [
+        ("running", "pve1"), ("stopped", "pve2"), ("stopped", "pve1")
+    ]
+
+def test_status_sync_does_not_overwrite_rows_changed_after_the_snapshot(db, vps_servers):
+    vps_server = vps_servers[0]
+    # 读取快照之后，开关机操作把状态改成了 starting
+    vps_server.status = "starting"
+    db.commit()
+
+    result = db.execute(VPSManagerService._STATUS_SYNC_UPDATE, [{
+        "vps_id": vps_server.id, "old_status": "stopped", "old_node": "pve1",
+        "new_status": "stopped", "new_node": "pve1", "now": datetime.utcnow()
+    }])
+    db.commit()
+    assert result.rowcount == 0
+    db.refresh(vps_server)
+    assert vps_server.status == "starting"
@@ -16,7 +16,7 @@ export default (request) => ({
     })
   },
   
-  // 创建VPS
+  // 提交创建VPS的后台任务，返回任务记录（202），完成后 result.vps_id 为新VPS的ID
   createVPS(data) {
     return request({
       url: '/vps',
@@ -25,6 +25,23 @@ export default (request) => ({
     })
   },
   
+  // 提交批量创建VPS的后台任务，返回任务记录（202），result.items 为逐台的创建结果
+  createVPSBatch(data) {
+    return request({
+      url: '/vps/batch',
+      method: 'post',
+      data
+    })
+  },
+  
+  // 查询后台任务进度
+  getJob(id) {
+    return request({
+      url: `/jobs/${id}`,
+      method: 'get'
+    })
+  },
+  
   // 更新VPS
   updateVPS(id, data) {
     return request({